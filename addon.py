@@ -0,0 +1,710 @@
+from typing import Optional, List
+import pathlib
+import bpy
+from bpy.props import (
+    StringProperty,
+    BoolProperty,
+    FloatProperty,
+    EnumProperty,
+    IntProperty,
+)
+from bpy_extras.io_utils import (
+    ImportHelper,
+    ExportHelper,
+    orientation_helper,
+    axis_conversion,
+)
+from bpy.types import (
+    Operator,
+)
+
+
+from . import serialization
+from . import vertex
+from . import quantize
+from . import process
+from . import cache
+from . import merge
+from . import importer
+from . import animation
+from . import pose
+from . import profiling
+
+# the report of the last profiled export, for LBSM_PT_export_profile
+last_profile: List[str] = []
+
+
+@orientation_helper(axis_forward="Z", axis_up="Y")
+class ImportLBSM(Operator, ImportHelper):
+    bl_idname = "import_mesh.lbsm"
+    bl_label = "Import lbsm"
+    bl_description = """Load LinearBlendSkinningModel data"""
+    bl_options = {"UNDO"}
+
+    filename_ext = ".lbsm"
+    filter_glob: StringProperty(default="*.lbsm", options={"HIDDEN"})
+
+    global_scale: FloatProperty(
+        name="Scale",
+        min=0.01,
+        max=1000.0,
+        default=1.0,
+    )
+
+    def execute(self, context):
+        from mathutils import Matrix
+
+        # the inverse of the export matrix
+        global_matrix = (
+            Matrix.Scale(1 / self.global_scale, 4)
+            @ axis_conversion(
+                from_forward=self.axis_forward,
+                from_up=self.axis_up,
+            ).to_4x4()
+        )
+
+        if context.object and context.object.mode != "OBJECT":
+            bpy.ops.object.mode_set(mode="OBJECT")
+        objects = importer.import_lbsm(pathlib.Path(self.filepath), global_matrix)
+        for ob in context.view_layer.objects:
+            ob.select_set(ob in objects)
+
+        return {"FINISHED"}
+
+
+@orientation_helper(axis_forward="Z", axis_up="Y")
+class ExportLBSM(Operator, ExportHelper):
+    bl_idname = "export_mesh.lbsm"
+    bl_label = "Export lbsm"
+    bl_description = """Save LinearBlendSkinningModel data"""
+
+    filename_ext = ".lbsm"
+    filter_glob: StringProperty(default="*.lbsm", options={"HIDDEN"})
+
+    use_selection: BoolProperty(
+        name="Selection Only",
+        description="Export selected objects only",
+        default=False,
+    )
+    global_scale: FloatProperty(
+        name="Scale",
+        min=0.01,
+        max=1000.0,
+        default=1.0,
+    )
+    use_scene_unit: BoolProperty(
+        name="Scene Unit",
+        description="Apply current scene's unit (as defined by unit scale) to exported data",
+        default=False,
+    )
+    use_mesh_modifiers: BoolProperty(
+        name="Apply Modifiers",
+        description="Apply the modifiers before saving",
+        default=True,
+    )
+    use_instancing: BoolProperty(
+        name="Instancing",
+        description="Export the meshes shared by objects once, with a transform per object",
+        default=False,
+    )
+    use_merge: BoolProperty(
+        name="Merge Meshes",
+        description="Merge the meshes that share the skeleton into one mesh with a submesh for each material. Not with Instancing",
+        default=False,
+    )
+    use_weld: BoolProperty(
+        name="Weld Vertices",
+        description="Merge the vertices that have the same position, normal, uv and skin weights",
+        default=False,
+    )
+    use_optimize_indices: BoolProperty(
+        name="Optimize Indices",
+        description="Reorder the triangles and vertices for the GPU vertex cache and overdraw. The simulated cache misses are in the profile report",
+        default=True,
+    )
+    use_split_u16: BoolProperty(
+        name="Split 16bit",
+        description="Split meshes over 65535 vertices into submeshes with 16bit indices instead of using 32bit indices",
+        default=False,
+    )
+    influences: EnumProperty(
+        name="Influences",
+        description="Joints per vertex. The heaviest are kept and renormalized",
+        items=(
+            ("4", "4", "4 joints per vertex"),
+            ("8", "8", "8 joints per vertex"),
+        ),
+        default="4",
+    )
+    weight_threshold: FloatProperty(
+        name="Weight Threshold",
+        description="Drop the joints lighter than this ratio of the vertex weight",
+        min=0.0,
+        max=0.5,
+        default=0.0,
+    )
+    tangents: EnumProperty(
+        name="Tangents",
+        items=(
+            ("NONE", "None", "Zero tangents"),
+            (
+                "COMPUTE",
+                "Compute",
+                "Compute from the positions, normals and the first uv",
+            ),
+            ("BLENDER", "Blender", "Mesh.calc_tangents. Tris and quads only"),
+        ),
+        default="COMPUTE",
+    )
+    validate_tangents: BoolProperty(
+        name="Validate Tangents",
+        description="Print the difference of the computed tangents from Mesh.calc_tangents",
+        default=False,
+    )
+    use_morphs: BoolProperty(
+        name="Shape Keys",
+        description="Export the shape keys as sparse morph targets",
+        default=True,
+    )
+    morph_epsilon: FloatProperty(
+        name="Morph Epsilon",
+        description="The vertices that a shape key moves less than this are not stored",
+        min=0.0,
+        default=1e-5,
+        precision=6,
+    )
+    palette_size: IntProperty(
+        name="Joint Palette",
+        description="Split skinned meshes into submeshes that use at most this many joints. At least 3 x Influences. 0 is no limit",
+        min=0,
+        default=0,
+    )
+    lod_levels: IntProperty(
+        name="LOD Levels",
+        description="Coarser index buffers of the same vertices by quadric simplification. 0 is none",
+        min=0,
+        max=8,
+        default=0,
+    )
+    lod_ratio: FloatProperty(
+        name="LOD Ratio",
+        description="The triangles of a LOD level relative to the previous level",
+        min=0.05,
+        max=0.95,
+        default=0.5,
+    )
+    lod_max_error: FloatProperty(
+        name="LOD Max Error",
+        description="No coarser LOD level over this distance from the surface, relative to the mesh radius",
+        min=0.0,
+        default=0.01,
+        precision=4,
+    )
+    vertex_format: EnumProperty(
+        name="Vertex Format",
+        items=(
+            ("FLOAT", "Float", "32bit float attributes"),
+            (
+                "HALF",
+                "Half",
+                "f16 position and uv, octahedral snorm16 normal and tangent, unorm8 color and weights",
+            ),
+            (
+                "QUANTIZED",
+                "Quantized",
+                "unorm16 position and uv with decode transform, octahedral snorm16 normal and tangent, unorm8 color and weights",
+            ),
+        ),
+        default="FLOAT",
+    )
+    vertex_layout: EnumProperty(
+        name="Vertex Layout",
+        items=(
+            ("SPLIT", "Split", "geometry, color and uv, and skin streams"),
+            (
+                "INTERLEAVED",
+                "Interleaved",
+                "One stream of all attributes, for a single vertex buffer upload",
+            ),
+        ),
+        default="SPLIT",
+    )
+    alignment: EnumProperty(
+        name="Alignment",
+        description="Align the chunks and the buffer views, so that a loader can upload or map them in place",
+        items=(
+            ("1", "None", "Packed"),
+            ("16", "16", "16 bytes"),
+            ("64", "64", "64 bytes. cache line"),
+            ("4096", "4096", "4096 bytes. page, for mmap"),
+        ),
+        default="1",
+    )
+    compression: EnumProperty(
+        name="Compression",
+        description="Compress each bufferView with a byte shuffle or delta filter",
+        items=(
+            ("NONE", "None", "BIN chunk"),
+            ("ZLIB", "zlib", "BINZ chunk"),
+            ("LZMA", "lzma", "BINZ chunk. smaller and slower"),
+        ),
+        default="NONE",
+    )
+    use_progressive: BoolProperty(
+        name="Progressive",
+        description="TOC first and the coarse LODs before the finer ones, so that a loader can draw a partially downloaded file",
+        default=False,
+    )
+
+    use_animation: BoolProperty(
+        name="Animation",
+        description="Bake the actions of the armatures into keyframe tracks",
+        default=False,
+    )
+    animation_tolerance: FloatProperty(
+        name="Animation Tolerance",
+        description="Remove the keys that the interpolation reproduces within this distance, radian and scale",
+        min=0.0,
+        default=0.001,
+    )
+
+    use_cache: BoolProperty(
+        name="Cache",
+        description="Reuse the meshes of the unchanged objects from the previous exports",
+        default=False,
+    )
+    cache_size: IntProperty(
+        name="Cache Size (MB)",
+        description="The least recently used meshes are removed over this size",
+        min=1,
+        default=1024,
+    )
+    use_threads: BoolProperty(
+        name="Threads",
+        description="Convert the meshes on a thread for each CPU while the next objects are read",
+        default=True,
+    )
+
+    use_profile: BoolProperty(
+        name="Profile",
+        description="Record the time and the bytes of each export phase for each object, and print the report",
+        default=False,
+    )
+    profile_allocations: BoolProperty(
+        name="Trace Allocations",
+        description="Record the peak allocations of each phase with tracemalloc. Slower",
+        default=False,
+    )
+    embed_profile: BoolProperty(
+        name="Embed Profile",
+        description="Write the report to the asset JSON",
+        default=False,
+    )
+    profile_trace: StringProperty(
+        name="Chrome Trace",
+        description="Write the phases to this chrome://tracing JSON. Empty is none",
+        subtype="FILE_PATH",
+        default="",
+    )
+
+    def execute(self, context):
+        import contextlib
+
+        profiler = None
+        if self.use_profile:
+            profiler = profiling.Profiler(trace_allocations=self.profile_allocations)
+        with profiler or contextlib.nullcontext():
+            result = self.export(context, profiler)
+        if profiler:
+            last_profile[:] = profiling.format_report(profiler.report(), objects=True)
+            print("\n".join(last_profile))
+            self.report({"INFO"}, f"lbsm: {last_profile[0]}")
+            if self.profile_trace:
+                path = pathlib.Path(bpy.path.abspath(self.profile_trace))
+                profiling.write_chrome_trace(path, [(self.filepath, profiler.phases)])
+        return result
+
+    def export(self, context, profiler: Optional[profiling.Profiler]):
+        import os
+        from mathutils import Matrix
+
+        keywords = self.as_keywords(
+            ignore=(
+                "axis_forward",
+                "axis_up",
+                "use_selection",
+                "global_scale",
+                "check_existing",
+                "filter_glob",
+                "use_scene_unit",
+                "use_mesh_modifiers",
+                "use_instancing",
+                "use_merge",
+                "use_weld",
+                "use_optimize_indices",
+                "use_split_u16",
+                "palette_size",
+                "lod_levels",
+                "lod_ratio",
+                "lod_max_error",
+                "influences",
+                "weight_threshold",
+                "tangents",
+                "validate_tangents",
+                "use_morphs",
+                "morph_epsilon",
+                "use_animation",
+                "animation_tolerance",
+                "use_cache",
+                "cache_size",
+                "use_threads",
+                "vertex_format",
+                "vertex_layout",
+                "alignment",
+                "compression",
+                "use_progressive",
+                "use_profile",
+                "profile_allocations",
+                "embed_profile",
+                "profile_trace",
+                "batch_mode",
+                "global_space",
+            ),
+        )
+
+        scene = context.scene
+        if self.use_selection:
+            data_seq = context.selected_objects
+        else:
+            data_seq = scene.objects
+
+        # Take into account scene's unit scale, so that 1 inch in Blender gives 1 inch elsewhere! See T42000.
+        global_scale = self.global_scale
+        if scene.unit_settings.system != "NONE" and self.use_scene_unit:
+            global_scale *= scene.unit_settings.scale_length
+
+        global_matrix = axis_conversion(
+            to_forward=self.axis_forward,
+            to_up=self.axis_up,
+        ).to_4x4() @ Matrix.Scale(global_scale, 4)
+
+        # the instances refer to the mesh index
+        use_merge = self.use_merge and not self.use_instancing
+        options = process.ProcessOptions(
+            influences=int(self.influences),
+            weight_threshold=self.weight_threshold,
+            tangents=self.tangents.lower(),
+            validate_tangents=self.validate_tangents,
+            use_morphs=self.use_morphs,
+            morph_epsilon=self.morph_epsilon,
+            use_weld=self.use_weld,
+            use_optimize_indices=self.use_optimize_indices,
+            # after the merge
+            use_split_u16=self.use_split_u16 and not use_merge,
+            palette_size=0 if use_merge else self.palette_size,
+            lod_levels=0 if use_merge else self.lod_levels,
+            lod_ratio=self.lod_ratio,
+            lod_max_error=self.lod_max_error,
+        )
+        try:
+            options._replace(palette_size=self.palette_size).validate()
+        except ValueError as e:
+            self.report({"ERROR"}, str(e))
+            return {"CANCELLED"}
+        animations = None
+        if self.use_animation:
+            # before the meshes. the frame is restored
+            armatures = {
+                ob for ob in data_seq if isinstance(ob.data, bpy.types.Armature)
+            }
+            armatures.update(filter(None, (vertex.get_armature(ob) for ob in data_seq)))
+            tolerance = animation.Tolerance(
+                self.animation_tolerance,
+                self.animation_tolerance,
+                self.animation_tolerance,
+            )
+            with profiling.phase(profiler, "animation", ""):
+                animations = [
+                    animation.bake(clip, tolerance)
+                    for clip in pose.sample_armatures(
+                        sorted(armatures, key=lambda ob: ob.name), global_matrix
+                    )
+                ]
+
+        mesh_cache = None
+        if self.use_cache:
+            mesh_cache = cache.MeshCache(max_bytes=self.cache_size << 20)
+
+        workers = (os.cpu_count() or 1) if self.use_threads else 0
+
+        instances = None
+        if self.use_instancing:
+            instances = []
+            meshes = vertex.iter_instances(
+                data_seq,
+                global_matrix,
+                instances,
+                use_mesh_modifiers=self.use_mesh_modifiers,
+                options=options,
+                cache=mesh_cache,
+                profiler=profiler,
+                workers=workers,
+            )
+        else:
+            meshes = vertex.iter_objects(
+                data_seq,
+                global_matrix,
+                use_mesh_modifiers=self.use_mesh_modifiers,
+                options=options,
+                cache=mesh_cache,
+                profiler=profiler,
+                workers=workers,
+            )
+        if use_merge:
+            # the phases of the objects are in merge
+            with profiling.phase(profiler, "merge", ""):
+                meshes, stats = merge.merge_meshes(meshes)
+            print(stats)
+            split_options = options._replace(
+                use_split_u16=self.use_split_u16,
+                palette_size=self.palette_size,
+                lod_levels=self.lod_levels,
+            )
+            with profiling.phase(profiler, "split", ""):
+                meshes = [process.split_mesh(vb, split_options) for vb in meshes]
+            if split_options.lod_levels:
+                for i, vb in enumerate(meshes):
+                    with profiling.phase(profiler, "lod", f"mesh{i}"):
+                        meshes[i] = process.lod_mesh(vb, split_options, profiler)
+        quantization = {
+            "FLOAT": None,
+            "HALF": quantize.HALF,
+            "QUANTIZED": quantize.QUANTIZED,
+        }[self.vertex_format]
+        serialization.serialize(
+            pathlib.Path(keywords["filepath"]),
+            meshes,
+            quantization=quantization,
+            compression=(
+                None if self.compression == "NONE" else self.compression.lower()
+            ),
+            instances=instances,
+            animations=animations,
+            alignment=int(self.alignment),
+            interleave=self.vertex_layout == "INTERLEAVED",
+            progressive=self.use_progressive,
+            profiler=profiler,
+            embed_profile=self.embed_profile,
+        )
+        if mesh_cache:
+            print(mesh_cache)
+
+        return {"FINISHED"}
+
+    def draw(self, context):
+        pass
+
+
+class LBSM_PT_export_main(bpy.types.Panel):
+    bl_space_type = "FILE_BROWSER"
+    bl_region_type = "TOOL_PROPS"
+    bl_label = ""
+    bl_parent_id = "FILE_PT_operator"
+    bl_options = {"HIDE_HEADER"}
+
+    @classmethod
+    def poll(cls, context):
+        sfile = context.space_data
+        operator = sfile.active_operator
+
+        return operator.bl_idname == "EXPORT_MESH_OT_lbsm"
+
+    def draw(self, context):
+        layout = self.layout
+        layout.use_property_split = True
+        layout.use_property_decorate = False  # No animation.
+
+        sfile = context.space_data
+        operator = sfile.active_operator
+
+        layout.prop(operator, "ascii")
+        layout.prop(operator, "batch_mode")
+
+
+class LBSM_PT_export_include(bpy.types.Panel):
+    bl_space_type = "FILE_BROWSER"
+    bl_region_type = "TOOL_PROPS"
+    bl_label = "Include"
+    bl_parent_id = "FILE_PT_operator"
+
+    @classmethod
+    def poll(cls, context):
+        sfile = context.space_data
+        operator = sfile.active_operator
+
+        return operator.bl_idname == "EXPORT_MESH_OT_lbsm"
+
+    def draw(self, context):
+        layout = self.layout
+        layout.use_property_split = True
+        layout.use_property_decorate = False  # No animation.
+
+        sfile = context.space_data
+        operator = sfile.active_operator
+
+        layout.prop(operator, "use_selection")
+        layout.prop(operator, "use_instancing")
+        layout.prop(operator, "use_merge")
+
+
+class LBSM_PT_export_transform(bpy.types.Panel):
+    bl_space_type = "FILE_BROWSER"
+    bl_region_type = "TOOL_PROPS"
+    bl_label = "Transform"
+    bl_parent_id = "FILE_PT_operator"
+
+    @classmethod
+    def poll(cls, context):
+        sfile = context.space_data
+        operator = sfile.active_operator
+
+        return operator.bl_idname == "EXPORT_MESH_OT_lbsm"
+
+    def draw(self, context):
+        layout = self.layout
+        layout.use_property_split = True
+        layout.use_property_decorate = False  # No animation.
+
+        sfile = context.space_data
+        operator = sfile.active_operator
+
+        layout.prop(operator, "global_scale")
+        layout.prop(operator, "use_scene_unit")
+
+        layout.prop(operator, "axis_forward")
+        layout.prop(operator, "axis_up")
+
+
+class LBSM_PT_export_geometry(bpy.types.Panel):
+    bl_space_type = "FILE_BROWSER"
+    bl_region_type = "TOOL_PROPS"
+    bl_label = "Geometry"
+    bl_parent_id = "FILE_PT_operator"
+
+    @classmethod
+    def poll(cls, context):
+        sfile = context.space_data
+        operator = sfile.active_operator
+
+        return operator.bl_idname == "EXPORT_MESH_OT_lbsm"
+
+    def draw(self, context):
+        layout = self.layout
+        layout.use_property_split = True
+        layout.use_property_decorate = False  # No animation.
+
+        sfile = context.space_data
+        operator = sfile.active_operator
+
+        layout.prop(operator, "use_mesh_modifiers")
+        layout.prop(operator, "use_weld")
+        layout.prop(operator, "use_optimize_indices")
+        layout.prop(operator, "use_split_u16")
+        layout.prop(operator, "palette_size")
+        layout.prop(operator, "lod_levels")
+        layout.prop(operator, "lod_ratio")
+        layout.prop(operator, "lod_max_error")
+        layout.prop(operator, "influences")
+        layout.prop(operator, "weight_threshold")
+        layout.prop(operator, "tangents")
+        layout.prop(operator, "validate_tangents")
+        layout.prop(operator, "use_morphs")
+        layout.prop(operator, "morph_epsilon")
+        layout.prop(operator, "vertex_format")
+        layout.prop(operator, "vertex_layout")
+        layout.prop(operator, "alignment")
+        layout.prop(operator, "compression")
+        layout.prop(operator, "use_progressive")
+        layout.prop(operator, "use_animation")
+        layout.prop(operator, "animation_tolerance")
+        layout.prop(operator, "use_cache")
+        layout.prop(operator, "cache_size")
+        layout.prop(operator, "use_threads")
+
+
+class LBSM_PT_export_profile(bpy.types.Panel):
+    bl_space_type = "FILE_BROWSER"
+    bl_region_type = "TOOL_PROPS"
+    bl_label = "Profile"
+    bl_parent_id = "FILE_PT_operator"
+    bl_options = {"DEFAULT_CLOSED"}
+
+    @classmethod
+    def poll(cls, context):
+        sfile = context.space_data
+        operator = sfile.active_operator
+
+        return operator.bl_idname == "EXPORT_MESH_OT_lbsm"
+
+    def draw_header(self, context):
+        sfile = context.space_data
+        operator = sfile.active_operator
+
+        self.layout.prop(operator, "use_profile", text="")
+
+    def draw(self, context):
+        layout = self.layout
+        layout.use_property_split = True
+        layout.use_property_decorate = False  # No animation.
+
+        sfile = context.space_data
+        operator = sfile.active_operator
+
+        layout.enabled = operator.use_profile
+        layout.prop(operator, "profile_allocations")
+        layout.prop(operator, "embed_profile")
+        layout.prop(operator, "profile_trace")
+
+        # the last export
+        column = layout.column(align=True)
+        for line in last_profile:
+            column.label(text=line)
+
+
+def menu_import(self, context):
+    self.layout.operator(ImportLBSM.bl_idname, text="Lbsm (.lbsm)")
+
+
+def menu_export(self, context):
+    self.layout.operator(ExportLBSM.bl_idname, text="Lbsm (.lbsm)")
+
+
+classes = (
+    ImportLBSM,
+    ExportLBSM,
+    LBSM_PT_export_main,
+    LBSM_PT_export_include,
+    LBSM_PT_export_geometry,
+    LBSM_PT_export_transform,
+    LBSM_PT_export_profile,
+)
+
+
+def register():
+    for cls in classes:
+        bpy.utils.register_class(cls)
+
+    bpy.types.TOPBAR_MT_file_import.append(menu_import)
+    bpy.types.TOPBAR_MT_file_export.append(menu_export)
+
+
+def unregister():
+    for cls in classes:
+        bpy.utils.unregister_class(cls)
+
+    bpy.types.TOPBAR_MT_file_import.remove(menu_import)
+    bpy.types.TOPBAR_MT_file_export.remove(menu_export)
+
+
+if __name__ == "__main__":
+    register()
@@ -0,0 +1,214 @@
+"""
+sampled bone animation => compact keyframe tracks.
+
+a clip has the world matrices of the bones (export space) for each frame.
+they are converted to the parent local translation, rotation and scale,
+and the keys that the linear interpolation of the neighbors reproduces within
+the tolerance are removed (Ramer-Douglas-Peucker).
+
+the rotation is the smallest three of the quaternion in 48 bits
+(little endian u16 x 3).
+
+    bits 0-1: the index of the dropped (largest) component
+    bits 2-16, 17-31, 32-46: the other three in the xyzw order, 15 bits unorm
+        of [-1/sqrt(2), 1/sqrt(2)]
+
+the dropped component is sqrt(1 - the others), positive.
+the times are u16 frames from the clip start.
+"""
+
+from typing import List, NamedTuple, Tuple
+import numpy as np
+from . import skeleton
+
+SMALLEST_THREE_RANGE = 1 / np.sqrt(2)
+SMALLEST_THREE_MAX = (1 << 15) - 1
+
+
+class AnimationClip(NamedTuple):
+    name: str
+    fps: float
+    bones: List[str]  # Joint.name
+    parents: List[int]  # index of bones. -1 is the root
+    matrices: np.ndarray  # (frames, bones, 4, 4) row major. export space
+
+
+class Tolerance(NamedTuple):
+    translation: float = 1e-4  # distance
+    rotation: float = 1e-3  # radian
+    scale: float = 1e-4
+
+
+class Channel(NamedTuple):
+    bone: str
+    path: str  # translation | rotation | scale
+    frames: np.ndarray  # (keys,) int
+    values: np.ndarray  # (keys, 3 or 4)
+
+
+class BakedAnimation(NamedTuple):
+    name: str
+    fps: float
+    frame_count: int
+    channels: List[Channel]
+
+
+def decompose(matrices: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    (..., 4, 4) => translation (..., 3), rotation xyzw (..., 4), scale (..., 3).
+    a mirror is the negative x scale, as skeleton.decompose.
+    """
+    shape = matrices.shape[:-2]
+    m = matrices.reshape(-1, 4, 4)
+    rotation, scale = skeleton.decompose(m[:, :3, :3])
+    return (
+        m[:, :3, 3].reshape(shape + (3,)),
+        rotation.reshape(shape + (4,)),
+        scale.reshape(shape + (3,)),
+    )
+
+
+def to_local(clip: AnimationClip) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    the parent local TRS of all frames and bones. (frames, bones, 3 or 4)
+    """
+    world = clip.matrices
+    parents = np.array(clip.parents, np.int64)
+    local = world.copy()
+    has_parent = parents >= 0
+    if has_parent.any():
+        local[:, has_parent] = (
+            np.linalg.inv(world[:, parents[has_parent]]) @ world[:, has_parent]
+        )
+    return decompose(local)
+
+
+def make_continuous(rotation: np.ndarray) -> np.ndarray:
+    """
+    q and -q are the same rotation. flip to the hemisphere of the previous frame.
+    (frames, ..., 4)
+    """
+    dot = (rotation[1:] * rotation[:-1]).sum(axis=-1)
+    sign = np.cumprod(np.where(dot < 0, -1.0, 1.0), axis=0)
+    result = rotation.copy()
+    result[1:] *= sign[..., None]
+    return result
+
+
+def _errors(values: np.ndarray, begin: int, end: int, path: str) -> np.ndarray:
+    """
+    the error of the keys between begin and end by the interpolation of the two.
+    """
+    t = np.linspace(0, 1, end - begin + 1)[1:-1, None]
+    interpolated = values[begin] * (1 - t) + values[end] * t
+    actual = values[begin + 1 : end]
+    if path == "rotation":
+        # nlerp
+        interpolated /= np.linalg.norm(interpolated, axis=1, keepdims=True)
+        dot = np.abs((interpolated * actual).sum(axis=1))
+        return 2 * np.arccos(np.clip(dot, 0, 1))
+    return np.abs(interpolated - actual).max(axis=1)
+
+
+def reduce_keys(values: np.ndarray, tolerance: float, path: str) -> np.ndarray:
+    """
+    the indices of the keys to keep. the first and the last are kept.
+    a constant track is a single key.
+    """
+    count = len(values)
+    if count == 0:
+        return np.zeros(0, np.int64)
+    if path == "rotation":
+        difference = 2 * np.arccos(
+            np.clip(np.abs((values * values[0]).sum(axis=1)), 0, 1)
+        )
+    else:
+        difference = np.abs(values - values[0]).max(axis=1)
+    if difference.max() <= tolerance:
+        return np.zeros(1, np.int64)
+
+    keep = np.zeros(count, bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, count - 1)]
+    while stack:
+        begin, end = stack.pop()
+        if end - begin < 2:
+            continue
+        errors = _errors(values, begin, end, path)
+        worst = int(np.argmax(errors))
+        if errors[worst] > tolerance:
+            middle = begin + 1 + worst
+            keep[middle] = True
+            stack.append((begin, middle))
+            stack.append((middle, end))
+    return np.flatnonzero(keep)
+
+
+def bake(clip: AnimationClip, tolerance: Tolerance = Tolerance()) -> BakedAnimation:
+    """
+    a channel for each bone and path.
+    """
+    frame_count = len(clip.matrices)
+    if frame_count > 0x10000:
+        raise ValueError(f"{clip.name}: {frame_count} frames. u16 times")
+    translation, rotation, scale = to_local(clip)
+    rotation = make_continuous(rotation)
+    channels = []
+    for path, values in (
+        ("translation", translation),
+        ("rotation", rotation),
+        ("scale", scale),
+    ):
+        for i, bone in enumerate(clip.bones):
+            track = values[:, i]
+            frames = reduce_keys(track, getattr(tolerance, path), path)
+            channels.append(Channel(bone, path, frames, track[frames]))
+    return BakedAnimation(clip.name, clip.fps, frame_count, channels)
+
+
+def encode_smallest_three(q: np.ndarray) -> np.ndarray:
+    """
+    (N, 4) xyzw => (N, 3) uint16
+    """
+    q = np.asarray(q, np.float64)
+    q = q / np.linalg.norm(q, axis=1, keepdims=True)
+    largest = np.argmax(np.abs(q), axis=1)
+    rows = np.arange(len(q))
+    q = q * np.where(q[rows, largest] < 0, -1.0, 1.0)[:, None]
+    kept = np.ones(q.shape, bool)
+    kept[rows, largest] = False
+    others = q[kept].reshape(-1, 3)
+    quantized = np.round(
+        (np.clip(others / SMALLEST_THREE_RANGE, -1, 1) * 0.5 + 0.5) * SMALLEST_THREE_MAX
+    ).astype(np.uint64)
+    packed = (
+        largest.astype(np.uint64)
+        | quantized[:, 0] << np.uint64(2)
+        | quantized[:, 1] << np.uint64(17)
+        | quantized[:, 2] << np.uint64(32)
+    )
+    return packed.astype("<u8").view(np.uint16).reshape(-1, 4)[:, :3].copy()
+
+
+def decode_smallest_three(data: np.ndarray) -> np.ndarray:
+    """
+    (N, 3) uint16 => (N, 4) xyzw float32
+    """
+    words = np.zeros((len(data), 4), "<u2")
+    words[:, :3] = data
+    packed = words.view("<u8").ravel()
+    largest = (packed & np.uint64(3)).astype(np.int64)
+    others = np.stack(
+        [
+            (packed >> np.uint64(shift)) & np.uint64(SMALLEST_THREE_MAX)
+            for shift in (2, 17, 32)
+        ],
+        axis=1,
+    ).astype(np.float64)
+    others = (others / SMALLEST_THREE_MAX * 2 - 1) * SMALLEST_THREE_RANGE
+    dropped = np.sqrt(np.maximum(1 - (others * others).sum(axis=1), 0))
+    q = np.empty((len(data), 4))
+    for k in range(4):
+        selected = largest == k
+        q[selected] = np.insert(others[selected], k, dropped[selected], axis=1)
+    return q.astype(np.float32)
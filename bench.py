@@ -0,0 +1,216 @@
+"""
+extraction and serialization throughput of the synthetic meshes, outside blender.
+
+each case runs in a new process for its peak RSS.
+a baseline JSON of a previous run flags the regressions (exit code 1).
+
+    python -m lbsm.bench --max-corners 1000000 --save-baseline bench.json
+    python -m lbsm.bench --max-corners 1000000 --baseline bench.json
+
+--objects splits the corners into meshes, --workers converts them on threads
+(mesh_source.iter_sources).
+
+    python -m lbsm.bench --max-corners 1000000 --objects 64 --workers 8
+"""
+
+from typing import TYPE_CHECKING, NamedTuple, List, Optional, Dict
+import json
+import pathlib
+import sys
+import tempfile
+import time
+
+if TYPE_CHECKING:
+    from . import process
+
+SOURCES = ("grid", "tube")
+CORNERS = (1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+
+class BenchResult(NamedTuple):
+    source: str
+    corners: int
+    extract_seconds: float  # to_vertex_buffer and process_mesh
+    serialize_seconds: float
+    byteLength: int  # of the file
+    peak_rss: Optional[int]  # bytes. None if unknown
+    objects: int = 1
+    workers: int = 0
+
+    def get_key(self) -> str:
+        key = f"{self.source}.{self.corners}"
+        if self.objects > 1:
+            key += f"x{self.objects}"
+        if self.workers:
+            key += f".w{self.workers}"
+        return key
+
+    def get_corners_per_second(self) -> float:
+        return self.corners / max(self.extract_seconds, 1e-9)
+
+    def get_mb_per_second(self) -> float:
+        return self.byteLength / (1 << 20) / max(self.serialize_seconds, 1e-9)
+
+    def __str__(self) -> str:
+        rss = f"{self.peak_rss / (1 << 20):.0f}MB" if self.peak_rss else "-"
+        return (
+            f"{self.get_key()}: extract {self.get_corners_per_second() / 1e6:.2f}M"
+            f" vertices/s, serialize {self.get_mb_per_second():.1f}MB/s,"
+            f" peak RSS {rss}"
+        )
+
+
+def _peak_rss() -> Optional[int]:
+    try:
+        import resource
+    except ImportError:
+        # windows
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, KB on linux
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def run_case(
+    source: str,
+    corners: int,
+    options: "process.ProcessOptions",
+    objects: int = 1,
+    workers: int = 0,
+) -> BenchResult:
+    import contextlib
+    import io
+    from . import synthetic
+    from . import mesh_source
+    from . import serialization
+
+    generate = {
+        "grid": synthetic.grid_for_corners,
+        "tube": synthetic.tube_for_corners,
+    }[source]
+    sources = [
+        generate(max(corners // objects, 1), name=f"{source}{i}")
+        for i in range(objects)
+    ]
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        vbs = list(mesh_source.iter_sources(sources, options=options, workers=workers))
+        extract_seconds = time.perf_counter() - start
+        with tempfile.TemporaryDirectory() as d:
+            dst = pathlib.Path(d) / "bench.lbsm"
+            start = time.perf_counter()
+            serialization.serialize(dst, vbs)
+            serialize_seconds = time.perf_counter() - start
+            byteLength = dst.stat().st_size
+    return BenchResult(
+        source,
+        sum(s.get_corner_count() for s in sources),
+        extract_seconds,
+        serialize_seconds,
+        byteLength,
+        _peak_rss(),
+        objects,
+        workers,
+    )
+
+
+def compare(
+    results: List[BenchResult], baseline: Dict[str, Dict], tolerance: float
+) -> List[str]:
+    """
+    the regressions over the tolerance (0.2 is 20%) of the baseline.
+    """
+    regressions = []
+    for r in results:
+        base = baseline.get(r.get_key())
+        if not base:
+            continue
+        for metric, value, higher in (
+            ("vertices/s", r.get_corners_per_second(), True),
+            ("MB/s", r.get_mb_per_second(), True),
+            ("peak_rss", r.peak_rss, False),
+        ):
+            expected = base.get(metric)
+            if not expected or value is None:
+                continue
+            ratio = value / expected
+            if (ratio < 1 - tolerance) if higher else (ratio > 1 + tolerance):
+                regressions.append(
+                    f"{r.get_key()}: {metric} {value:.4g},"
+                    f" baseline {expected:.4g} ({ratio:.2f}x)"
+                )
+    return regressions
+
+
+def to_baseline(results: List[BenchResult]) -> Dict[str, Dict]:
+    return {
+        r.get_key(): {
+            "vertices/s": r.get_corners_per_second(),
+            "MB/s": r.get_mb_per_second(),
+            "peak_rss": r.peak_rss,
+        }
+        for r in results
+    }
+
+
+def main():
+    import argparse
+    import concurrent.futures
+    from . import process
+
+    parser = argparse.ArgumentParser(description="lbsm export benchmark")
+    parser.add_argument("--source", choices=SOURCES, action="append")
+    parser.add_argument("--max-corners", type=int, default=CORNERS[-1])
+    parser.add_argument("--repeat", type=int, default=1, help="the best of")
+    parser.add_argument("--weld", action="store_true")
+    parser.add_argument("--no-optimize", action="store_true")
+    parser.add_argument("--lods", type=int, default=0)
+    parser.add_argument("--objects", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=0, help="0 is serial")
+    parser.add_argument("--baseline", type=pathlib.Path)
+    parser.add_argument("--save-baseline", type=pathlib.Path)
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    options = process.ProcessOptions(
+        use_weld=args.weld,
+        use_optimize_indices=not args.no_optimize,
+        lod_levels=args.lods,
+    )
+    results: List[BenchResult] = []
+    for source in args.source or SOURCES:
+        for corners in CORNERS:
+            if corners > args.max_corners:
+                break
+            runs = []
+            for _ in range(args.repeat):
+                # a new process for the peak RSS of the case
+                with concurrent.futures.ProcessPoolExecutor(1) as executor:
+                    runs.append(
+                        executor.submit(
+                            run_case,
+                            source,
+                            corners,
+                            options,
+                            args.objects,
+                            args.workers,
+                        ).result()
+                    )
+            result = min(runs, key=lambda r: r.extract_seconds + r.serialize_seconds)
+            print(result)
+            results.append(result)
+
+    if args.save_baseline:
+        args.save_baseline.write_text(json.dumps(to_baseline(results), indent=2))
+    if args.baseline:
+        regressions = compare(
+            results, json.loads(args.baseline.read_text()), args.tolerance
+        )
+        for regression in regressions:
+            print(f"regression: {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""
+content addressed on disk cache of the processed VertexBuffer.
+
+the key is a hash of everything the extraction reads (vertex.mesh_digest).
+an entry is a .npz of the streams and a JSON of the rest.
+the least recently used entries are evicted over max_bytes.
+"""
+
+from typing import Dict, Optional, Tuple
+import json
+import os
+import pathlib
+import tempfile
+import numpy as np
+from . import vertex_buffer
+
+# a part of the key (vertex.mesh_digest). bump when the entry layout or the
+# output of the extraction and process_mesh changes, so the old entries miss
+FORMAT_VERSION = 1
+
+
+def default_directory() -> pathlib.Path:
+    return pathlib.Path(tempfile.gettempdir()) / "lbsm_cache"
+
+
+def _save(path: pathlib.Path, vb: vertex_buffer.VertexBuffer):
+    arrays = {
+        "geometry": vertex_buffer.as_array(vb.geometry, vertex_buffer.GEOMETRY_DTYPE),
+        "colortex": vertex_buffer.as_array(vb.colortex, vertex_buffer.COLORTEX_DTYPE),
+        "indices": vertex_buffer.as_array(vb.indices.indices, vb.indices.get_dtype()),
+    }
+    meta = {
+        "vertex_count": vb.vertex_count,
+        "index_stride": vb.indices.stride,
+        "submeshes": (
+            [list(s) for s in vb.submeshes] if vb.submeshes is not None else None
+        ),
+        "joints": None,
+        "materials": vb.materials,
+        "morphs": [target.name for target in vb.morphs or []],
+        "lods": [
+            [
+                lod.error,
+                lod.indices.stride,
+                [list(s) for s in lod.submeshes] if lod.submeshes is not None else None,
+            ]
+            for lod in vb.lods or []
+        ],
+    }
+    if vb.skinning:
+        arrays["skinning"] = vertex_buffer.as_array(
+            vb.skinning.skinning, vb.skinning.get_dtype()
+        )
+        meta["joints"] = [list(joint) for joint in vb.skinning.joints]
+    for i, target in enumerate(vb.morphs or []):
+        arrays[f"morph{i}.indices"] = vertex_buffer.as_array(
+            target.indices, np.dtype(np.uint32)
+        )
+        arrays[f"morph{i}.deltas"] = vertex_buffer.as_array(
+            target.deltas, vertex_buffer.MORPH_DTYPE
+        )
+    for i, lod in enumerate(vb.lods or []):
+        arrays[f"lod{i}.indices"] = vertex_buffer.as_array(
+            lod.indices.indices, lod.indices.get_dtype()
+        )
+    arrays["meta"] = np.frombuffer(json.dumps(meta).encode("utf-8"), np.uint8)
+
+    # another export may read the same key
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with tmp.open("wb") as w:
+        np.savez(w, **arrays)
+    os.replace(tmp, path)
+
+
+def _load(path: pathlib.Path) -> vertex_buffer.VertexBuffer:
+    with np.load(path) as npz:
+        meta = json.loads(npz["meta"].tobytes())
+        skinning = None
+        if meta["joints"] is not None:
+            skinning = vertex_buffer.Skinning(
+                [
+                    vertex_buffer.Joint(
+                        name,
+                        tuple(position),
+                        is_connected,
+                        parent,
+                        *[tuple(x) if x else None for x in rest],
+                    )
+                    for name, position, is_connected, parent, *rest in meta["joints"]
+                ],
+                memoryview(npz["skinning"]),
+                npz["skinning"].dtype["weights"].shape[0],
+            )
+        submeshes = None
+        if meta["submeshes"] is not None:
+            submeshes = [vertex_buffer.SubMesh(*s) for s in meta["submeshes"]]
+        return vertex_buffer.VertexBuffer(
+            vertex_buffer.Indices(meta["index_stride"], memoryview(npz["indices"])),
+            meta["vertex_count"],
+            memoryview(npz["geometry"]),
+            memoryview(npz["colortex"]),
+            skinning,
+            submeshes,
+            meta.get("materials"),
+            [
+                vertex_buffer.MorphTarget(
+                    name,
+                    memoryview(npz[f"morph{i}.indices"]),
+                    memoryview(npz[f"morph{i}.deltas"]),
+                )
+                for i, name in enumerate(meta.get("morphs", []))
+            ]
+            or None,
+            [
+                vertex_buffer.Lod(
+                    error,
+                    vertex_buffer.Indices(stride, memoryview(npz[f"lod{i}.indices"])),
+                    (
+                        [vertex_buffer.SubMesh(*s) for s in lod_submeshes]
+                        if lod_submeshes is not None
+                        else None
+                    ),
+                )
+                for i, (error, stride, lod_submeshes) in enumerate(meta.get("lods", []))
+            ]
+            or None,
+        )
+
+
+class MeshCache:
+    def __init__(
+        self, directory: Optional[pathlib.Path] = None, max_bytes: int = 1 << 30
+    ) -> None:
+        self.directory = directory or default_directory()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        # key => (size, last use)
+        self.entries: Dict[str, Tuple[int, float]] = {}
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".npz"):
+                stat = entry.stat()
+                self.entries[entry.name[:-4]] = (stat.st_size, stat.st_mtime)
+
+    def _path(self, key: str) -> pathlib.Path:
+        return self.directory / f"{key}.npz"
+
+    def get(self, key: str) -> Optional[vertex_buffer.VertexBuffer]:
+        if key not in self.entries:
+            self.misses += 1
+            return None
+        path = self._path(key)
+        try:
+            vb = _load(path)
+            os.utime(path)
+        except (OSError, ValueError, KeyError):
+            # evicted by another process or broken
+            del self.entries[key]
+            self.misses += 1
+            return None
+        self.entries[key] = (self.entries[key][0], path.stat().st_mtime)
+        self.hits += 1
+        return vb
+
+    def put(self, key: str, vb: vertex_buffer.VertexBuffer):
+        path = self._path(key)
+        _save(path, vb)
+        stat = path.stat()
+        self.entries[key] = (stat.st_size, stat.st_mtime)
+        self.evict()
+
+    def get_size(self) -> int:
+        return sum(size for size, _ in self.entries.values())
+
+    def evict(self):
+        size = self.get_size()
+        for key in sorted(self.entries, key=lambda key: self.entries[key][1]):
+            if size <= self.max_bytes:
+                break
+            size -= self.entries.pop(key)[0]
+            try:
+                self._path(key).unlink()
+            except FileNotFoundError:
+                pass
+
+    def __str__(self) -> str:
+        return (
+            f"cache: {self.hits} hits, {self.misses} misses, "
+            f"{len(self.entries)} entries, "
+            f"{self.get_size() / (1 << 20):.1f}/{self.max_bytes / (1 << 20):.0f} MB"
+        )
@@ -0,0 +1,65 @@
+"""
+per bufferView compression for the BINZ chunk.
+
+each bufferView is filtered then compressed independently,
+so a reader can decompress only the views it needs.
+
+filter
+    shuffle: byte transpose by stride. vertex streams (stride is the vertex size).
+    delta: difference of the u16/u32 values, then shuffle. indices.
+"""
+
+from typing import Dict, Callable
+import zlib
+import lzma
+import numpy as np
+
+CODECS: Dict[str, Callable[[bytes], bytes]] = {
+    "zlib": lambda data: zlib.compress(data, 6),
+    "lzma": lambda data: lzma.compress(data, preset=6),
+}
+
+DECODECS: Dict[str, Callable[[bytes], bytes]] = {
+    "zlib": zlib.decompress,
+    "lzma": lzma.decompress,
+}
+
+
+def shuffle(data: np.ndarray, stride: int) -> np.ndarray:
+    """
+    the byte k of every element, then the byte k + 1 ...
+    a tail shorter than stride is kept as is.
+    """
+    count = len(data) // stride
+    body = data[: count * stride].reshape(count, stride).T.ravel()
+    return np.concatenate([body, data[count * stride :]])
+
+
+def unshuffle(data: np.ndarray, stride: int) -> np.ndarray:
+    count = len(data) // stride
+    body = data[: count * stride].reshape(stride, count).T.ravel()
+    return np.concatenate([body, data[count * stride :]])
+
+
+def _index_dtype(stride: int) -> np.dtype:
+    return np.dtype("<u4") if stride == 4 else np.dtype("<u2")
+
+
+def encode(data: memoryview, codec: str, filter: str, stride: int) -> bytes:
+    b = np.frombuffer(data, np.uint8)
+    if filter == "delta":
+        values = b.view(_index_dtype(stride))
+        b = np.diff(values, prepend=values.dtype.type(0)).view(np.uint8)
+    if stride > 1:
+        b = shuffle(b, stride)
+    return CODECS[codec](b.tobytes())
+
+
+def decode(data: memoryview, codec: str, filter: str, stride: int) -> bytes:
+    b = np.frombuffer(DECODECS[codec](data), np.uint8)
+    if stride > 1:
+        b = unshuffle(b, stride)
+    if filter == "delta":
+        delta = b.view(_index_dtype(stride))
+        b = np.cumsum(delta, dtype=delta.dtype).view(np.uint8)
+    return b.tobytes()
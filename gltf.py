@@ -0,0 +1,687 @@
+"""
+bpy independent glTF 2.0 (.glb / .gltf) => VertexBuffer.
+
+each node that has a mesh is a VertexBuffer, as an object of vertex.export_glb.
+the primitives of the mesh are SubMesh of the glTF material.
+
+    python -m lbsm.gltf src_dir dst_dir -j 8
+"""
+
+from typing import List, NamedTuple, Dict, Optional, Tuple, Any, Iterator
+import base64
+import json
+import pathlib
+import struct
+import numpy as np
+from . import vertex_buffer
+from . import process
+from . import skin as _skin
+from . import tangent as _tangent
+from . import skeleton
+from . import morph
+from . import profiling
+
+COMPONENT_TYPES: Dict[int, str] = {
+    5120: "i1",
+    5121: "u1",
+    5122: "<i2",
+    5123: "<u2",
+    5125: "<u4",
+    5126: "<f4",
+}
+
+TYPE_SIZES: Dict[str, int] = {
+    "SCALAR": 1,
+    "VEC2": 2,
+    "VEC3": 3,
+    "VEC4": 4,
+    "MAT4": 16,
+}
+
+# glTF +Y up +Z forward => x right, y up, z back. same as run.py
+GLTF_TO_LBSM = np.diag([-1.0, 1.0, -1.0, 1.0])
+
+
+class Gltf(NamedTuple):
+    json: Dict[str, Any]
+    buffers: List[bytes]
+
+
+def load(path: pathlib.Path) -> Gltf:
+    data = path.read_bytes()
+    bin_chunk = None
+    if data[:4] == b"glTF":
+        _, _, length = struct.unpack_from("<4sII", data, 0)
+        pos = 12
+        gltf_json = None
+        while pos < length:
+            chunkLength, chunkType = struct.unpack_from("<I4s", data, pos)
+            pos += 8
+            if chunkType == b"JSON":
+                gltf_json = json.loads(data[pos : pos + chunkLength])
+            elif chunkType == b"BIN\0":
+                bin_chunk = data[pos : pos + chunkLength]
+            pos += chunkLength
+        if gltf_json is None:
+            raise Exception(f"{path}: no JSON chunk")
+    else:
+        gltf_json = json.loads(data)
+
+    buffers = []
+    for buffer in gltf_json.get("buffers", []):
+        uri = buffer.get("uri")
+        if uri is None:
+            buffers.append(bin_chunk)
+        elif uri.startswith("data:"):
+            buffers.append(base64.b64decode(uri.split(",", 1)[1]))
+        else:
+            buffers.append((path.parent / uri).read_bytes())
+    return Gltf(gltf_json, buffers)
+
+
+def read_accessor(gltf: Gltf, index: int) -> np.ndarray:
+    """
+    (count, components). normalized integers are converted to float32.
+    """
+    accessor = gltf.json["accessors"][index]
+    dtype = np.dtype(COMPONENT_TYPES[accessor["componentType"]])
+    components = TYPE_SIZES[accessor["type"]]
+    count = accessor["count"]
+
+    if "bufferView" in accessor:
+        bufferView = gltf.json["bufferViews"][accessor["bufferView"]]
+        buffer = gltf.buffers[bufferView["buffer"]]
+        offset = bufferView.get("byteOffset", 0) + accessor.get("byteOffset", 0)
+        itemsize = dtype.itemsize * components
+        stride = bufferView.get("byteStride", itemsize)
+        if count:
+            raw = np.frombuffer(
+                buffer, np.uint8, (count - 1) * stride + itemsize, offset
+            )
+            rows = np.lib.stride_tricks.as_strided(raw, (count, itemsize), (stride, 1))
+            values = rows.copy().view(dtype).reshape(count, components)
+        else:
+            values = np.zeros((0, components), dtype)
+    else:
+        values = np.zeros((count, components), dtype)
+
+    sparse = accessor.get("sparse")
+    if sparse:
+        indices = sparse["indices"]
+        index_view = gltf.json["bufferViews"][indices["bufferView"]]
+        sparse_indices = np.frombuffer(
+            gltf.buffers[index_view["buffer"]],
+            COMPONENT_TYPES[indices["componentType"]],
+            sparse["count"],
+            index_view.get("byteOffset", 0) + indices.get("byteOffset", 0),
+        )
+        value_view = gltf.json["bufferViews"][sparse["values"]["bufferView"]]
+        values = values.copy()
+        values[sparse_indices] = np.frombuffer(
+            gltf.buffers[value_view["buffer"]],
+            dtype,
+            sparse["count"] * components,
+            value_view.get("byteOffset", 0) + sparse["values"].get("byteOffset", 0),
+        ).reshape(-1, components)
+
+    if accessor.get("normalized"):
+        if dtype.kind == "u":
+            values = values.astype(np.float32) / np.iinfo(dtype).max
+        else:
+            values = np.maximum(values.astype(np.float32) / np.iinfo(dtype).max, -1)
+    return values
+
+
+def node_matrix(node: Dict[str, Any]) -> np.ndarray:
+    """
+    local transform. row major, column vectors.
+    """
+    if "matrix" in node:
+        return np.array(node["matrix"], np.float64).reshape(4, 4).T
+    t = np.eye(4)
+    t[:3, 3] = node.get("translation", (0, 0, 0))
+    x, y, z, w = node.get("rotation", (0, 0, 0, 1))
+    r = np.eye(4)
+    r[:3, :3] = [
+        [1 - 2 * (y * y + z * z), 2 * (x * y - z * w), 2 * (x * z + y * w)],
+        [2 * (x * y + z * w), 1 - 2 * (x * x + z * z), 2 * (y * z - x * w)],
+        [2 * (x * z - y * w), 2 * (y * z + x * w), 1 - 2 * (x * x + y * y)],
+    ]
+    s = np.diag([*node.get("scale", (1, 1, 1)), 1.0])
+    return t @ r @ s
+
+
+def world_matrices(gltf: Gltf) -> Tuple[List[np.ndarray], List[Optional[int]]]:
+    """
+    returns (world, parent) of each node.
+    """
+    nodes = gltf.json.get("nodes", [])
+    parents: List[Optional[int]] = [None] * len(nodes)
+    for i, node in enumerate(nodes):
+        for child in node.get("children", []):
+            parents[child] = i
+    world: List[Optional[np.ndarray]] = [None] * len(nodes)
+
+    def get_world(i: int) -> np.ndarray:
+        if world[i] is None:
+            local = node_matrix(nodes[i])
+            parent = parents[i]
+            world[i] = local if parent is None else get_world(parent) @ local
+        return world[i]
+
+    return [get_world(i) for i in range(len(nodes))], parents
+
+
+def node_names(gltf: Gltf) -> List[str]:
+    """
+    Joint.name must be unique.
+    """
+    names = []
+    used = set()
+    for i, node in enumerate(gltf.json.get("nodes", [])):
+        name = node.get("name") or f"node{i}"
+        if name in used:
+            name = f"{name}.{i}"
+        used.add(name)
+        names.append(name)
+    return names
+
+
+def _transform(m: np.ndarray, points: np.ndarray, w: float) -> np.ndarray:
+    return points @ m[:3, :3].T + (m[:3, 3] if w else 0)
+
+
+def _vertex_normals(position: np.ndarray, triangles: np.ndarray) -> np.ndarray:
+    """
+    area weighted. when the primitive has no NORMAL.
+    """
+    p = position[triangles]
+    face = np.cross(p[:, 1] - p[:, 0], p[:, 2] - p[:, 0])
+    normal = np.zeros_like(position)
+    for k in range(3):
+        np.add.at(normal, triangles[:, k], face)
+    length = np.linalg.norm(normal, axis=1, keepdims=True)
+    return np.divide(normal, length, out=np.zeros_like(normal), where=length > 0)
+
+
+def _get_skinning(
+    gltf: Gltf,
+    skin_index: int,
+    matrix: np.ndarray,
+    world: List[np.ndarray],
+    parents: List[Optional[int]],
+    names: List[str],
+) -> List[vertex_buffer.Joint]:
+    skin = gltf.json["skins"][skin_index]
+    joints = skin["joints"]
+    if "inverseBindMatrices" in skin:
+        ibm = read_accessor(gltf, skin["inverseBindMatrices"])
+        # column major
+        bind = [np.linalg.inv(m.reshape(4, 4).T) for m in ibm]
+    else:
+        bind = [world[j] for j in joints]
+
+    rotations, scales = skeleton.decompose(
+        np.array([(matrix @ m)[:3, :3] for m in bind]).reshape(-1, 3, 3)
+    )
+    joint_set = set(joints)
+    result = []
+    for j, m, rotation, scale in zip(joints, bind, rotations, scales):
+        parent = parents[j]
+        while parent is not None and parent not in joint_set:
+            parent = parents[parent]
+        head = matrix @ m[:, 3]
+        result.append(
+            vertex_buffer.Joint(
+                name=names[j],
+                position=(float(head[0]), float(head[1]), float(head[2])),
+                is_connected=False,
+                parent=names[parent] if parent is not None else None,
+                rotation=tuple(float(x) for x in rotation),
+                scale=tuple(float(x) for x in scale),
+            )
+        )
+    return result
+
+
+def from_node(
+    gltf: Gltf,
+    node_index: int,
+    matrix: np.ndarray = GLTF_TO_LBSM,
+    *,
+    world: Optional[List[np.ndarray]] = None,
+    parents: Optional[List[Optional[int]]] = None,
+    names: Optional[List[str]] = None,
+    influences: int = 4,
+    tangents: bool = True,
+    use_morphs: bool = True,
+    morph_epsilon: float = 1e-5,
+) -> Optional[vertex_buffer.VertexBuffer]:
+    """
+    the mesh of the node in the export space (matrix @ node world).
+    a skinned mesh ignores the node transform (glTF spec).
+
+    tangents: tangent.compute_tangents for the primitives without TANGENT.
+    use_morphs: the primitive targets as sparse morph targets.
+    """
+    if world is None or parents is None:
+        world, parents = world_matrices(gltf)
+    if names is None:
+        names = node_names(gltf)
+    node = gltf.json["nodes"][node_index]
+    mesh = gltf.json["meshes"][node["mesh"]]
+    skin_index = node.get("skin")
+    mat = matrix if skin_index is not None else matrix @ world[node_index]
+    normal_mat = np.linalg.inv(mat[:3, :3]).T
+    flip = np.linalg.det(mat[:3, :3]) < 0
+
+    geometries = []
+    colortexs = []
+    skins = []
+    index_list = []
+    submeshes = []
+    morph_parts = []
+    target_names = mesh.get("extras", {}).get("targetNames", [])
+    materials: List[Optional[str]] = [
+        material.get("name") or f"material{i}"
+        for i, material in enumerate(gltf.json.get("materials", []))
+    ]
+    # the primitives without a material. None is the placeholder material
+    placeholder = len(materials)
+    vertex_count = 0
+    for primitive in mesh["primitives"]:
+        if primitive.get("mode", 4) != 4:
+            print(f'{mesh.get("name")}: mode {primitive["mode"]} is not supported')
+            continue
+        attributes = primitive["attributes"]
+        position = read_accessor(gltf, attributes["POSITION"]).astype(np.float32)
+        count = len(position)
+        if "indices" in primitive:
+            triangles = read_accessor(gltf, primitive["indices"]).astype(np.int64)
+        else:
+            triangles = np.arange(count, dtype=np.int64)
+        triangles = triangles.reshape(-1, 3)
+        if flip:
+            triangles = triangles[:, ::-1]
+
+        geometry = np.zeros(count, vertex_buffer.GEOMETRY_DTYPE)
+        geometry["position"] = _transform(mat, position, 1)
+        if "NORMAL" in attributes:
+            normal = read_accessor(gltf, attributes["NORMAL"]) @ normal_mat.T
+            length = np.linalg.norm(normal, axis=1, keepdims=True)
+            geometry["normal"] = np.divide(
+                normal, length, out=np.zeros_like(normal), where=length > 0
+            )
+        else:
+            geometry["normal"] = _vertex_normals(geometry["position"], triangles)
+        if "TANGENT" in attributes:
+            tangent = read_accessor(gltf, attributes["TANGENT"])
+            geometry["tangent"][:, :3] = _transform(mat, tangent[:, :3], 0)
+            # the v flip below flips the bitangent
+            geometry["tangent"][:, 3] = tangent[:, 3] * (1 if flip else -1)
+
+        colortex = np.zeros(count, vertex_buffer.COLORTEX_DTYPE)
+        if "COLOR_0" in attributes:
+            color = read_accessor(gltf, attributes["COLOR_0"])
+            colortex["color"][:, : color.shape[1]] = color
+            if color.shape[1] == 3:
+                colortex["color"][:, 3] = 1
+        for name, attribute in (("tex0", "TEXCOORD_0"), ("tex1", "TEXCOORD_1")):
+            if attribute in attributes:
+                uv = read_accessor(gltf, attributes[attribute])
+                # top left origin => bottom left origin, as blender
+                colortex[name] = np.stack([uv[:, 0], 1 - uv[:, 1]], axis=1)
+        if tangents and "TANGENT" not in attributes and "TEXCOORD_0" in attributes:
+            geometry["tangent"] = _tangent.compute_tangents(
+                geometry["position"], geometry["normal"], colortex["tex0"], triangles
+            )
+
+        if skin_index is not None:
+            # JOINTS_0, JOINTS_1 ... => the top influences
+            joint_sets = []
+            weight_sets = []
+            n = 0
+            while f"JOINTS_{n}" in attributes and f"WEIGHTS_{n}" in attributes:
+                joint_sets.append(read_accessor(gltf, attributes[f"JOINTS_{n}"]))
+                weight_sets.append(read_accessor(gltf, attributes[f"WEIGHTS_{n}"]))
+                n += 1
+            if n:
+                joints = np.concatenate(joint_sets, axis=1)
+                weights = np.concatenate(weight_sets, axis=1)
+            else:
+                joints = np.zeros((count, 0), np.int64)
+                weights = np.zeros((count, 0), np.float32)
+            vertices = np.repeat(np.arange(count), joints.shape[1])
+            joint_count = len(gltf.json["skins"][skin_index]["joints"])
+            skin, stats = _skin.top_k(
+                vertices,
+                joints.ravel(),
+                weights.ravel(),
+                count,
+                np.arange(joint_count),
+                influences,
+            )
+            if stats.truncated:
+                print(f'{mesh.get("name")}: {stats}')
+            skins.append(skin)
+
+        if use_morphs and "targets" in primitive:
+            targets = []
+            for i, target in enumerate(primitive["targets"]):
+                zero = np.zeros((count, 3), np.float32)
+                deltas = [
+                    (
+                        read_accessor(gltf, target[attribute]) @ m.T
+                        if attribute in target
+                        else zero
+                    )
+                    for attribute, m in (
+                        ("POSITION", mat[:3, :3]),
+                        ("NORMAL", normal_mat),
+                        ("TANGENT", mat[:3, :3]),
+                    )
+                ]
+                name = target_names[i] if i < len(target_names) else f"target{i}"
+                target = morph.sparse_target(name, *deltas, epsilon=morph_epsilon)
+                if target:
+                    targets.append(target)
+            morph_parts.append((vertex_count, targets))
+
+        geometries.append(geometry)
+        colortexs.append(colortex)
+        index_list.append(triangles.ravel() + vertex_count)
+        submeshes.append(
+            vertex_buffer.SubMesh(
+                draw_count=triangles.size,
+                material=primitive.get("material", placeholder),
+            )
+        )
+        vertex_count += count
+
+    if not geometries:
+        return None
+    if materials and any(s.material == placeholder for s in submeshes):
+        materials.append(None)
+
+    indices = np.concatenate(index_list)
+    index_stride = 4 if vertex_count > 65535 else 2
+    skinning = None
+    if skin_index is not None:
+        skinning = vertex_buffer.Skinning(
+            _get_skinning(gltf, skin_index, matrix, world, parents, names),
+            memoryview(np.concatenate(skins)),
+            influences,
+        )
+    return vertex_buffer.VertexBuffer(
+        vertex_buffer.Indices(
+            index_stride,
+            memoryview(indices.astype(np.uint32 if index_stride == 4 else np.uint16)),
+        ),
+        vertex_count,
+        memoryview(np.concatenate(geometries)),
+        memoryview(np.concatenate(colortexs)),
+        skinning,
+        submeshes,
+        materials or None,
+        morph.concat_morphs(morph_parts),
+    )
+
+
+def iter_meshes(
+    gltf: Gltf,
+    matrix: np.ndarray = GLTF_TO_LBSM,
+    *,
+    influences: int = 4,
+    tangents: bool = True,
+    use_morphs: bool = True,
+    morph_epsilon: float = 1e-5,
+    profiler: Optional[profiling.Profiler] = None,
+) -> Iterator[vertex_buffer.VertexBuffer]:
+    """
+    the mesh nodes in the node order.
+    profiler: an "extract" phase for each node.
+    """
+    world, parents = world_matrices(gltf)
+    names = node_names(gltf)
+    for i, node in enumerate(gltf.json.get("nodes", [])):
+        if "mesh" in node:
+            with profiling.phase(profiler, "extract", names[i]):
+                vb = from_node(
+                    gltf,
+                    i,
+                    matrix,
+                    world=world,
+                    parents=parents,
+                    names=names,
+                    influences=influences,
+                    tangents=tangents,
+                    use_morphs=use_morphs,
+                    morph_epsilon=morph_epsilon,
+                )
+                if vb:
+                    profiling.add_bytes(
+                        profiler,
+                        vb.geometry.nbytes
+                        + vb.colortex.nbytes
+                        + vb.indices.indices.nbytes,
+                    )
+            if vb:
+                yield vb
+
+
+class ConvertResult(NamedTuple):
+    src: pathlib.Path
+    dst: pathlib.Path
+    src_size: int
+    vertex_count: int
+    seconds: float
+    # profile
+    phases: Tuple[profiling.Phase, ...] = ()
+
+
+def convert(
+    src: pathlib.Path,
+    dst: pathlib.Path,
+    *,
+    options: Optional[process.ProcessOptions] = None,
+    quantization: Optional[str] = None,
+    compression: Optional[str] = None,
+    alignment: int = 1,
+    interleave: bool = False,
+    progressive: bool = False,
+    profile: bool = False,
+    trace_allocations: bool = False,
+    embed_profile: bool = False,
+) -> ConvertResult:
+    """
+    profile: ConvertResult.phases. embed_profile: and Root.profile.
+    """
+    import contextlib
+    import io
+    import time
+    from . import serialization
+    from . import quantize
+
+    start = time.perf_counter()
+    profiler = None
+    if profile or embed_profile:
+        profiler = profiling.Profiler(trace_allocations=trace_allocations)
+    meshes = []
+    # serialize and process_mesh print for the interactive use
+    with profiler or contextlib.nullcontext(), contextlib.redirect_stdout(
+        io.StringIO()
+    ):
+        with profiling.phase(profiler, "load", ""):
+            gltf = load(src)
+        for vb in iter_meshes(
+            gltf,
+            influences=options.influences if options else 4,
+            tangents=options.tangents != "none" if options else True,
+            use_morphs=options.use_morphs if options else True,
+            morph_epsilon=options.morph_epsilon if options else 1e-5,
+            profiler=profiler,
+        ):
+            if options:
+                with profiling.phase(profiler, "process", f"mesh{len(meshes)}"):
+                    vb = process.process_mesh(vb, options, profiler)
+            meshes.append(vb)
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        serialization.serialize(
+            dst,
+            meshes,
+            quantization=(
+                {"half": quantize.HALF, "quantized": quantize.QUANTIZED}[quantization]
+                if quantization
+                else None
+            ),
+            compression=compression,
+            alignment=alignment,
+            interleave=interleave,
+            progressive=progressive,
+            profiler=profiler,
+            embed_profile=embed_profile,
+        )
+    return ConvertResult(
+        src,
+        dst,
+        src.stat().st_size,
+        sum(vb.vertex_count for vb in meshes),
+        time.perf_counter() - start,
+        tuple(profiler.phases) if profiler else (),
+    )
+
+
+def _is_updated(src: pathlib.Path, dst: pathlib.Path) -> bool:
+    return not dst.exists() or dst.stat().st_mtime < src.stat().st_mtime
+
+
+def main():
+    import argparse
+    import concurrent.futures
+    import time
+
+    parser = argparse.ArgumentParser(description="glTF to lbsm")
+    parser.add_argument("src", type=pathlib.Path, help=".glb, .gltf or a directory")
+    parser.add_argument("dst", type=pathlib.Path, nargs="?")
+    parser.add_argument("-j", "--jobs", type=int, default=None)
+    parser.add_argument(
+        "-f", "--force", action="store_true", help="convert the unchanged inputs"
+    )
+    parser.add_argument("--weld", action="store_true")
+    parser.add_argument("--no-optimize", action="store_true")
+    parser.add_argument("--split-u16", action="store_true")
+    parser.add_argument("--palette-size", type=int, default=0)
+    parser.add_argument("--influences", type=int, choices=(4, 8), default=4)
+    parser.add_argument("--no-tangents", action="store_true")
+    parser.add_argument("--no-morphs", action="store_true")
+    parser.add_argument("--lods", type=int, default=0, help="LOD levels")
+    parser.add_argument("--lod-ratio", type=float, default=0.5)
+    parser.add_argument("--lod-max-error", type=float, default=0.01)
+    parser.add_argument("--vertex-format", choices=("half", "quantized"))
+    parser.add_argument("--compression", choices=("zlib", "lzma"))
+    parser.add_argument("--alignment", type=int, choices=(1, 16, 64, 4096), default=1)
+    parser.add_argument(
+        "--interleave", action="store_true", help="one vertex stream per mesh"
+    )
+    parser.add_argument(
+        "--progressive", action="store_true", help="TOC, coarse LODs first"
+    )
+    parser.add_argument(
+        "--profile", action="store_true", help="print the time of each phase"
+    )
+    parser.add_argument(
+        "--trace-allocations", action="store_true", help="tracemalloc in --profile"
+    )
+    parser.add_argument(
+        "--embed-profile", action="store_true", help="the report in the asset JSON"
+    )
+    parser.add_argument(
+        "--trace", type=pathlib.Path, help="chrome://tracing JSON of the batch"
+    )
+    args = parser.parse_args()
+
+    if args.src.is_dir():
+        dst_dir = args.dst or args.src
+        jobs = [
+            (src, dst_dir / src.relative_to(args.src).with_suffix(".lbsm"))
+            for src in sorted(args.src.rglob("*"))
+            if src.suffix.lower() in (".glb", ".gltf")
+        ]
+    else:
+        jobs = [(args.src, args.dst or args.src.with_suffix(".lbsm"))]
+    skipped = 0
+    if not args.force:
+        count = len(jobs)
+        jobs = [(src, dst) for src, dst in jobs if _is_updated(src, dst)]
+        skipped = count - len(jobs)
+
+    options = process.ProcessOptions(
+        use_weld=args.weld,
+        use_optimize_indices=not args.no_optimize,
+        use_split_u16=args.split_u16,
+        palette_size=args.palette_size,
+        influences=args.influences,
+        tangents="none" if args.no_tangents else "compute",
+        use_morphs=not args.no_morphs,
+        lod_levels=args.lods,
+        lod_ratio=args.lod_ratio,
+        lod_max_error=args.lod_max_error,
+    )
+    try:
+        options.validate()
+    except ValueError as e:
+        parser.error(str(e))
+    start = time.perf_counter()
+    results: List[ConvertResult] = []
+    failed = 0
+    with concurrent.futures.ProcessPoolExecutor(args.jobs) as executor:
+        futures = {
+            executor.submit(
+                convert,
+                src,
+                dst,
+                options=options,
+                quantization=args.vertex_format,
+                compression=args.compression,
+                alignment=args.alignment,
+                interleave=args.interleave,
+                progressive=args.progressive,
+                profile=args.profile or args.trace is not None,
+                trace_allocations=args.trace_allocations,
+                embed_profile=args.embed_profile,
+            ): src
+            for src, dst in jobs
+        }
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"{futures[future]}: {e}")
+                failed += 1
+                continue
+            results.append(result)
+            print(
+                f"{result.src} => {result.dst}: "
+                f"{result.vertex_count} vertices, {result.seconds:.2f}s"
+            )
+
+    seconds = time.perf_counter() - start
+    size = sum(result.src_size for result in results)
+    print(
+        f"{len(results)} converted, {skipped} unchanged, {failed} failed. "
+        f"{seconds:.2f}s, {len(results) / max(seconds, 1e-9):.1f} files/s, "
+        f"{size / (1 << 20) / max(seconds, 1e-9):.1f} MB/s"
+    )
+    if args.profile:
+        report = profiling.make_report(
+            phase for result in results for phase in result.phases
+        )
+        print("\n".join(profiling.format_report(report)))
+    if args.trace:
+        profiling.write_chrome_trace(
+            args.trace, [(str(result.src), result.phases) for result in results]
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+"""
+.lbsm => blender objects.
+
+the arrays are set in bulk with foreach_set. the vertices that have the same
+position are merged, and the normals are set as custom split normals.
+"""
+
+from typing import List, Optional
+import pathlib
+import bpy
+import mathutils
+import numpy as np
+from . import reader
+from . import serialization
+from . import weld
+
+
+def _transform(matrix: mathutils.Matrix, points: np.ndarray, w: float) -> np.ndarray:
+    m = np.array(matrix, np.float32)
+    return points @ m[:3, :3].T + (m[:3, 3] if w else 0)
+
+
+def create_armature(
+    name: str, bones: List[serialization.Bone], matrix: mathutils.Matrix
+) -> bpy.types.Object:
+    """
+    Bone.tail is not exported. the tail is the head of the first child,
+    or the parent direction.
+    """
+    heads = _transform(
+        matrix, np.array([bone["head"] for bone in bones], np.float32).reshape(-1, 3), 1
+    )
+    children: List[List[int]] = [[] for _ in bones]
+    for i, bone in enumerate(bones):
+        if bone["parent"] is not None and bone["parent"] >= 0:
+            children[bone["parent"]].append(i)
+
+    armature = bpy.data.armatures.new(name)
+    ob = bpy.data.objects.new(name, armature)
+    bpy.context.scene.collection.objects.link(ob)
+    bpy.context.view_layer.objects.active = ob
+    bpy.ops.object.mode_set(mode="EDIT")
+    edit_bones = []
+    for i, bone in enumerate(bones):
+        edit_bone = armature.edit_bones.new(bone["name"])
+        head = mathutils.Vector(heads[i].tolist())
+        tail = None
+        for child in children[i]:
+            child_head = mathutils.Vector(heads[child].tolist())
+            if (child_head - head).length > 1e-5:
+                tail = child_head
+                break
+        if tail is None:
+            parent = bone["parent"]
+            direction = mathutils.Vector((0, 0, 0.1))
+            if parent is not None and parent >= 0:
+                d = head - mathutils.Vector(heads[parent].tolist())
+                if d.length > 1e-5:
+                    direction = d.normalized() * min(d.length, 0.1)
+            tail = head + direction
+        edit_bone.head = head
+        edit_bone.tail = tail
+        edit_bones.append(edit_bone)
+    for edit_bone, bone in zip(edit_bones, bones):
+        if bone["parent"] is not None and bone["parent"] >= 0:
+            edit_bone.parent = edit_bones[bone["parent"]]
+            edit_bone.use_connect = bone["is_connected"]
+    bpy.ops.object.mode_set(mode="OBJECT")
+    return ob
+
+
+def create_mesh(
+    r: reader.Reader,
+    mesh_index: int,
+    matrix: mathutils.Matrix,
+    armature: Optional[bpy.types.Object],
+) -> bpy.types.Object:
+    src = r.root["meshes"][mesh_index]
+    name = src["name"]
+
+    # triangles of all submeshes, the vertex index is absolute
+    indices = np.concatenate(
+        [r.submesh_indices(src, i) for i in range(len(src["subMeshes"]))]
+    ).astype(np.int64)
+    # Root.materials => material slot
+    slots = sorted({s["material"] for s in src["subMeshes"]})
+    materials = np.concatenate(
+        [
+            np.full(s["drawCount"] // 3, slots.index(s["material"]), np.int32)
+            for s in src["subMeshes"]
+        ]
+    )
+    positions = _transform(matrix, r.decode(src, "position")[:, :3], 1)
+    normals = _transform(matrix, r.decode(src, "normal")[:, :3], 0)
+    length = np.linalg.norm(normals, axis=1, keepdims=True)
+    normals = np.divide(normals, length, out=np.zeros_like(normals), where=length > 0)
+
+    # lbsm vertex => blender vertex
+    group, representative = weld.unique_rows(
+        weld._pack_rows([np.ascontiguousarray(positions)])
+    )
+    # the triangles that collapse by the merge are not valid polygons
+    triangles = group[indices].reshape(-1, 3)
+    valid = (
+        (triangles[:, 0] != triangles[:, 1])
+        & (triangles[:, 1] != triangles[:, 2])
+        & (triangles[:, 2] != triangles[:, 0])
+    )
+    indices = indices.reshape(-1, 3)[valid].ravel()
+    materials = materials[valid]
+
+    mesh = bpy.data.meshes.new(name)
+    mesh.vertices.add(len(representative))
+    mesh.vertices.foreach_set("co", positions[representative].ravel())
+    mesh.loops.add(len(indices))
+    mesh.loops.foreach_set("vertex_index", group[indices].astype(np.int32))
+    tri_count = len(indices) // 3
+    mesh.polygons.add(tri_count)
+    mesh.polygons.foreach_set(
+        "loop_start", np.arange(0, len(indices), 3, dtype=np.int32)
+    )
+    if bpy.app.version < (4, 0, 0):
+        mesh.polygons.foreach_set("loop_total", np.full(tri_count, 3, np.int32))
+    mesh.polygons.foreach_set("material_index", materials)
+    mesh.polygons.foreach_set("use_smooth", np.ones(tri_count, bool))
+
+    for attribute, uv_name in (("tex0", "UVMap"), ("tex1", "UVMap.001")):
+        uv = r.decode(src, attribute)
+        if attribute == "tex1" and not uv.any():
+            continue
+        layer = mesh.uv_layers.new(name=uv_name)
+        layer.data.foreach_set("uv", uv[indices].ravel())
+
+    mesh.update(calc_edges=True)
+    if bpy.app.version < (4, 1, 0):
+        mesh.use_auto_smooth = True
+    mesh.normals_split_custom_set(normals[indices])
+
+    for slot in slots:
+        material = None
+        if slot > 0:
+            # 0 is the placeholder
+            name = r.root["materials"][slot]["name"]
+            material = bpy.data.materials.get(name) or bpy.data.materials.new(name)
+        mesh.materials.append(material)
+
+    ob = bpy.data.objects.new(name, mesh)
+    bpy.context.scene.collection.objects.link(ob)
+
+    if armature and src["joints"]:
+        bones = r.root["bones"]
+        vertex_groups = [
+            ob.vertex_groups.new(name=bones[j]["name"]) for j in src["joints"]
+        ]
+        # Root.bones => vertex group
+        to_group = np.zeros(len(bones), np.int64)
+        to_group[src["joints"]] = np.arange(len(src["joints"]))
+        joints = to_group[r.vertex_bones(src)[representative]]
+        weights = r.decode(src, "blendWeights")[representative]
+        # VertexGroup.add takes one weight. a call for each (joint, weight)
+        vertices = np.repeat(np.arange(len(representative)), joints.shape[1])
+        keys = np.stack([joints.ravel(), weights.ravel().view(np.int32)], axis=1)[
+            weights.ravel() > 0
+        ]
+        vertices = vertices[weights.ravel() > 0]
+        pairs, inverse = np.unique(keys, axis=0, return_inverse=True)
+        order = np.argsort(inverse.ravel(), kind="stable")
+        starts = np.searchsorted(inverse.ravel()[order], np.arange(len(pairs) + 1))
+        for k, (joint, weight) in enumerate(pairs):
+            vertex_groups[joint].add(
+                vertices[order[starts[k] : starts[k + 1]]].tolist(),
+                float(np.int32(weight).view(np.float32)),
+                "REPLACE",
+            )
+        modifier = ob.modifiers.new("Armature", "ARMATURE")
+        modifier.object = armature
+        ob.parent = armature
+
+    return ob
+
+
+def import_lbsm(path: pathlib.Path, matrix: mathutils.Matrix) -> List[bpy.types.Object]:
+    """
+    matrix: export space => blender. the inverse of the export matrix.
+    """
+    objects = []
+    with reader.read(path) as r:
+        armature = None
+        if r.root["bones"]:
+            armature = create_armature(path.stem, r.root["bones"], matrix)
+            objects.append(armature)
+        meshes = [
+            create_mesh(r, i, matrix, armature) for i in range(len(r.root["meshes"]))
+        ]
+        objects += meshes
+
+        # the mesh data is shared by the instances
+        inverse = matrix.inverted()
+        placed = set()
+        for instance in r.root.get("instances", []):
+            ob = meshes[instance["mesh"]]
+            if instance["mesh"] in placed:
+                ob = bpy.data.objects.new(ob.name, ob.data)
+                bpy.context.scene.collection.objects.link(ob)
+                objects.append(ob)
+            placed.add(instance["mesh"])
+            m = instance["matrix"]
+            ob.matrix_world = (
+                matrix @ mathutils.Matrix([m[0:4], m[4:8], m[8:12], m[12:16]]) @ inverse
+            )
+    return objects
@@ -0,0 +1,338 @@
+"""
+LOD chain. coarser index buffers of the same vertex streams.
+
+vertex clustering with quadric error metrics:
+Lindstrom. Out-of-Core Simplification of Large Polygonal Models. 2000.
+
+the vertices are clustered by a grid, and each cluster collapses into the member
+that has the least error for the sum of the quadrics of the cluster.
+the cell size of a level is searched for the target triangle count.
+
+the vertices on a seam (another vertex at the same position: uv, normal, the
+split parts, the submeshes) or on a border are locked.
+the vertices of different dominant joints are not clustered together.
+
+the error of a level is the max RMS distance of a moved vertex from the planes
+of its triangles. export space. a runtime projects it to pixels by
+error * viewport_height / (2 * distance * tan(fov_y / 2)).
+"""
+
+from typing import List, NamedTuple, Tuple
+import numpy as np
+from . import vertex_buffer
+from . import weld
+from . import optimize
+
+# the upper triangle of the symmetric 4x4 quadric
+_ROW, _COLUMN = np.triu_indices(4)
+
+
+class LodStats(NamedTuple):
+    triangles: List[int]  # of each level. the first is the mesh
+    errors: List[float]
+
+    def __str__(self) -> str:
+        return (
+            f"lod: {' => '.join(str(n) for n in self.triangles)} triangles, "
+            f"error {', '.join(f'{e:.3g}' for e in self.errors[1:]) or '-'}"
+        )
+
+
+def _normals(positions: np.ndarray, triangles: np.ndarray) -> np.ndarray:
+    p = positions[triangles]
+    return np.cross(p[:, 1] - p[:, 0], p[:, 2] - p[:, 0])
+
+
+def vertex_quadrics(
+    positions: np.ndarray, triangles: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    the area weighted plane quadrics of the triangles around each vertex.
+    returns (quadrics (N, 10) the upper triangle, area (N,))
+    """
+    normal = _normals(positions, triangles)
+    length = np.sqrt(np.einsum("ti,ti->t", normal, normal))
+    area = length * 0.5
+    normal /= np.maximum(length, 1e-30)[:, None]
+    plane = np.column_stack(
+        [normal, -np.einsum("ti,ti->t", normal, positions[triangles[:, 0]])]
+    )
+    q = plane[:, _ROW] * plane[:, _COLUMN] * area[:, None]
+
+    corners = triangles.ravel()
+    count = len(positions)
+    quadrics = np.empty((count, len(_ROW)))
+    for k in range(len(_ROW)):
+        quadrics[:, k] = np.bincount(corners, np.repeat(q[:, k], 3), count)
+    return quadrics, np.bincount(corners, np.repeat(area, 3), count)
+
+
+def evaluate(quadrics: np.ndarray, points: np.ndarray) -> np.ndarray:
+    """
+    (N, 10), (N, 3) => (N,) the area weighted sum of the squared distances.
+    """
+    x, y, z = points.T
+    q = quadrics.T
+    return (
+        x * (q[0] * x + 2 * (q[1] * y + q[2] * z + q[3]))
+        + y * (q[4] * y + 2 * (q[5] * z + q[6]))
+        + z * (q[7] * z + 2 * q[8])
+        + q[9]
+    )
+
+
+def locked_vertices(
+    vb: vertex_buffer.VertexBuffer,
+    triangles: np.ndarray,
+    submesh_of_triangle: np.ndarray,
+) -> np.ndarray:
+    """
+    (N,) bool. the vertices that share the position with a different vertex,
+    on a border or a non-manifold edge, or used by more than one submesh.
+    """
+    positions = vertex_buffer.as_array(vb.geometry, vertex_buffer.GEOMETRY_DTYPE)[
+        "position"
+    ]
+    position_group, first = weld.unique_rows(
+        weld._pack_rows([np.ascontiguousarray(positions)])
+    )
+    vertex_group, _ = weld.unique_vertices(vb)
+    # a vertex that differs from the first vertex at the position
+    seam = vertex_group != vertex_group[first[position_group]]
+    locked_position = np.zeros(len(first), bool)
+    locked_position[position_group[seam]] = True
+
+    # the edges of the positions that are not shared by exactly two triangles
+    corners = position_group[triangles]
+    edges = np.stack([corners, np.roll(corners, -1, axis=1)], axis=2).reshape(-1, 2)
+    edges.sort(axis=1)
+    edges = edges[edges[:, 0] != edges[:, 1]]
+    keys = np.sort(edges[:, 0] * len(first) + edges[:, 1])
+    head = np.flatnonzero(np.diff(keys, prepend=-1, append=-1))
+    odd = keys[head[:-1][np.diff(head) != 2]]
+    locked_position[odd // len(first)] = True
+    locked_position[odd % len(first)] = True
+    locked = locked_position[position_group]
+
+    # the vertices of the submesh borders
+    if len(submesh_of_triangle) and submesh_of_triangle.max() > 0:
+        submesh_of_corner = np.repeat(submesh_of_triangle, 3)
+        lowest = np.full(len(positions), np.iinfo(np.int64).max)
+        highest = np.full(len(positions), -1)
+        np.minimum.at(lowest, triangles.ravel(), submesh_of_corner)
+        np.maximum.at(highest, triangles.ravel(), submesh_of_corner)
+        locked |= (highest >= 0) & (lowest != highest)
+    return locked
+
+
+def dominant_joints(vb: vertex_buffer.VertexBuffer) -> np.ndarray:
+    """
+    (N,) the joint of the largest weight. 0 without skinning.
+    """
+    if not vb.skinning:
+        return np.zeros(vb.vertex_count, np.int64)
+    skin = vertex_buffer.as_array(vb.skinning.skinning, vb.skinning.get_dtype())
+    heaviest = np.argmax(skin["weights"], axis=1)
+    return skin["joints"][np.arange(len(skin)), heaviest].astype(np.int64)
+
+
+class Clustering:
+    """
+    the vertices of a triangle range, for the clustering of each level.
+    the levels are from fine to coarse.
+    """
+
+    def __init__(
+        self,
+        positions: np.ndarray,
+        quadrics: np.ndarray,
+        area: np.ndarray,
+        locked: np.ndarray,
+        group: np.ndarray,
+        triangles: np.ndarray,
+    ) -> None:
+        self.triangles = triangles
+        self.used, local = np.unique(triangles, return_inverse=True)
+        self.local = local.reshape(-1, 3)
+        self.positions = positions[self.used]
+        self.quadrics = quadrics[self.used]
+        self.area = area[self.used]
+        self.free = ~locked[self.used]
+        origin = self.positions.min(axis=0) if len(self.used) else np.zeros(3)
+        self.offsets = self.positions - origin
+        self.extent = float(self.offsets.max()) if len(self.used) else 0.0
+        self.keys = np.empty((len(self.used), 4), np.int64)
+        # a locked vertex is a cluster by itself
+        self.keys[:, 3] = np.where(
+            self.free, group[self.used], np.arange(len(self.used))
+        )
+        # the cell and the triangles of the previous level.
+        # the first is about the edge length, where the count starts to decrease
+        self.cell = float(np.sqrt(self.area.sum() / max(len(triangles), 1)))
+        self.cell = min(max(self.cell, self.extent / 65536), self.extent)
+        self.count = len(triangles)
+
+    def _keys(self, cell: float) -> np.ndarray:
+        self.keys[:, :3] = np.where(
+            self.free[:, None], np.floor(self.offsets * (1 / cell)), -1
+        )
+        return self.keys.view(np.uint64)
+
+    def _alive(self, cluster: np.ndarray) -> np.ndarray:
+        t = cluster[self.local]
+        return (t[:, 0] != t[:, 1]) & (t[:, 1] != t[:, 2]) & (t[:, 2] != t[:, 0])
+
+    def collapse(self, target: int, iterations: int = 16) -> Tuple[np.ndarray, float]:
+        """
+        => the clustered triangles (as few as target if the locked vertices allow)
+        and the error. the triangle order is kept.
+        """
+        if len(self.triangles) <= target or self.extent <= 0:
+            return self.triangles, 0.0
+
+        # the smallest cell for the target. the count decreases with the cell.
+        # the search counts by the hash of the keys
+        low, high = self.cell, self.extent * 2
+        cell, count = self.cell, self.count
+        for _ in range(iterations):
+            # about proportional to cell ** -2. bisect out of the bracket
+            cell *= np.sqrt(count / max(target, 1))
+            if not low < cell < high:
+                cell = np.sqrt(low * high)
+            count = np.count_nonzero(self._alive(weld._hash_rows(self._keys(cell))))
+            if count <= target:
+                high = cell
+                self.count = count
+                if count >= target * 0.95:
+                    break
+            else:
+                low = cell
+        self.cell = high
+        cluster, _ = weld.unique_rows(self._keys(high))
+
+        # the member of the least cluster quadric error
+        cluster_count = int(cluster.max()) + 1
+        cluster_quadrics = np.empty((cluster_count, len(_ROW)))
+        for k in range(len(_ROW)):
+            cluster_quadrics[:, k] = np.bincount(
+                cluster, self.quadrics[:, k], cluster_count
+            )
+        cost = evaluate(cluster_quadrics[cluster], self.positions)
+        order = np.argsort(cost)
+        order = order[np.argsort(cluster[order], kind="stable")]
+        head = np.ones(len(order), bool)
+        head[1:] = cluster[order][1:] != cluster[order][:-1]
+        representative = np.empty(cluster_count, np.int64)
+        representative[cluster[order[head]]] = order[head]
+        target_vertex = representative[cluster]
+
+        moved = np.flatnonzero(target_vertex != np.arange(len(self.used)))
+        moved = moved[self.area[moved] > 0]
+        error = 0.0
+        if len(moved):
+            squared = evaluate(
+                self.quadrics[moved], self.positions[target_vertex[moved]]
+            )
+            error = float(np.sqrt(max((squared / self.area[moved]).max(), 0.0)))
+
+        source = self.local[self._alive(cluster)]
+        clustered = target_vertex[source]
+        # the folded slivers face against the source triangle
+        facing = np.einsum(
+            "ti,ti->t",
+            _normals(self.positions, clustered),
+            _normals(self.positions, source),
+        )
+        clustered = self.used[clustered[facing > 0]]
+        # the same triangle from the clusters of different triangles
+        _, first = weld.unique_rows(np.sort(clustered, axis=1).view(np.uint64))
+        return clustered[np.sort(first)], error
+
+
+def generate_lods(
+    vb: vertex_buffer.VertexBuffer,
+    levels: int,
+    ratio: float = 0.5,
+    max_error: float = 0.01,
+    *,
+    optimize_indices: bool = True,
+) -> Tuple[vertex_buffer.VertexBuffer, LodStats]:
+    """
+    up to levels Lod of ratio ** level triangles of each submesh.
+    stops at the level over max_error (relative to the bounding radius) or
+    that does not reduce. each level is clustered from the mesh, not the previous.
+
+    run last. the Lod indices are into the vertices of vb and the vertex order
+    must not change after this.
+    """
+    geometry = vertex_buffer.as_array(vb.geometry, vertex_buffer.GEOMETRY_DTYPE)
+    positions = geometry["position"].astype(np.float64)
+    indices = vertex_buffer.as_array(vb.indices.indices, vb.indices.get_dtype())
+    submeshes = vb.submeshes or [vertex_buffer.SubMesh(len(indices))]
+
+    ranges = []
+    begin = 0
+    for s in submeshes:
+        ranges.append(
+            indices[begin : begin + s.draw_count].reshape(-1, 3).astype(np.int64)
+            + s.base_vertex
+        )
+        begin += s.draw_count
+    triangles = np.concatenate(ranges) if ranges else np.zeros((0, 3), np.int64)
+    stats = LodStats([len(triangles)], [0.0])
+    if len(triangles) == 0 or levels <= 0:
+        return vb, stats
+
+    quadrics, area = vertex_quadrics(positions, triangles)
+    locked = locked_vertices(
+        vb, triangles, np.repeat(np.arange(len(ranges)), [len(r) for r in ranges])
+    )
+    group = dominant_joints(vb)
+    used = positions[np.unique(triangles)]
+    radius = 0.5 * float(np.linalg.norm(used.max(axis=0) - used.min(axis=0)))
+
+    clusterings = [
+        Clustering(positions, quadrics, area, locked, group, range_triangles)
+        for range_triangles in ranges
+    ]
+    lods: List[vertex_buffer.Lod] = []
+    for level in range(1, levels + 1):
+        parts = []
+        error = 0.0
+        for clustering in clusterings:
+            clustered, range_error = clustering.collapse(
+                int(len(clustering.triangles) * ratio**level)
+            )
+            parts.append(clustered)
+            error = max(error, range_error)
+        count = sum(len(part) for part in parts)
+        if error > max_error * radius or count > stats.triangles[-1] * 0.9:
+            break
+        if optimize_indices:
+            parts = [
+                optimize.optimize_triangles(positions, part, vb.vertex_count)
+                for part in parts
+            ]
+        flat = np.concatenate(
+            [(part - s.base_vertex).ravel() for s, part in zip(submeshes, parts)]
+        )
+        lods.append(
+            vertex_buffer.Lod(
+                error,
+                vertex_buffer.Indices(
+                    vb.indices.stride,
+                    memoryview(flat.astype(vb.indices.get_dtype())),
+                ),
+                (
+                    [
+                        s._replace(draw_count=len(part) * 3)
+                        for s, part in zip(submeshes, parts)
+                    ]
+                    if vb.submeshes
+                    else None
+                ),
+            )
+        )
+        stats.triangles.append(count)
+        stats.errors.append(error)
+    return vb._replace(lods=lods or None), stats
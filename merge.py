@@ -0,0 +1,170 @@
+"""
+merge the meshes into fewer meshes with a SubMesh for each material.
+"""
+
+from typing import List, NamedTuple, Dict, Optional, Iterable, Tuple
+import numpy as np
+from . import vertex_buffer
+from . import morph
+
+
+class MergeStats(NamedTuple):
+    meshes_before: int
+    meshes_after: int
+    draw_calls_before: int
+    draw_calls_after: int
+
+    def __str__(self) -> str:
+        return (
+            f"merge: {self.meshes_before} => {self.meshes_after} meshes, "
+            f"{self.draw_calls_before} => {self.draw_calls_after} draw calls"
+        )
+
+
+def _draw_calls(vb: vertex_buffer.VertexBuffer) -> int:
+    return len(vb.submeshes) if vb.submeshes else 1
+
+
+class _Group:
+    """
+    the meshes that share the stream layout and the skeleton.
+    """
+
+    def __init__(self, vb: vertex_buffer.VertexBuffer) -> None:
+        self.meshes = [vb]
+        self.joints: Optional[Dict[str, vertex_buffer.Joint]] = None
+        self.influences = 0
+        if vb.skinning:
+            self.joints = {joint.name: joint for joint in vb.skinning.joints}
+            self.influences = vb.skinning.influences
+
+    def try_add(self, vb: vertex_buffer.VertexBuffer) -> bool:
+        if (self.joints is None) != (vb.skinning is None):
+            return False
+        if vb.skinning:
+            if vb.skinning.influences != self.influences:
+                return False
+            # a joint name of another skeleton
+            for joint in vb.skinning.joints:
+                if self.joints.get(joint.name, joint) != joint:
+                    return False
+            for joint in vb.skinning.joints:
+                self.joints.setdefault(joint.name, joint)
+        self.meshes.append(vb)
+        return True
+
+    def merge(self) -> vertex_buffer.VertexBuffer:
+        if len(self.meshes) == 1:
+            return self.meshes[0]
+
+        # the palette. joints in the order of first appearance
+        palette: List[vertex_buffer.Joint] = []
+        palette_map: Dict[str, int] = {}
+        if self.joints is not None:
+            for vb in self.meshes:
+                for joint in vb.skinning.joints:
+                    if joint.name not in palette_map:
+                        palette_map[joint.name] = len(palette)
+                        palette.append(joint)
+
+        materials: List[Optional[str]] = []
+        material_triangles: List[List[np.ndarray]] = []
+        geometries = []
+        colortexs = []
+        skins = []
+        morphs = []
+        base_vertex = 0
+        for vb in self.meshes:
+            morphs.append((base_vertex, vb.morphs))
+            geometries.append(
+                vertex_buffer.as_array(vb.geometry, vertex_buffer.GEOMETRY_DTYPE)
+            )
+            colortexs.append(
+                vertex_buffer.as_array(vb.colortex, vertex_buffer.COLORTEX_DTYPE)
+            )
+            if vb.skinning:
+                skin = vertex_buffer.as_array(
+                    vb.skinning.skinning, vb.skinning.get_dtype()
+                ).copy()
+                remap = np.array(
+                    [palette_map[joint.name] for joint in vb.skinning.joints] or [0],
+                    np.uint16,
+                )
+                skin["joints"] = remap[skin["joints"]]
+                skins.append(skin)
+
+            indices = vertex_buffer.as_array(
+                vb.indices.indices, vb.indices.get_dtype()
+            ).astype(np.int64)
+            begin = 0
+            for s in vb.submeshes or [vertex_buffer.SubMesh(len(indices))]:
+                name = vb.materials[s.material] if vb.materials else None
+                if name not in materials:
+                    materials.append(name)
+                    material_triangles.append([])
+                material_triangles[materials.index(name)].append(
+                    indices[begin : begin + s.draw_count] + base_vertex
+                )
+                begin += s.draw_count
+            base_vertex += vb.vertex_count
+
+        index_list = [np.concatenate(triangles) for triangles in material_triangles]
+        indices = np.concatenate(index_list)
+        index_stride = 4 if base_vertex > 65535 else 2
+        skinning = None
+        if skins:
+            skinning = vertex_buffer.Skinning(
+                palette, memoryview(np.concatenate(skins)), self.influences
+            )
+        return vertex_buffer.VertexBuffer(
+            vertex_buffer.Indices(
+                index_stride,
+                memoryview(
+                    indices.astype(np.uint32 if index_stride == 4 else np.uint16)
+                ),
+            ),
+            base_vertex,
+            memoryview(np.concatenate(geometries)),
+            memoryview(np.concatenate(colortexs)),
+            skinning,
+            [
+                vertex_buffer.SubMesh(draw_count=len(i), material=m)
+                for m, i in enumerate(index_list)
+            ],
+            materials,
+            morph.concat_morphs(morphs),
+        )
+
+
+def merge_meshes(
+    meshes: Iterable[vertex_buffer.VertexBuffer],
+) -> Tuple[List[vertex_buffer.VertexBuffer], MergeStats]:
+    """
+    the meshes that have the same stream layout (skinned or not) and compatible
+    skeletons (the same Joint for the same name) are merged into one mesh.
+    the joints are remapped into the union of the palettes.
+    the triangles of a material are one SubMesh, in the order of the meshes.
+
+    all meshes are kept in memory. before split.split_by_vertex_count.
+    """
+    groups: List[_Group] = []
+    meshes_before = 0
+    draw_calls_before = 0
+    for vb in meshes:
+        if vb.submeshes and any(s.vertex_count is not None for s in vb.submeshes):
+            raise ValueError("split mesh")
+        meshes_before += 1
+        draw_calls_before += _draw_calls(vb)
+        for group in groups:
+            if group.try_add(vb):
+                break
+        else:
+            groups.append(_Group(vb))
+
+    merged = [group.merge() for group in groups]
+    return merged, MergeStats(
+        meshes_before,
+        len(merged),
+        draw_calls_before,
+        sum(_draw_calls(vb) for vb in merged),
+    )
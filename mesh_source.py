@@ -0,0 +1,184 @@
+"""
+bpy independent arrays of a triangulated mesh, the input of the extraction.
+
+vertex.mesh_source reads a bpy.types.Mesh, synthetic.py generates them.
+to_vertex_buffer is the extraction of vertex.from_mesh.
+"""
+
+from typing import NamedTuple, Optional, List, Iterable, Iterator, Tuple
+import numpy as np
+from . import vertex_buffer
+from . import skin
+from . import tangent
+from . import process
+from . import profiling
+from . import pipeline
+
+
+class MeshWeights(NamedTuple):
+    """
+    the sparse vertex group weights. skin.top_k
+    """
+
+    vertices: np.ndarray
+    groups: np.ndarray
+    weights: np.ndarray
+    group_to_joint: np.ndarray  # vertex group => joint. negative is not a joint
+    joints: List[vertex_buffer.Joint]
+
+
+class MeshSource(NamedTuple):
+    """
+    a loop is a face corner. the triangles refer to the loops.
+    in the export space.
+    """
+
+    name: str
+    positions: np.ndarray  # (vertices, 3) float32
+    vertex_normals: np.ndarray  # (vertices, 3)
+    loop_vertex: np.ndarray  # (loops,) vertex index
+    triangles: np.ndarray  # (triangles, 3) loop index
+    triangle_normals: np.ndarray  # (triangles, 3)
+    use_smooth: np.ndarray  # (triangles,) vertex_normals, else triangle_normals
+    uv: Optional[np.ndarray] = None  # (loops, 2)
+    tangents: Optional[np.ndarray] = None  # (loops, 4). given, else computed
+    triangle_materials: Optional[np.ndarray] = None  # (triangles,) index of materials
+    materials: Optional[List[Optional[str]]] = None
+    weights: Optional[MeshWeights] = None
+    morphs: Optional[List[vertex_buffer.MorphTarget]] = None  # of the loops
+
+    def get_corner_count(self) -> int:
+        return len(self.loop_vertex)
+
+
+def to_vertex_buffer(
+    source: MeshSource,
+    *,
+    influences: int = 4,
+    weight_threshold: float = 0.0,
+    tangents: bool = True,
+    base: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]] = None,
+    profiler: Optional[profiling.Profiler] = None,
+) -> vertex_buffer.VertexBuffer:
+    """
+    a vertex for each loop.
+    tangents: tangent.compute_tangents if the source has uv and no tangents.
+    base: (geometry, colortex, triangle loops) already filled from the mesh,
+    instead of the source arrays. vertex.from_mesh(use_foreach_get=False)
+    """
+    loop_count = len(source.loop_vertex)
+    with profiling.phase(profiler, "extract", source.name):
+        if base:
+            geometry, colortex, tri_loops = base
+        else:
+            tri_loops = np.asarray(source.triangles, np.uint32).reshape(-1)
+
+            # a loop shared by some triangles takes the last one
+            loops, last = np.unique(tri_loops[::-1], return_index=True)
+            tri = (len(tri_loops) - 1 - last) // 3
+            vertex_index = np.asarray(source.loop_vertex)[loops]
+
+            geometry = np.zeros(loop_count, vertex_buffer.GEOMETRY_DTYPE)
+            geometry["position"][loops] = source.positions[vertex_index]
+            geometry["normal"][loops] = np.where(
+                np.asarray(source.use_smooth, bool)[tri, None],
+                source.vertex_normals[vertex_index],
+                source.triangle_normals[tri],
+            )
+
+            colortex = np.zeros(loop_count, vertex_buffer.COLORTEX_DTYPE)
+            if source.uv is not None:
+                colortex["tex0"][loops] = source.uv[loops]
+
+        index_stride = 4 if loop_count > 65535 else 2
+        indices = tri_loops.astype(np.uint32 if index_stride == 4 else np.uint16)
+        profiling.add_bytes(
+            profiler, geometry.nbytes + colortex.nbytes + indices.nbytes
+        )
+
+    if source.tangents is not None:
+        geometry["tangent"] = source.tangents
+    elif tangents and source.uv is not None:
+        with profiling.phase(profiler, "tangents", source.name):
+            geometry["tangent"] = tangent.compute_tangents(
+                geometry["position"], geometry["normal"], colortex["tex0"], indices
+            )
+
+    submeshes = None
+    if source.materials:
+        # a SubMesh for each material slot
+        if source.triangle_materials is not None:
+            tri_material = np.clip(
+                source.triangle_materials, 0, len(source.materials) - 1
+            )
+        else:
+            tri_material = np.zeros(len(source.triangles), np.int32)
+        order = np.argsort(tri_material, kind="stable")
+        indices = indices.reshape(-1, 3)[order].reshape(-1)
+        slots, counts = np.unique(tri_material, return_counts=True)
+        submeshes = [
+            vertex_buffer.SubMesh(draw_count=int(count) * 3, material=int(slot))
+            for slot, count in zip(slots, counts)
+        ]
+
+    skinning = None
+    if source.weights:
+        with profiling.phase(profiler, "skin", source.name):
+            w = source.weights
+            vertex_skin, stats = skin.top_k(
+                w.vertices,
+                w.groups,
+                w.weights,
+                len(source.positions),
+                w.group_to_joint,
+                influences,
+                weight_threshold,
+            )
+            if stats.truncated:
+                print(f"{source.name}: {stats}")
+            skinning = vertex_buffer.Skinning(
+                w.joints,
+                memoryview(vertex_skin[source.loop_vertex]),
+                influences,
+            )
+            profiling.add_bytes(profiler, skinning.skinning.nbytes)
+
+    return vertex_buffer.VertexBuffer(
+        vertex_buffer.Indices(index_stride, memoryview(indices)),
+        loop_count,
+        memoryview(geometry),
+        memoryview(colortex),
+        skinning,
+        submeshes,
+        source.materials,
+        source.morphs,
+    )
+
+
+def iter_sources(
+    sources: Iterable[MeshSource],
+    *,
+    options: Optional[process.ProcessOptions] = None,
+    profiler: Optional[profiling.Profiler] = None,
+    workers: int = 0,
+) -> Iterator[vertex_buffer.VertexBuffer]:
+    """
+    vertex.iter_objects for the sources, for serialization.Serializer to stream them.
+    workers: pipeline.imap_ordered
+    """
+
+    def convert(source: MeshSource) -> vertex_buffer.VertexBuffer:
+        with profiling.phase(profiler, "convert", source.name):
+            vb = to_vertex_buffer(
+                source,
+                influences=options.influences if options else 4,
+                weight_threshold=options.weight_threshold if options else 0.0,
+                tangents=options.tangents != "none" if options else True,
+                profiler=profiler,
+            )
+            if options:
+                with profiling.phase(profiler, "process"):
+                    vb = process.process_mesh(vb, options, profiler)
+        return vb
+
+    return pipeline.imap_ordered(convert, sources, workers)
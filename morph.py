@@ -0,0 +1,223 @@
+"""
+sparse morph targets.
+
+a target keeps only the vertices whose position, normal or tangent delta is
+over the epsilon. the dense deltas of a shape are transient, one shape at a time.
+"""
+
+from typing import List, Optional, Tuple, TYPE_CHECKING
+import numpy as np
+from . import vertex_buffer
+from . import weld
+
+if TYPE_CHECKING:
+    from . import serialization
+
+
+def _normalize(v: np.ndarray) -> np.ndarray:
+    length = np.sqrt(np.einsum("...i,...i->...", v, v))[..., None]
+    return np.divide(v, length, out=np.zeros_like(v), where=length > 1e-20)
+
+
+def loop_normals(
+    positions: np.ndarray,
+    loop_vertex: np.ndarray,
+    triangles: np.ndarray,
+    use_smooth: np.ndarray,
+) -> np.ndarray:
+    """
+    positions (vertices, 3), loop_vertex (loops,), triangles (T, 3) of loops,
+    use_smooth (T,) => (loops, 3).
+
+    smooth: the corner angle weighted vertex normal. flat: the triangle normal.
+    """
+    corners = loop_vertex[triangles]
+    p = positions[corners]
+    face = _normalize(np.cross(p[:, 1] - p[:, 0], p[:, 2] - p[:, 0]))
+    edges = _normalize(np.roll(p, -1, axis=1) - p)
+    angles = np.arccos(
+        np.clip(-np.einsum("tki,tki->tk", edges, np.roll(edges, 1, axis=1)), -1, 1)
+    )
+    weighted = (angles[:, :, None] * face[:, None, :]).reshape(-1, 3)
+    vertex_normal = np.empty((len(positions), 3), np.float32)
+    for c in range(3):
+        vertex_normal[:, c] = np.bincount(
+            corners.ravel(), weighted[:, c], len(positions)
+        )
+    vertex_normal = _normalize(vertex_normal)
+
+    result = np.zeros((len(loop_vertex), 3), np.float32)
+    smooth = triangles[use_smooth].ravel()
+    result[smooth] = vertex_normal[loop_vertex[smooth]]
+    flat = ~use_smooth
+    result[triangles[flat]] = face[flat, None, :]
+    return result
+
+
+def sparse_target(
+    name: str,
+    position: np.ndarray,
+    normal: np.ndarray,
+    tangent: Optional[np.ndarray] = None,
+    epsilon: float = 1e-5,
+) -> Optional[vertex_buffer.MorphTarget]:
+    """
+    dense (N, 3) deltas => MorphTarget. None if nothing changes.
+    """
+    changed = (np.abs(position) > epsilon).any(axis=1)
+    changed |= (np.abs(normal) > epsilon).any(axis=1)
+    if tangent is not None:
+        changed |= (np.abs(tangent) > epsilon).any(axis=1)
+    indices = np.flatnonzero(changed)
+    if len(indices) == 0:
+        return None
+    deltas = np.zeros(len(indices), vertex_buffer.MORPH_DTYPE)
+    deltas["position"] = position[indices]
+    deltas["normal"] = normal[indices]
+    if tangent is not None:
+        deltas["tangent"] = tangent[indices]
+    return vertex_buffer.MorphTarget(
+        name, memoryview(indices.astype(np.uint32)), memoryview(deltas)
+    )
+
+
+def get_arrays(target: vertex_buffer.MorphTarget) -> Tuple[np.ndarray, np.ndarray]:
+    return (
+        vertex_buffer.as_array(target.indices, np.dtype(np.uint32)),
+        vertex_buffer.as_array(target.deltas, vertex_buffer.MORPH_DTYPE),
+    )
+
+
+def take_morphs(
+    morphs: Optional[List[vertex_buffer.MorphTarget]],
+    src: np.ndarray,
+    vertex_count: int,
+) -> Optional[List[vertex_buffer.MorphTarget]]:
+    """
+    the new vertex i is the vertex src[i] of vertex_count. as weld.take_vertices.
+    """
+    if not morphs:
+        return morphs
+    result = []
+    for target in morphs:
+        indices, deltas = get_arrays(target)
+        lookup = np.full(vertex_count, -1, np.int64)
+        lookup[indices] = np.arange(len(indices))
+        k = lookup[src]
+        new = np.flatnonzero(k >= 0)
+        result.append(
+            target._replace(
+                indices=memoryview(new.astype(np.uint32)),
+                deltas=memoryview(deltas[k[new]]),
+            )
+        )
+    return result
+
+
+def concat_morphs(
+    parts: List[Tuple[int, Optional[List[vertex_buffer.MorphTarget]]]],
+) -> Optional[List[vertex_buffer.MorphTarget]]:
+    """
+    (base_vertex, morphs) of the concatenated meshes => the targets by name.
+    """
+    names: List[str] = []
+    indices: List[List[np.ndarray]] = []
+    deltas: List[List[np.ndarray]] = []
+    for base_vertex, morphs in parts:
+        for target in morphs or []:
+            if target.name not in names:
+                names.append(target.name)
+                indices.append([])
+                deltas.append([])
+            i = names.index(target.name)
+            target_indices, target_deltas = get_arrays(target)
+            indices[i].append(target_indices.astype(np.uint32) + base_vertex)
+            deltas[i].append(target_deltas)
+    if not names:
+        return None
+    return [
+        vertex_buffer.MorphTarget(
+            name,
+            memoryview(np.concatenate(i).astype(np.uint32)),
+            memoryview(np.concatenate(d)),
+        )
+        for name, i, d in zip(names, indices, deltas)
+    ]
+
+
+def quantize_deltas(
+    target: vertex_buffer.MorphTarget,
+) -> Tuple[np.ndarray, List["serialization.Attribute"]]:
+    """
+    snorm16 with decodeScale for each attribute. all zero attributes are dropped.
+    """
+    _, deltas = get_arrays(target)
+    fields = []
+    attributes = []
+    for name in vertex_buffer.MORPH_DTYPE.names:
+        values = deltas[name]
+        scale = np.abs(values).max(axis=0) if len(values) else np.zeros(3)
+        if not scale.any() and name != "position":
+            continue
+        scale = np.where(scale > 0, scale, 1).astype(np.float32)
+        fields.append((name, np.round(values / scale * 32767).astype("<i2")))
+        attributes.append(
+            {
+                "vertexAttribute": name,
+                "format": "snorm16",
+                "dimension": 3,
+                "decodeScale": scale.tolist(),
+            }
+        )
+    stream = np.empty(len(deltas), [(name, "<i2", (3,)) for name, _ in fields])
+    for name, values in fields:
+        stream[name] = values
+    return stream, attributes
+
+
+def morph_keys(
+    morphs: List[vertex_buffer.MorphTarget], vertex_count: int
+) -> np.ndarray:
+    """
+    (vertex_count,) uint64. a hash of the deltas of each vertex.
+    for weld.weld_vertices. 0 for the vertices without deltas.
+    """
+    keys = np.zeros(vertex_count, np.uint64)
+    for i, target in enumerate(morphs):
+        indices, deltas = get_arrays(target)
+        h = weld._hash_rows(weld._pack_rows([deltas])) ^ np.uint64(i + 1)
+        keys[indices] = (keys[indices] ^ h) * np.uint64(0x100000001B3)
+    return keys
+
+
+def _dense_deltas(target: vertex_buffer.MorphTarget, vertex_count: int) -> np.ndarray:
+    indices, deltas = get_arrays(target)
+    dense = np.zeros(vertex_count, vertex_buffer.MORPH_DTYPE)
+    dense[indices] = deltas
+    return dense
+
+
+def morph_rows(
+    morphs: List[vertex_buffer.MorphTarget], vertex_count: int
+) -> np.ndarray:
+    """
+    (vertex_count, targets) MORPH_DTYPE. the deltas of each vertex.
+    the exact morph_keys, for a collision.
+    """
+    rows = np.zeros((vertex_count, len(morphs)), vertex_buffer.MORPH_DTYPE)
+    for i, target in enumerate(morphs):
+        rows[:, i] = _dense_deltas(target, vertex_count)
+    return rows
+
+
+def same_deltas(
+    morphs: List[vertex_buffer.MorphTarget], vertex_count: int, other: np.ndarray
+) -> bool:
+    """
+    the vertex i has the same delta bytes as the vertex other[i] in all targets.
+    """
+    for target in morphs:
+        dense = _dense_deltas(target, vertex_count)
+        if dense.tobytes() != dense[other].tobytes():
+            return False
+    return True
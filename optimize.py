@@ -0,0 +1,205 @@
+"""
+post-transform vertex cache and overdraw optimization of the index buffer.
+
+the triangles are ordered in vertex fans along a space filling curve, and the
+clusters sorted for overdraw as in Tipsify: Sander, Nehab, Barczak. Fast
+Triangle Reordering for Vertex Locality and Reduced Overdraw. 2007.
+"""
+
+from typing import NamedTuple, Tuple, Iterable, Iterator
+import numpy as np
+from . import vertex_buffer
+from . import weld
+
+
+class CacheStats(NamedTuple):
+    acmr: float  # average cache miss ratio. transformed vertices / triangles
+    atvr: float  # average transform to vertex ratio. transformed vertices / vertices
+
+    def __str__(self) -> str:
+        return f"ACMR {self.acmr:.3f}, ATVR {self.atvr:.3f}"
+
+
+def simulate_fifo(
+    indices: np.ndarray, vertex_count: int, cache_size: int = 32
+) -> CacheStats:
+    tri_count = len(indices) // 3
+    if tri_count == 0 or vertex_count == 0:
+        return CacheStats(0, 0)
+    # the cache time stamp of each vertex. in cache while misses - stamp <= cache_size
+    stamp = [-cache_size - 1] * vertex_count
+    misses = 0
+    for v in indices.tolist():
+        if misses - stamp[v] > cache_size:
+            stamp[v] = misses
+            misses += 1
+    return CacheStats(misses / tri_count, misses / vertex_count)
+
+
+def _spread_bits(x: np.ndarray) -> np.ndarray:
+    """
+    21 bits => every third bit of 63
+    """
+    x = x & np.uint64(0x1FFFFF)
+    for shift, mask in (
+        (32, 0x1F00000000FFFF),
+        (16, 0x1F0000FF0000FF),
+        (8, 0x100F00F00F00F00F),
+        (4, 0x10C30C30C30C30C3),
+        (2, 0x1249249249249249),
+    ):
+        x = (x | (x << np.uint64(shift))) & np.uint64(mask)
+    return x
+
+
+def morton_codes(positions: np.ndarray) -> np.ndarray:
+    """
+    the z-order curve of the positions in their bounding box. (N,) uint64
+    """
+    if len(positions) == 0:
+        return np.zeros(0, np.uint64)
+    p = np.nan_to_num(positions.astype(np.float64))
+    lo = p.min(axis=0)
+    extent = max(float((p.max(axis=0) - lo).max()), 1e-30)
+    q = ((p - lo) * ((1 << 21) - 1) / extent).astype(np.uint64)
+    return (
+        _spread_bits(q[:, 0])
+        | (_spread_bits(q[:, 1]) << np.uint64(1))
+        | (_spread_bits(q[:, 2]) << np.uint64(2))
+    )
+
+
+def fan_order(
+    positions: np.ndarray,
+    triangles: np.ndarray,
+    vertex_count: int,
+    cluster_vertices: int = 256,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    triangles: (N, 3)
+
+    the vertices are visited along the z-order curve of their positions, and
+    each triangle is emitted in the fan of its first visited vertex. the fans
+    of the neighbour vertices share the vertices in the cache. a sort in numpy
+    instead of the tipsify loop.
+
+    returns (order, clusters)
+    order: the new triangle order.
+    clusters: start of each run of fans over cluster_vertices curve vertices.
+    """
+    if len(triangles) == 0:
+        return np.zeros(0, np.int64), np.zeros(0, np.int64)
+    rank = np.empty(vertex_count, np.int64)
+    rank[np.argsort(morton_codes(positions[:vertex_count]), kind="stable")] = np.arange(
+        vertex_count
+    )
+    fan = rank[triangles].min(axis=1)
+    order = np.argsort(fan, kind="stable")
+    block = fan[order] // cluster_vertices
+    clusters = np.flatnonzero(np.diff(block, prepend=-1))
+    return order, clusters
+
+
+def sort_clusters(
+    positions: np.ndarray, triangles: np.ndarray, clusters: np.ndarray
+) -> np.ndarray:
+    """
+    overdraw. draw the clusters facing outward from the mesh center first.
+
+    triangles: (N, 3) in fan_order.
+    returns the new triangle order.
+    """
+    if len(triangles) == 0:
+        return np.zeros(0, np.int64)
+    p = positions[triangles]
+    # area weighted
+    normal = np.cross(p[:, 1] - p[:, 0], p[:, 2] - p[:, 0])
+    area = np.linalg.norm(normal, axis=1)
+    centroid = p.mean(axis=1)
+    center = (centroid * area[:, None]).sum(axis=0) / max(area.sum(), 1e-30)
+
+    cluster_normal = np.add.reduceat(normal, clusters)
+    cluster_area = np.add.reduceat(area, clusters)
+    cluster_centroid = np.add.reduceat(centroid * area[:, None], clusters)
+    cluster_centroid /= np.maximum(cluster_area, 1e-30)[:, None]
+    cluster_normal /= np.maximum(np.linalg.norm(cluster_normal, axis=1), 1e-30)[:, None]
+    facing = ((cluster_centroid - center) * cluster_normal).sum(axis=1)
+
+    sizes = np.diff(np.append(clusters, len(triangles)))
+    cluster_order = np.argsort(-facing, kind="stable")
+    starts = clusters[cluster_order]
+    return np.concatenate(
+        [np.arange(s, s + n) for s, n in zip(starts, sizes[cluster_order])]
+    )
+
+
+def optimize_triangles(
+    positions: np.ndarray,
+    triangles: np.ndarray,
+    vertex_count: int,
+    overdraw: bool = True,
+    cluster_vertices: int = 256,
+) -> np.ndarray:
+    """
+    fan_order (and sort_clusters) of (N, 3). returns the reordered triangles.
+    """
+    order, clusters = fan_order(positions, triangles, vertex_count, cluster_vertices)
+    triangles = triangles[order]
+    if overdraw:
+        triangles = triangles[sort_clusters(positions, triangles, clusters)]
+    return triangles
+
+
+def optimize_indices(
+    vb: vertex_buffer.VertexBuffer,
+    *,
+    overdraw: bool = True,
+    cache_size: int = 32,
+) -> Tuple[vertex_buffer.VertexBuffer, CacheStats]:
+    """
+    reorder the triangles for the vertex cache (and overdraw),
+    then reorder the vertices by first use and remap the streams.
+    the stats are simulate_fifo of cache_size over the remapped indices.
+    """
+    if vb.submeshes and any(s.vertex_count is not None for s in vb.submeshes):
+        raise ValueError("split mesh")
+    indices = vertex_buffer.as_array(vb.indices.indices, vb.indices.get_dtype())
+    geometry = vertex_buffer.as_array(vb.geometry, vertex_buffer.GEOMETRY_DTYPE)
+    triangles = indices.reshape(-1, 3).astype(np.int64)
+    # the material ranges are reordered each
+    ranges = []
+    begin = 0
+    for s in vb.submeshes or [vertex_buffer.SubMesh(len(indices))]:
+        ranges.append(triangles[begin // 3 : (begin + s.draw_count) // 3])
+        begin += s.draw_count
+    triangles = np.concatenate(
+        [
+            optimize_triangles(
+                geometry["position"],
+                range_triangles,
+                vb.vertex_count,
+                overdraw,
+            )
+            for range_triangles in ranges
+        ]
+    ).reshape(-1, 3)
+
+    # vertex fetch order
+    flat = triangles.ravel()
+    used, first = np.unique(flat, return_index=True)
+    used = used[np.argsort(first)]
+    remap = np.empty(vb.vertex_count, np.int64)
+    remap[used] = np.arange(len(used))
+
+    indices = remap[flat]
+    optimized = weld.take_vertices(vb, used, indices)
+    return optimized, simulate_fifo(indices, optimized.vertex_count, cache_size)
+
+
+def optimize_meshes(
+    meshes: Iterable[vertex_buffer.VertexBuffer], **kw
+) -> Iterator[vertex_buffer.VertexBuffer]:
+    for i, vb in enumerate(meshes):
+        optimized, stats = optimize_indices(vb, **kw)
+        print(f"mesh{i}: {stats}")
+        yield optimized
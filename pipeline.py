@@ -0,0 +1,47 @@
+"""
+ordered map on a thread pool with backpressure.
+
+the items are produced on the calling thread (bpy is main thread only), and
+converted on the pool while the next ones are read.
+"""
+
+from typing import Callable, Iterable, Iterator, TypeVar, Deque, Optional
+import collections
+import concurrent.futures
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+def imap_ordered(
+    fn: Callable[[T], R],
+    items: Iterable[T],
+    workers: int,
+    max_pending: Optional[int] = None,
+) -> Iterator[R]:
+    """
+    fn(item) for each item on workers threads. the results are in the order of items.
+
+    at most max_pending (2 * workers) items are in flight. the next item is
+    taken when the consumer takes a result, so the memory is bounded.
+    workers 0 is fn on the calling thread.
+    """
+    if not workers:
+        for item in items:
+            yield fn(item)
+        return
+
+    max_pending = max_pending or workers * 2
+    with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+        pending: Deque[concurrent.futures.Future] = collections.deque()
+        try:
+            for item in items:
+                pending.append(executor.submit(fn, item))
+                if len(pending) >= max_pending:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            # an error or the consumer stopped
+            for future in pending:
+                future.cancel()
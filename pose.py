@@ -0,0 +1,107 @@
+"""
+bpy: sample the actions of an armature into animation.AnimationClip.
+
+the scene is evaluated once per frame, and the matrices of all pose bones are
+read by one foreach_get.
+"""
+
+from typing import List, Iterator, Optional, Tuple
+import bpy
+import mathutils
+import numpy as np
+from . import animation
+
+
+def get_bones(armature: bpy.types.Armature) -> Tuple[List[str], List[int]]:
+    """
+    names and parents in the order of armature.bones, as pose.bones.
+    """
+    names = [bone.name for bone in armature.bones]
+    index = {name: i for i, name in enumerate(names)}
+    parents = [
+        index[bone.parent.name] if bone.parent else -1 for bone in armature.bones
+    ]
+    return names, parents
+
+
+def _fcurves(action: bpy.types.Action) -> Iterator[bpy.types.FCurve]:
+    if hasattr(action, "layers") and action.layers:
+        # slotted actions (4.4)
+        for layer in action.layers:
+            for strip in layer.strips:
+                for channelbag in strip.channelbags:
+                    yield from channelbag.fcurves
+    else:
+        yield from action.fcurves
+
+
+def iter_actions(armatureOb: bpy.types.Object) -> Iterator[bpy.types.Action]:
+    """
+    the actions that have a fcurve of a bone of the armature.
+    """
+    bones = armatureOb.data.bones
+    for action in bpy.data.actions:
+        for fcurve in _fcurves(action):
+            path = fcurve.data_path
+            if path.startswith('pose.bones["'):
+                name = path[len('pose.bones["') : path.find('"]')]
+                if name in bones:
+                    yield action
+                    break
+
+
+def sample_action(
+    armatureOb: bpy.types.Object,
+    action: bpy.types.Action,
+    matrix: mathutils.Matrix,
+    frame_range: Optional[Tuple[int, int]] = None,
+) -> animation.AnimationClip:
+    """
+    the world matrices of all bones for each frame. matrix is the export matrix.
+    the action and the current frame are restored.
+    """
+    scene = bpy.context.scene
+    start, end = frame_range or (int(round(x)) for x in action.frame_range)
+    frame_count = end - start + 1
+    pose_bones = armatureOb.pose.bones
+    bone_count = len(pose_bones)
+    names, parents = get_bones(armatureOb.data)
+
+    animation_data = armatureOb.animation_data or armatureOb.animation_data_create()
+    prev_action = animation_data.action
+    prev_frame = scene.frame_current
+    matrices = np.empty((frame_count, bone_count * 16), np.float32)
+    try:
+        animation_data.action = action
+        for i in range(frame_count):
+            scene.frame_set(start + i)
+            pose_bones.foreach_get("matrix", matrices[i])
+    finally:
+        animation_data.action = prev_action
+        scene.frame_set(prev_frame)
+
+    # PoseBone.matrix is in the armature space. foreach_get is column major
+    armature_space = matrices.reshape(frame_count, bone_count, 4, 4).transpose(
+        0, 1, 3, 2
+    )
+    to_export = np.array(matrix @ armatureOb.matrix_world, np.float64)
+    return animation.AnimationClip(
+        action.name,
+        scene.render.fps / scene.render.fps_base,
+        names,
+        parents,
+        to_export @ armature_space,
+    )
+
+
+def sample_armatures(
+    armatures: List[bpy.types.Object], matrix: mathutils.Matrix
+) -> List[animation.AnimationClip]:
+    """
+    each action of each armature.
+    """
+    return [
+        sample_action(armatureOb, action, matrix)
+        for armatureOb in armatures
+        for action in iter_actions(armatureOb)
+    ]
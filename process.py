@@ -0,0 +1,108 @@
+"""
+the per mesh processing after the extraction.
+"""
+
+from typing import NamedTuple, Optional
+from . import vertex_buffer
+from . import weld
+from . import optimize
+from . import split
+from . import lod
+from . import profiling
+
+
+class ProcessOptions(NamedTuple):
+    """
+    the per mesh export options. also a part of the cache key.
+    """
+
+    # extraction
+    influences: int = 4  # joints per vertex
+    weight_threshold: float = 0.0  # drop the joints lighter than this of the vertex
+    tangents: str = "compute"  # none, compute (tangent.py) or blender (calc_tangents)
+    validate_tangents: bool = False  # print compute vs blender
+    use_morphs: bool = True  # shape keys and glTF targets
+    morph_epsilon: float = 1e-5  # the smallest delta of a morph target vertex
+    # process_mesh
+    use_weld: bool = False
+    use_optimize_indices: bool = True  # acmr and atvr in the profile report
+    use_split_u16: bool = False
+    palette_size: int = 0  # joints per submesh. 0 is no limit
+    lod_levels: int = 0  # coarser index buffers
+    lod_ratio: float = 0.5  # the triangles of a level / the previous
+    lod_max_error: float = 0.01  # relative to the bounding radius
+
+    def validate(self):
+        """
+        ValueError for the options that can not be exported.
+        """
+        if self.palette_size and self.palette_size < 3 * self.influences:
+            # a triangle can refer to 3 * influences joints
+            raise ValueError(
+                f"palette_size {self.palette_size} is less than 3 x influences"
+                f" ({3 * self.influences})"
+            )
+
+
+def split_mesh(
+    vb: vertex_buffer.VertexBuffer, options: ProcessOptions
+) -> vertex_buffer.VertexBuffer:
+    vertex_limit = 65535 if options.use_split_u16 else None
+    if options.palette_size:
+        options.validate()
+        return split.split_by_joint_palette(vb, options.palette_size, vertex_limit)
+    if vertex_limit:
+        return split.split_by_vertex_count(vb, vertex_limit)
+    return vb
+
+
+def lod_mesh(
+    vb: vertex_buffer.VertexBuffer,
+    options: ProcessOptions,
+    profiler: Optional[profiling.Profiler] = None,
+) -> vertex_buffer.VertexBuffer:
+    """
+    the levels, the triangles of the last level / the mesh and its error are
+    the stats of the innermost phase of profiler.
+    """
+    if not options.lod_levels:
+        return vb
+    vb, stats = lod.generate_lods(
+        vb,
+        options.lod_levels,
+        options.lod_ratio,
+        options.lod_max_error,
+        optimize_indices=options.use_optimize_indices,
+    )
+    profiling.add_stats(
+        profiler,
+        lod_levels=len(stats.triangles) - 1,
+        lod_triangles=stats.triangles[-1] / max(stats.triangles[0], 1),
+        lod_error=stats.errors[-1],
+    )
+    return vb
+
+
+def process_mesh(
+    vb: vertex_buffer.VertexBuffer,
+    options: ProcessOptions,
+    profiler: Optional[profiling.Profiler] = None,
+) -> vertex_buffer.VertexBuffer:
+    """
+    weld => optimize => split (u16 and joint palette) => lod.
+    the order of the export operator.
+    """
+    if options.use_weld:
+        with profiling.phase(profiler, "weld"):
+            vb = weld.weld_vertices(vb)
+    if options.use_optimize_indices:
+        with profiling.phase(profiler, "optimize"):
+            vb, stats = optimize.optimize_indices(vb)
+            profiling.add_stats(profiler, acmr=stats.acmr, atvr=stats.atvr)
+    if options.use_split_u16 or options.palette_size:
+        with profiling.phase(profiler, "split"):
+            vb = split_mesh(vb, options)
+    if options.lod_levels:
+        with profiling.phase(profiler, "lod"):
+            vb = lod_mesh(vb, options, profiler)
+    return vb
@@ -0,0 +1,285 @@
+"""
+per phase instrumentation of the export.
+
+a Phase is the wall time, the allocations (tracemalloc, optional), the bytes
+produced and the stats (add_stats) of a step for an object. phases nest. the
+object of a nested phase is the one of the enclosing phase unless given.
+
+    with profiling.Profiler(trace_allocations=True) as profiler:
+        with profiling.phase(profiler, "extract", ob.name):
+            ...
+            profiling.add_bytes(profiler, vb_bytes)
+    print("\\n".join(profiling.format_report(profiler.report())))
+    profiling.write_chrome_trace(path, [("export", profiler.phases)])
+
+bpy independent.
+"""
+
+from typing import TypedDict, NamedTuple, List, Optional, Dict, Tuple, Iterable
+import contextlib
+import json
+import pathlib
+import threading
+import time
+import tracemalloc
+
+
+class Phase(NamedTuple):
+    name: str
+    object: str  # "" is the whole export
+    start: float  # time.perf_counter. system wide, for the phases of the jobs
+    seconds: float
+    allocated: int  # peak traced bytes over the start. 0 unless trace_allocations
+    bytes: int  # produced. add_bytes
+    thread: int
+    stats: Dict[str, float]  # add_stats
+
+
+class PhaseReport(TypedDict):
+    name: str
+    object: str
+    count: int
+    seconds: float
+    allocated: int  # the max of the phases
+    bytes: int
+    stats: Dict[str, float]  # the mean of the phases that have it
+
+
+class Report(TypedDict):
+    seconds: float  # the first start to the last end
+    phases: List[PhaseReport]  # by name and object
+    totals: List[PhaseReport]  # by name
+
+
+class _Open:
+    def __init__(self, name: str, object: str, start: float, base: int) -> None:
+        self.name = name
+        self.object = object
+        self.start = start
+        # traced memory at the start and the peak in the phase
+        self.base = base
+        self.peak = base
+        self.bytes = 0
+        self.stats: Dict[str, float] = {}
+
+
+class Profiler:
+    """
+    the phases of all the threads. allocations are traced for the process,
+    so the ones of the parallel phases are mixed.
+    """
+
+    def __init__(self, trace_allocations: bool = False) -> None:
+        self.trace_allocations = trace_allocations
+        self.phases: List[Phase] = []
+        self._local = threading.local()
+        self._started_tracing = False
+
+    def __enter__(self) -> "Profiler":
+        if self.trace_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        return self
+
+    def __exit__(self, *args):
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def _stack(self) -> List[_Open]:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    @contextlib.contextmanager
+    def phase(self, name: str, object: Optional[str] = None):
+        stack = self._stack()
+        if object is None:
+            object = stack[-1].object if stack else ""
+        tracing = self.trace_allocations and tracemalloc.is_tracing()
+        base = 0
+        if tracing:
+            base, peak = tracemalloc.get_traced_memory()
+            if stack:
+                stack[-1].peak = max(stack[-1].peak, peak)
+            tracemalloc.reset_peak()
+        current = _Open(name, object, time.perf_counter(), base)
+        stack.append(current)
+        try:
+            yield current
+        finally:
+            end = time.perf_counter()
+            stack.pop()
+            if tracing:
+                current.peak = max(current.peak, tracemalloc.get_traced_memory()[1])
+                if stack:
+                    stack[-1].peak = max(stack[-1].peak, current.peak)
+            self.phases.append(
+                Phase(
+                    name,
+                    object,
+                    current.start,
+                    end - current.start,
+                    current.peak - current.base,
+                    current.bytes,
+                    threading.get_ident(),
+                    current.stats,
+                )
+            )
+
+    def add_bytes(self, byteLength: int):
+        """
+        to the innermost phase of the thread.
+        """
+        stack = self._stack()
+        if stack:
+            stack[-1].bytes += byteLength
+
+    def add_stats(self, **stats: float):
+        """
+        to the innermost phase of the thread. acmr=0.7
+        """
+        stack = self._stack()
+        if stack:
+            stack[-1].stats.update(stats)
+
+    def report(self) -> Report:
+        return make_report(self.phases)
+
+
+def phase(profiler: Optional[Profiler], name: str, object: Optional[str] = None):
+    """
+    Profiler.phase. nothing if profiler is None.
+    """
+    if profiler is None:
+        return contextlib.nullcontext()
+    return profiler.phase(name, object)
+
+
+def add_bytes(profiler: Optional[Profiler], byteLength: int):
+    if profiler is not None:
+        profiler.add_bytes(byteLength)
+
+
+def add_stats(profiler: Optional[Profiler], **stats: float):
+    if profiler is not None:
+        profiler.add_stats(**stats)
+
+
+def make_report(phases: Iterable[Phase]) -> Report:
+    phases = list(phases)
+
+    def merge(
+        reports: Dict[Tuple[str, str], PhaseReport],
+        sums: Dict[Tuple[str, str], Dict[str, Tuple[float, int]]],
+        key: Tuple[str, str],
+        p: Phase,
+    ):
+        if key not in reports:
+            reports[key] = PhaseReport(
+                name=key[0],
+                object=key[1],
+                count=0,
+                seconds=0,
+                allocated=0,
+                bytes=0,
+                stats={},
+            )
+        r = reports[key]
+        r["count"] += 1
+        r["seconds"] += p.seconds
+        r["allocated"] = max(r["allocated"], p.allocated)
+        r["bytes"] += p.bytes
+        # (sum, count) of each stat
+        stat_sums = sums.setdefault(key, {})
+        for k, v in p.stats.items():
+            total, count = stat_sums.get(k, (0.0, 0))
+            stat_sums[k] = (total + v, count + 1)
+            r["stats"][k] = (total + v) / (count + 1)
+
+    by_object: Dict[Tuple[str, str], PhaseReport] = {}
+    by_name: Dict[Tuple[str, str], PhaseReport] = {}
+    object_sums: Dict[Tuple[str, str], Dict[str, Tuple[float, int]]] = {}
+    name_sums: Dict[Tuple[str, str], Dict[str, Tuple[float, int]]] = {}
+    for p in sorted(phases, key=lambda p: p.start):
+        merge(by_object, object_sums, (p.name, p.object), p)
+        merge(by_name, name_sums, (p.name, ""), p)
+    seconds = 0.0
+    if phases:
+        seconds = max(p.start + p.seconds for p in phases) - min(
+            p.start for p in phases
+        )
+    return Report(
+        seconds=seconds,
+        phases=list(by_object.values()),
+        totals=list(by_name.values()),
+    )
+
+
+def _size(byteLength: int) -> str:
+    if byteLength >= 1 << 20:
+        return f"{byteLength / (1 << 20):.1f}MB"
+    return f"{byteLength / (1 << 10):.1f}KB"
+
+
+def _stats(r: PhaseReport) -> str:
+    return "".join(f", {k} {v:.3f}" for k, v in r["stats"].items())
+
+
+def format_report(report: Report, *, objects: bool = False) -> List[str]:
+    """
+    a line for each phase name, slowest first. objects: and each object.
+    """
+    lines = [f"total: {report['seconds']:.3f}s"]
+    for r in sorted(report["totals"], key=lambda r: -r["seconds"]):
+        line = f"{r['name']}: {r['seconds']:.3f}s x{r['count']}"
+        if r["allocated"]:
+            line += f", alloc {_size(r['allocated'])}"
+        if r["bytes"]:
+            line += f", {_size(r['bytes'])}"
+        lines.append(line + _stats(r))
+        if objects:
+            for o in report["phases"]:
+                if o["name"] == r["name"] and o["object"]:
+                    lines.append(f"  {o['object']}: {o['seconds']:.3f}s" + _stats(o))
+    return lines
+
+
+def write_chrome_trace(
+    path: pathlib.Path, processes: Iterable[Tuple[str, Iterable[Phase]]]
+):
+    """
+    the chrome://tracing (Perfetto) JSON. a process for each (label, phases),
+    for the jobs of a batch.
+    """
+    processes = [(label, list(phases)) for label, phases in processes]
+    origin = min(
+        (p.start for _, phases in processes for p in phases),
+        default=time.perf_counter(),
+    )
+    events = []
+    for pid, (label, phases) in enumerate(processes):
+        events.append(
+            {"name": "process_name", "ph": "M", "pid": pid, "args": {"name": label}}
+        )
+        for p in phases:
+            events.append(
+                {
+                    "name": p.name,
+                    "cat": "export",
+                    "ph": "X",
+                    "ts": (p.start - origin) * 1e6,
+                    "dur": p.seconds * 1e6,
+                    "pid": pid,
+                    "tid": p.thread,
+                    "args": {
+                        "object": p.object,
+                        "allocated": p.allocated,
+                        "bytes": p.bytes,
+                        **p.stats,
+                    },
+                }
+            )
+    with path.open("w") as w:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, w)
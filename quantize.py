@@ -0,0 +1,334 @@
+"""
+quantized vertex streams.
+
+the formats are described by serialization.Attribute.
+16 bit and 8 bit attributes are padded to 4 bytes.
+"""
+
+from typing import List, NamedTuple, Tuple
+import numpy as np
+from . import vertex_buffer
+from . import serialization
+
+
+class Quantization(NamedTuple):
+    position: str = "f32"  # f32 | f16 | unorm16
+    normal: str = "f32"  # f32 | snorm16. octahedral normal and tangent
+    texcoord: str = "f32"  # f32 | f16 | unorm16
+    color: str = "f32"  # f32 | unorm8
+    weights: str = "f32"  # f32 | unorm8
+
+
+HALF = Quantization(
+    position="f16",
+    normal="snorm16",
+    texcoord="f16",
+    color="unorm8",
+    weights="unorm8",
+)
+QUANTIZED = Quantization(
+    position="unorm16",
+    normal="snorm16",
+    texcoord="unorm16",
+    color="unorm8",
+    weights="unorm8",
+)
+
+
+def encode_unorm(values: np.ndarray, bits: int) -> np.ndarray:
+    """
+    values in [0, 1]
+    """
+    maximum = (1 << bits) - 1
+    return np.rint(np.clip(values, 0, 1) * maximum).astype(
+        np.uint8 if bits == 8 else np.uint16
+    )
+
+
+def encode_range(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    unorm16 with the decode transform of the values range.
+
+    returns (encoded, decodeOffset, decodeScale)
+    """
+    if len(values):
+        offset = values.min(axis=0)
+        scale = values.max(axis=0) - offset
+    else:
+        offset = np.zeros(values.shape[1], np.float32)
+        scale = np.zeros(values.shape[1], np.float32)
+    normalized = np.divide(
+        values - offset, scale, out=np.zeros(values.shape, np.float32), where=scale > 0
+    )
+    return encode_unorm(normalized, 16), offset, scale
+
+
+def encode_octahedral(v: np.ndarray) -> np.ndarray:
+    """
+    unit vectors (N, 3) => snorm16 (N, 2)
+    """
+    l1 = np.abs(v).sum(axis=1, keepdims=True)
+    p = np.divide(v, l1, out=np.zeros(v.shape, np.float32), where=l1 > 0)
+    xy = p[:, :2]
+    lower = p[:, 2] < 0
+    sign = np.where(xy[lower] >= 0, 1.0, -1.0)
+    xy[lower] = (1 - np.abs(xy[lower][:, ::-1])) * sign
+    return np.rint(np.clip(xy, -1, 1) * 32767).astype(np.int16)
+
+
+def decode_octahedral(e: np.ndarray) -> np.ndarray:
+    """
+    snorm16 (N, 2) => unit vectors (N, 3)
+    """
+    xy = np.clip(e[:, :2].astype(np.float32) / 32767, -1, 1)
+    z = 1 - np.abs(xy).sum(axis=1)
+    t = np.clip(-z, 0, None)[:, None]
+    xy = xy - np.where(xy >= 0, t, -t)
+    v = np.concatenate([xy, z[:, None]], axis=1)
+    return v / np.linalg.norm(v, axis=1, keepdims=True)
+
+
+def encode_weights(weights: np.ndarray) -> np.ndarray:
+    """
+    blend weights (N, K) => unorm8 (N, K).
+    each row is normalized and sums to 255 exactly (largest remainder).
+    rows with no weight stay 0.
+    """
+    total = weights.sum(axis=1, keepdims=True)
+    normalized = np.divide(
+        weights, total, out=np.zeros(weights.shape, np.float32), where=total > 0
+    )
+    scaled = normalized * 255
+    q = np.floor(scaled)
+    remainder = np.clip(255 - q.sum(axis=1), 0, weights.shape[1])
+    remainder[total[:, 0] <= 0] = 0
+    order = np.argsort(q - scaled, axis=1, kind="stable")
+    rank = np.empty_like(order)
+    np.put_along_axis(rank, order, np.arange(weights.shape[1])[None, :], axis=1)
+    q += rank < remainder[:, None]
+    return q.astype(np.uint8)
+
+
+def _pad(values: np.ndarray, dimension: int, fill: float) -> np.ndarray:
+    if values.shape[1] == dimension:
+        return values
+    padding = np.full((len(values), dimension - values.shape[1]), fill, values.dtype)
+    return np.concatenate([values, padding], axis=1)
+
+
+class _StreamBuilder:
+    """
+    fields of a quantized stream. build a packed structured array at the end.
+    """
+
+    def __init__(self, name: str, count: int) -> None:
+        self.name = name
+        self.count = count
+        self.fields: List[Tuple[str, np.ndarray]] = []
+        self.attributes: List[serialization.Attribute] = []
+
+    def add(self, values: np.ndarray, attribute: serialization.Attribute):
+        self.fields.append((attribute["vertexAttribute"], values))
+        self.attributes.append(attribute)
+
+    def build(self) -> serialization.VertexStream:
+        dtype = np.dtype(
+            [(name, values.dtype, values.shape[1:]) for name, values in self.fields]
+        )
+        data = np.empty(self.count, dtype)
+        for name, values in self.fields:
+            data[name] = values
+        return serialization.VertexStream(self.name, memoryview(data), self.attributes)
+
+
+def _add_position(s: _StreamBuilder, position: np.ndarray, format: str):
+    if format == "f16":
+        s.add(
+            _pad(position, 4, 1).astype(np.float16),
+            serialization.Attribute(
+                vertexAttribute="position", format="f16", dimension=4
+            ),
+        )
+    elif format == "unorm16":
+        # w decodes to 1
+        encoded, offset, scale = encode_range(position)
+        s.add(
+            _pad(encoded, 4, 0),
+            serialization.Attribute(
+                vertexAttribute="position",
+                format="unorm16",
+                dimension=4,
+                decodeOffset=[float(x) for x in offset] + [1.0],
+                decodeScale=[float(x) for x in scale] + [0.0],
+            ),
+        )
+    else:
+        s.add(
+            position,
+            serialization.Attribute(
+                vertexAttribute="position", format="f32", dimension=3
+            ),
+        )
+
+
+def _add_normal_tangent(
+    s: _StreamBuilder, normal: np.ndarray, tangent: np.ndarray, format: str
+):
+    if format == "snorm16":
+        s.add(
+            encode_octahedral(normal),
+            serialization.Attribute(
+                vertexAttribute="normal",
+                format="snorm16",
+                dimension=2,
+                encoding="octahedral",
+            ),
+        )
+        # z: handedness
+        sign = np.rint(np.clip(tangent[:, 3:], -1, 1) * 32767).astype(np.int16)
+        s.add(
+            _pad(
+                np.concatenate([encode_octahedral(tangent[:, :3]), sign], axis=1), 4, 0
+            ),
+            serialization.Attribute(
+                vertexAttribute="tangent",
+                format="snorm16",
+                dimension=4,
+                encoding="octahedral",
+            ),
+        )
+    else:
+        s.add(
+            normal,
+            serialization.Attribute(
+                vertexAttribute="normal", format="f32", dimension=3
+            ),
+        )
+        s.add(
+            tangent,
+            serialization.Attribute(
+                vertexAttribute="tangent", format="f32", dimension=4
+            ),
+        )
+
+
+def _add_texcoord(s: _StreamBuilder, name: str, uv: np.ndarray, format: str):
+    if format == "f16":
+        s.add(
+            uv.astype(np.float16),
+            serialization.Attribute(vertexAttribute=name, format="f16", dimension=2),
+        )
+    elif format == "unorm16":
+        encoded, offset, scale = encode_range(uv)
+        s.add(
+            encoded,
+            serialization.Attribute(
+                vertexAttribute=name,
+                format="unorm16",
+                dimension=2,
+                decodeOffset=[float(x) for x in offset],
+                decodeScale=[float(x) for x in scale],
+            ),
+        )
+    else:
+        s.add(
+            uv, serialization.Attribute(vertexAttribute=name, format="f32", dimension=2)
+        )
+
+
+def get_vertex_streams(
+    vb: vertex_buffer.VertexBuffer, q: Quantization
+) -> List[serialization.VertexStream]:
+    """
+    quantized version of serialization.get_vertex_streams
+    """
+    count = vb.vertex_count
+    geometry = vertex_buffer.as_array(vb.geometry, vertex_buffer.GEOMETRY_DTYPE)
+    colortex = vertex_buffer.as_array(vb.colortex, vertex_buffer.COLORTEX_DTYPE)
+
+    vert = _StreamBuilder("vert", count)
+    _add_position(vert, geometry["position"], q.position)
+    _add_normal_tangent(vert, geometry["normal"], geometry["tangent"], q.normal)
+
+    tex = _StreamBuilder("tex", count)
+    if q.color == "unorm8":
+        tex.add(
+            encode_unorm(colortex["color"], 8),
+            serialization.Attribute(
+                vertexAttribute="color", format="unorm8", dimension=4
+            ),
+        )
+    else:
+        tex.add(
+            colortex["color"],
+            serialization.Attribute(vertexAttribute="color", format="f32", dimension=4),
+        )
+    _add_texcoord(tex, "tex0", colortex["tex0"], q.texcoord)
+    _add_texcoord(tex, "tex1", colortex["tex1"], q.texcoord)
+
+    streams = [vert.build(), tex.build()]
+
+    if vb.skinning:
+        skin = vertex_buffer.as_array(vb.skinning.skinning, vb.skinning.get_dtype())
+        influences = vb.skinning.influences
+        s = _StreamBuilder("skin", count)
+        if q.weights == "unorm8":
+            s.add(
+                encode_weights(skin["weights"]),
+                serialization.Attribute(
+                    vertexAttribute="blendWeights",
+                    format="unorm8",
+                    dimension=influences,
+                ),
+            )
+        else:
+            s.add(
+                skin["weights"],
+                serialization.Attribute(
+                    vertexAttribute="blendWeights", format="f32", dimension=influences
+                ),
+            )
+        s.add(
+            skin["joints"],
+            serialization.Attribute(
+                vertexAttribute="blendIndices", format="u16", dimension=influences
+            ),
+        )
+        streams.append(s.build())
+
+    return streams
+
+
+def decode_attribute(
+    values: np.ndarray, attribute: serialization.Attribute
+) -> np.ndarray:
+    """
+    a field of a stream => float32 (N, dimension).
+    octahedral normal is (N, 3). octahedral tangent is (N, 4) with handedness in w.
+    integer formats (blendIndices) are returned as is.
+    """
+    format = attribute["format"]
+    if format in ("u16", "u32"):
+        return values
+
+    if attribute.get("encoding") == "octahedral":
+        v = decode_octahedral(values)
+        if attribute["vertexAttribute"] == "tangent":
+            sign = values[:, 2:3].astype(np.float32) / 32767
+            v = np.concatenate([v, sign], axis=1)
+        return v.astype(np.float32)
+
+    if format == "unorm8":
+        decoded = values.astype(np.float32) / 255
+    elif format == "unorm16":
+        decoded = values.astype(np.float32) / 65535
+    elif format == "snorm16":
+        decoded = np.clip(values.astype(np.float32) / 32767, -1, 1)
+    else:
+        decoded = values.astype(np.float32)
+
+    if "decodeScale" in attribute:
+        decoded = decoded * np.array(attribute["decodeScale"], np.float32)
+    if "decodeOffset" in attribute:
+        decoded = decoded + np.array(attribute["decodeOffset"], np.float32)
+    return decoded
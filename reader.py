@@ -0,0 +1,366 @@
+"""
+bpy independent .lbsm reader.
+
+the file is mmapped. only the header, the chunk table and the JSON chunk are
+read on open. bufferViews and vertex streams are zero copy views into the map.
+bufferViews in a BINZ chunk are decompressed on access.
+PAD chunks (serialization.ChunkWriter alignment) are skipped.
+
+a progressive file begins with the TOC chunk (serialization.TOC_ENTRY).
+the bufferViews have the chunk index. a truncated progressive file is read,
+buffer_view raises for the chunks that have not arrived.
+
+    python -m lbsm.reader some.lbsm
+"""
+
+from typing import List, Dict, Union, Tuple, Optional
+import mmap
+import struct
+import pathlib
+import json
+import numpy as np
+from . import serialization
+from . import quantize
+from . import compress
+from . import skeleton
+from . import animation as _animation
+
+# Attribute.format => numpy little endian scalar
+FORMATS: Dict[str, str] = {
+    "f32": "<f4",
+    "f16": "<f2",
+    "u16": "<u2",
+    "u32": "<u4",
+    "unorm8": "u1",
+    "unorm16": "<u2",
+    "snorm16": "<i2",
+}
+
+
+def attribute_dtype(attributes: List[serialization.Attribute]) -> np.dtype:
+    """
+    the vertex layout of a Stream.
+    fields are named by vertexAttribute.
+    """
+    return np.dtype(
+        [
+            (a["vertexAttribute"], FORMATS[a["format"]], (a["dimension"],))
+            for a in attributes
+        ]
+    )
+
+
+ChunkInfo = serialization.ChunkInfo
+
+
+def read_toc(prefix: bytes) -> Optional[List[ChunkInfo]]:
+    """
+    the chunks of a progressive file from the beginning of it.
+    None if the file is not progressive or the TOC is not in prefix.
+    """
+    if len(prefix) < 12 or prefix[:4] != b"LBSM":
+        return None
+    pos = 12
+    while pos + 8 <= len(prefix):
+        chunkLength, chunkType = struct.unpack_from("<I4s", prefix, pos)
+        pos += 8
+        if chunkType == b"PAD\0":
+            pos += chunkLength
+            continue
+        if chunkType != b"TOC\0" or pos + chunkLength > len(prefix):
+            return None
+        return [
+            ChunkInfo(chunkType, byteOffset, byteLength)
+            for byteOffset, byteLength, chunkType in serialization.TOC_ENTRY.iter_unpack(
+                prefix[pos : pos + chunkLength]
+            )
+        ]
+    return None
+
+
+class Reader:
+    def __init__(self, path: pathlib.Path) -> None:
+        self.path = path
+        with path.open("rb") as r:
+            self.map = mmap.mmap(r.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.version, byteLength = struct.unpack_from("<4sII", self.map, 0)
+        if magic != b"LBSM":
+            raise Exception(f"invalid magic: {magic}")
+        toc = read_toc(self.map)
+        if toc is not None:
+            self.chunks: List[ChunkInfo] = toc
+        else:
+            if byteLength > len(self.map):
+                raise Exception(f"file is truncated: {len(self.map)} < {byteLength}")
+            self.chunks = []
+            pos = 12
+            while pos < byteLength:
+                chunkLength, chunkType = struct.unpack_from("<I4s", self.map, pos)
+                pos += 8
+                self.chunks.append(ChunkInfo(chunkType, pos, chunkLength))
+                pos += chunkLength
+
+        json_chunk = self.get_chunk(b"JSON")
+        if json_chunk.byteOffset + json_chunk.byteLength > len(self.map):
+            raise Exception(f"file is truncated: {len(self.map)} < {byteLength}")
+        self.root: serialization.Root = json.loads(
+            self.map[
+                json_chunk.byteOffset : json_chunk.byteOffset + json_chunk.byteLength
+            ]
+        )
+        # None if progressive
+        self.bin: Optional[ChunkInfo] = None
+        if toc is None:
+            if any(chunk.chunkType == b"BINZ" for chunk in self.chunks):
+                self.bin = self.get_chunk(b"BINZ")
+            else:
+                self.bin = self.get_chunk(b"BIN\0")
+
+    def __enter__(self) -> "Reader":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """
+        all views returned from this reader must be released before.
+        """
+        self.map.close()
+
+    def get_chunk(self, chunkType: bytes) -> ChunkInfo:
+        for chunk in self.chunks:
+            if chunk.chunkType == chunkType:
+                return chunk
+        raise KeyError(chunkType)
+
+    def _buffer_view_chunk(self, index: int) -> ChunkInfo:
+        bufferView = self.root["bufferViews"][index]
+        if "chunk" in bufferView:
+            return self.chunks[bufferView["chunk"]]
+        return self.bin
+
+    def is_available(self, index: int) -> bool:
+        """
+        False if the chunk of the bufferView is beyond a truncated progressive file.
+        """
+        chunk = self._buffer_view_chunk(index)
+        return chunk.byteOffset + chunk.byteLength <= len(self.map)
+
+    def buffer_view(self, index: int) -> memoryview:
+        """
+        zero copy unless the bufferView is compressed.
+        """
+        bufferView = self.root["bufferViews"][index]
+        if not self.is_available(index):
+            raise Exception(f"chunk is not arrived: {bufferView['name']}")
+        begin = self._buffer_view_chunk(index).byteOffset + bufferView["byteOffset"]
+        data = memoryview(self.map)[begin : begin + bufferView["byteLength"]]
+        compression = bufferView.get("compression")
+        if compression:
+            data = memoryview(
+                compress.decode(
+                    data,
+                    compression["codec"],
+                    compression["filter"],
+                    compression["stride"],
+                )
+            )
+        return data
+
+    def get_mesh(self, mesh: Union[int, serialization.Mesh]) -> serialization.Mesh:
+        if isinstance(mesh, int):
+            return self.root["meshes"][mesh]
+        return mesh
+
+    def vertex_stream(
+        self, mesh: Union[int, serialization.Mesh], stream: int
+    ) -> np.ndarray:
+        """
+        structured array. same layout as VertexGeometry, VertexColorTex and VertexSkin.
+        """
+        mesh = self.get_mesh(mesh)
+        s = mesh["vertexStreams"][stream]
+        return np.frombuffer(
+            self.buffer_view(s["bufferView"]),
+            attribute_dtype(s["attributes"]),
+            mesh["vertexCount"],
+        )
+
+    def find_vertex_stream(
+        self, mesh: Union[int, serialization.Mesh], vertexAttribute: str
+    ) -> np.ndarray:
+        """
+        the stream that has the vertexAttribute. use ["vertexAttribute"] to get the field.
+        """
+        mesh = self.get_mesh(mesh)
+        for i, s in enumerate(mesh["vertexStreams"]):
+            for a in s["attributes"]:
+                if a["vertexAttribute"] == vertexAttribute:
+                    return self.vertex_stream(mesh, i)
+        raise KeyError(vertexAttribute)
+
+    def decode(
+        self, mesh: Union[int, serialization.Mesh], vertexAttribute: str
+    ) -> np.ndarray:
+        """
+        the vertexAttribute as float32 (N, dimension). quantized formats are decoded.
+        this is a copy.
+        """
+        mesh = self.get_mesh(mesh)
+        for i, s in enumerate(mesh["vertexStreams"]):
+            for a in s["attributes"]:
+                if a["vertexAttribute"] == vertexAttribute:
+                    values = self.vertex_stream(mesh, i)[vertexAttribute]
+                    return quantize.decode_attribute(values, a)
+        raise KeyError(vertexAttribute)
+
+    def morph_target(
+        self, mesh: Union[int, serialization.Mesh], target: int
+    ) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        """
+        (vertex indices, decoded float32 deltas by vertexAttribute).
+        """
+        mesh = self.get_mesh(mesh)
+        t = mesh["morphTargets"][target]
+        indices = np.frombuffer(self.buffer_view(t["indices"]), "<u4")
+        stream = np.frombuffer(
+            self.buffer_view(t["bufferView"]),
+            attribute_dtype(t["attributes"]),
+            t["count"],
+        )
+        return indices, {
+            a["vertexAttribute"]: quantize.decode_attribute(
+                stream[a["vertexAttribute"]], a
+            )
+            for a in t["attributes"]
+        }
+
+    def vertex_bones(self, mesh: Union[int, serialization.Mesh]) -> np.ndarray:
+        """
+        blendIndices as the index of Root.bones. the SubMesh palettes are resolved.
+        this is a copy.
+        """
+        mesh = self.get_mesh(mesh)
+        blend_indices = self.find_vertex_stream(mesh, "blendIndices")["blendIndices"]
+        return skeleton.vertex_bones(blend_indices, mesh["joints"], mesh["subMeshes"])
+
+    def _bone_values(self, key: str, dimension: int) -> np.ndarray:
+        if key not in self.root:
+            raise KeyError(key)
+        return np.frombuffer(self.buffer_view(self.root[key]), "<f4").reshape(
+            -1, dimension
+        )
+
+    def inverse_bind_matrices(self) -> np.ndarray:
+        """
+        (bones, 4, 4) row major.
+        """
+        return self._bone_values("inverseBindMatrices", 16).reshape(-1, 4, 4)
+
+    def rest_rotations(self) -> np.ndarray:
+        """
+        (bones, 4) xyzw.
+        """
+        return self._bone_values("restRotations", 4)
+
+    def rest_scales(self) -> np.ndarray:
+        """
+        (bones, 3). ones if not written.
+        """
+        if "restScales" not in self.root:
+            return np.ones((len(self.root["bones"]), 3), np.float32)
+        return self._bone_values("restScales", 3)
+
+    def animation_keys(
+        self, animation: int, channel: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (frames, values) of the channel. the rotation is decoded to xyzw.
+        """
+        a = self.root["animations"][animation]
+        c = a["channels"][channel]
+        count = c["keyCount"]
+        times = np.frombuffer(self.buffer_view(a["times"]), "<u2")
+        frames = times[c["timeOffset"] : c["timeOffset"] + count]
+        if c["path"] == "rotation":
+            data = np.frombuffer(self.buffer_view(a["rotations"]), "<u2").reshape(-1, 3)
+            values = _animation.decode_smallest_three(
+                data[c["valueOffset"] : c["valueOffset"] + count]
+            )
+        else:
+            key = {"translation": "translations", "scale": "scales"}[c["path"]]
+            data = np.frombuffer(self.buffer_view(a[key]), "<f4").reshape(-1, 3)
+            values = data[c["valueOffset"] : c["valueOffset"] + count]
+        return frames, values
+
+    def bone_bounds(self) -> np.ndarray:
+        """
+        (bones, 6) min xyz, max xyz.
+        """
+        return self._bone_values("boneBounds", 6)
+
+    def _lod(
+        self, mesh: Union[int, serialization.Mesh], lod: int
+    ) -> Union[serialization.Mesh, serialization.MeshLod]:
+        """
+        0 is the mesh. 1 is mesh.lods[0].
+        """
+        mesh = self.get_mesh(mesh)
+        return mesh["lods"][lod - 1] if lod else mesh
+
+    def indices(self, mesh: Union[int, serialization.Mesh], lod: int = 0) -> np.ndarray:
+        indices = self._lod(mesh, lod)["indices"]
+        return np.frombuffer(
+            self.buffer_view(indices["bufferView"]),
+            np.dtype("<u4") if indices["stride"] == 4 else np.dtype("<u2"),
+        )
+
+    def submesh_indices(
+        self, mesh: Union[int, serialization.Mesh], submesh: int, lod: int = 0
+    ) -> np.ndarray:
+        """
+        the indices of the submesh. baseVertex is added. this is a copy.
+        """
+        indices = self.indices(mesh, lod)
+        submeshes = self._lod(mesh, lod)["subMeshes"]
+        begin = 0
+        for s in submeshes[:submesh]:
+            begin += s["drawCount"]
+        s = submeshes[submesh]
+        return indices[begin : begin + s["drawCount"]].astype(np.uint32) + s.get(
+            "baseVertex", 0
+        )
+
+
+def read(path: pathlib.Path) -> Reader:
+    return Reader(path)
+
+
+if __name__ == "__main__":
+    import sys
+
+    with read(pathlib.Path(sys.argv[1])) as r:
+        print(f"version: {r.version}")
+        for chunk in r.chunks:
+            print(f"chunk: {chunk.chunkType}: {chunk.byteLength} bytes")
+        for mesh in r.root["meshes"]:
+            streams = [
+                ", ".join(a["vertexAttribute"] for a in s["attributes"])
+                for s in mesh["vertexStreams"]
+            ]
+            print(
+                f'{mesh["name"]}: {mesh["vertexCount"]} vertices, '
+                f'{sum(s["drawCount"] for s in mesh["subMeshes"])} indices, '
+                f'streams: [{"], [".join(streams)}], '
+                f'morph targets: {len(mesh.get("morphTargets", []))}'
+            )
+            for i, lod in enumerate(mesh.get("lods", [])):
+                print(
+                    f'  lod{i + 1}: {sum(s["drawCount"] for s in lod["subMeshes"])} '
+                    f'indices, error {lod["error"]:.3g}'
+                )
+        if "instances" in r.root:
+            print(f'instances: {len(r.root["instances"])}')
+        print(f'bones: {len(r.root["bones"])}')
@@ -3,7 +3,6 @@ import os
 import bpy
 import mathutils
 
-
 HERE = pathlib.Path(__file__).absolute().parent
 
 
@@ -26,7 +25,15 @@ if __name__ == "__main__":
 
     meshes = vertex.export_glb(glb, zup_to_yup)
 
+    from lbsm import pose
+    from lbsm import animation
+
+    armatures = [ob for ob in bpy.context.scene.objects if ob.type == "ARMATURE"]
+    animations = [
+        animation.bake(clip) for clip in pose.sample_armatures(armatures, zup_to_yup)
+    ]
+
     dst = HERE / "tmp.lbsm"
     from lbsm import serialization
 
-    serialization.serialize(dst, meshes)
+    serialization.serialize(dst, meshes, animations=animations)
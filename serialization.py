@@ -1,12 +1,32 @@
-from typing import List, NamedTuple, Dict, Tuple
+from typing import (
+    TYPE_CHECKING,
+    TypedDict,
+    List,
+    NamedTuple,
+    Dict,
+    Tuple,
+    Optional,
+    Iterable,
+    BinaryIO,
+    Deque,
+)
 import struct
 import pathlib
 import io
+import os
 import json
-from . import vertex
+import collections
+import concurrent.futures
+import tempfile
+import numpy as np
+from . import vertex_buffer
+from . import compress
+from . import skeleton
+from . import profiling
 
-
-from typing import TypedDict, List, Optional, Tuple
+if TYPE_CHECKING:
+    from . import quantize
+    from . import animation
 
 
 class Axes(TypedDict):
@@ -20,15 +40,37 @@ class Asset(TypedDict):
     axes: Axes
 
 
-class BufferView(TypedDict):
+class BufferViewCompression(TypedDict):
+    codec: str  # zlib | lzma
+    filter: str  # shuffle | delta
+    stride: int  # shuffle element size
+    byteLength: int  # uncompressed
+
+
+class BufferViewOptional(TypedDict, total=False):
+    # in the BINZ chunk
+    compression: BufferViewCompression
+    # progressive. the index of the table of contents. byteOffset is in the chunk
+    chunk: int
+
+
+class BufferView(BufferViewOptional):
     name: str  # must unique !
     byteOffset: int
     byteLength: int
 
 
-class Attribute(TypedDict):
+class AttributeDecode(TypedDict, total=False):
+    # octahedral: normal and tangent. xy is the octahedral map, tangent z is the sign
+    encoding: str
+    # value = decodeOffset + decodeScale * normalized
+    decodeOffset: List[float]
+    decodeScale: List[float]
+
+
+class Attribute(AttributeDecode):
     vertexAttribute: str  # position | normal | tangent | color | tex0 | tex1 | blendWeights | blendJoints
-    format: str  # f32 | u16 | u32
+    format: str  # f32 | f16 | u16 | u32 | unorm8 | unorm16 | snorm16
     dimension: int  # 1 2 3 4
 
 
@@ -42,12 +84,58 @@ class Indices(TypedDict):
     bufferView: int
 
 
-class SubMesh(TypedDict):
+class SubMeshVertexRange(TypedDict, total=False):
+    # indices are relative to baseVertex
+    baseVertex: int
+    vertexCount: int
+
+
+class SubMeshJoints(TypedDict, total=False):
+    # the joint palette. index of Root.bones
+    # blendIndices of the vertex range are into joints instead of Mesh.joints
+    joints: List[int]
+
+
+class SubMesh(SubMeshVertexRange, SubMeshJoints):
     material: int
-    drawCount: int
+    drawCount: int  # consecutive. the first index is the sum of the previous drawCount
+
 
+class MeshBounds(TypedDict, total=False):
+    # AABB of the positions. min xyz, max xyz
+    bounds: List[float]
 
-class Mesh(TypedDict):
+
+class MorphTarget(TypedDict):
+    name: str
+    count: int  # vertices
+    indices: int  # bufferView. u32 ascending vertex index
+    # bufferView of the deltas. a stream of snorm16 attributes with decodeScale
+    # position | normal | tangent (xyz)
+    bufferView: int
+    attributes: List[Attribute]
+
+
+class MeshMorphTargets(TypedDict, total=False):
+    # sparse. only the vertices that the target changes
+    morphTargets: List[MorphTarget]
+
+
+class MeshLod(TypedDict):
+    # the max distance from the surface. the mesh space
+    # pixels = error * viewport_height / (2 * distance * tan(fov_y / 2))
+    error: float
+    indices: Indices
+    # those of Mesh.subMeshes with the drawCount of this index buffer
+    subMeshes: List[SubMesh]
+
+
+class MeshLods(TypedDict, total=False):
+    # coarser index buffers of the same vertex streams. from fine to coarse
+    lods: List[MeshLod]
+
+
+class Mesh(MeshBounds, MeshMorphTargets, MeshLods):
     name: str
     vertexCount: int
     vertexStreams: List[Stream]
@@ -74,7 +162,59 @@ class Material(TypedDict):
     colorTexture: int
 
 
-class Root(TypedDict):
+class Instance(TypedDict):
+    mesh: int
+    matrix: List[float]  # 4x4 row major. mesh space => export space
+
+
+class RootInstances(TypedDict, total=False):
+    # without instances, each mesh is placed once in the export space
+    instances: List[Instance]
+
+
+class RootBindPose(TypedDict, total=False):
+    # bufferViews of f32 for each Root.bones. skeleton.py
+    # 4x4 row major. export space => bone space
+    inverseBindMatrices: int
+    # quaternion xyzw in the export space
+    restRotations: int
+    # xyz. the mirror is the negative x
+    restScales: int
+    # AABB of the vertices that the bone influences in the bind pose
+    # min xyz, max xyz. min > max if no vertex
+    boneBounds: int
+
+
+class AnimationChannel(TypedDict):
+    bone: int  # Root.bones
+    path: str  # translation | rotation | scale
+    keyCount: int
+    timeOffset: int  # the first key in Animation.times
+    valueOffset: int  # the first key in the values of the path
+
+
+class Animation(TypedDict):
+    name: str
+    fps: float
+    frameCount: int
+    # bufferViews. the keys of the channels in order. animation.py
+    times: int  # u16 frame
+    translations: int  # f32 xyz. parent local
+    rotations: int  # smallest three. u16 x 3
+    scales: int  # f32 xyz
+    channels: List[AnimationChannel]
+
+
+class RootAnimations(TypedDict, total=False):
+    animations: List[Animation]
+
+
+class RootProfile(TypedDict, total=False):
+    # the phases of the export until the JSON. profiling.py
+    profile: profiling.Report
+
+
+class Root(RootInstances, RootBindPose, RootAnimations, RootProfile):
     asset: Asset
     bufferViews: List[BufferView]
     tetures: List[Texture]
@@ -83,70 +223,382 @@ class Root(TypedDict):
     bones: List[Bone]  # rig
 
 
+class VertexStream(NamedTuple):
+    name: str  # bufferView name suffix. vert | tex | skin
+    data: memoryview
+    attributes: List[Attribute]
+
+
+def get_vertex_streams(vb: vertex_buffer.VertexBuffer) -> List[VertexStream]:
+    """
+    VertexGeometry, VertexColorTex and VertexSkin as is.
+    """
+    streams = [
+        VertexStream(
+            "vert",
+            vb.geometry,
+            [
+                Attribute(vertexAttribute="position", format="f32", dimension=3),
+                Attribute(vertexAttribute="normal", format="f32", dimension=3),
+                Attribute(vertexAttribute="tangent", format="f32", dimension=4),
+            ],
+        ),
+        VertexStream(
+            "tex",
+            vb.colortex,
+            [
+                Attribute(vertexAttribute="color", format="f32", dimension=4),
+                Attribute(vertexAttribute="tex0", format="f32", dimension=2),
+                Attribute(vertexAttribute="tex1", format="f32", dimension=2),
+            ],
+        ),
+    ]
+    if vb.skinning:
+        streams.append(
+            VertexStream(
+                "skin",
+                vb.skinning.skinning,
+                [
+                    Attribute(
+                        vertexAttribute="blendWeights",
+                        format="f32",
+                        dimension=vb.skinning.influences,
+                    ),
+                    Attribute(
+                        vertexAttribute="blendIndices",
+                        format="u16",
+                        dimension=vb.skinning.influences,
+                    ),
+                ],
+            )
+        )
+    return streams
+
+
+def interleave_vertex_streams(streams: List[VertexStream]) -> VertexStream:
+    """
+    one stream of all attributes. the attributes of each stream in order.
+    the bytes of a vertex are those of the streams back to back.
+    """
+    rows = [np.frombuffer(s.data, np.uint8) for s in streams]
+    count = len(rows[0]) // memoryview(streams[0].data).itemsize
+    rows = [r.reshape(count, -1) for r in rows]
+    stride = sum(r.shape[1] for r in rows)
+    data = np.empty((count, stride), np.uint8)
+    offset = 0
+    for r in rows:
+        data[:, offset : offset + r.shape[1]] = r
+        offset += r.shape[1]
+    return VertexStream(
+        "vert",
+        # the stride for the shuffle filter
+        memoryview(data.view(np.dtype((np.void, stride))).ravel()),
+        [a for s in streams for a in s.attributes],
+    )
+
+
+def get_submeshes(vb: vertex_buffer.VertexBuffer) -> List[SubMesh]:
+    if not vb.submeshes:
+        return [SubMesh(material=0, drawCount=vb.indices.get_draw_count())]
+
+    submeshes = []
+    for s in vb.submeshes:
+        submesh = SubMesh(material=s.material, drawCount=s.draw_count)
+        if s.vertex_count is not None:
+            submesh["baseVertex"] = s.base_vertex
+            submesh["vertexCount"] = s.vertex_count
+        if s.joints is not None:
+            # Skinning.joints. Root.bones in Serializer
+            submesh["joints"] = list(s.joints)
+        submeshes.append(submesh)
+    return submeshes
+
+
+class ChunkInfo(NamedTuple):
+    chunkType: bytes
+    byteOffset: int  # chunkData position in the file
+    byteLength: int
+
+
+# the entry of the TOC chunk. byteOffset, byteLength, chunkType. little endian
+#
+# progressive: the first chunk is TOC. the chunks follow in the order of the entries
+#   JSON
+#   BONE: the bone arrays
+#   MESH: the vertex streams, the morph targets and the coarsest index buffer
+#         of a mesh. for each mesh
+#   LOD: a finer index buffer. the next finer of all meshes, ..., the full ones
+#   ANIM: an animation
+# PAD chunks (alignment) are not in the TOC
+TOC_ENTRY = struct.Struct("<II4s")
+
+
+class ChunkWriter:
+    """
+    write the chunks to the file as they are produced.
+    the length fields are patched when the chunk and the file are closed.
+
+    alignment: the chunkData begins at a multiple of alignment in the file.
+    a PAD chunk is inserted before the chunk for it. align() pads the chunkData.
+    """
+
+    def __init__(self, w: BinaryIO, alignment: int = 1) -> None:
+        self.w = w
+        self.alignment = alignment
+        # the written chunks except PAD
+        self.chunks: List[ChunkInfo] = []
+        self.chunkType = b""
+        # header
+        #
+        # magic: char[4]
+        # version: uint
+        # byteLength: uint
+        #
+        # little endian binary format
+        self.w.write(b"LBSM")
+        self.w.write(struct.pack("I", 1))
+        # fileTotalLength. patch in close
+        self.w.write(struct.pack("I", 0))
+        self.byteLength = 12
+        self.chunkLength: Optional[int] = None
+
+    def begin_chunk(self, chunkType: bytes):
+        if self.chunkLength is not None:
+            raise Exception("chunk is not closed")
+        if len(chunkType) != 4:
+            raise Exception("must 4")
+        if (self.byteLength + 8) % self.alignment:
+            padding = -(self.byteLength + 16) % self.alignment
+            self.w.write(struct.pack("I", padding))
+            self.w.write(b"PAD\0")
+            self.w.write(bytes(padding))
+            self.byteLength += 8 + padding
+        # chunkDataLength. patch in end_chunk
+        self.w.write(struct.pack("I", 0))
+        # chunkType
+        self.w.write(chunkType)
+        self.byteLength += 8
+        self.chunkLength = 0
+        self.chunkType = chunkType
+
+    def write(self, data) -> int:
+        """
+        append to the current chunkData.
+        returns the offset of data in the chunk.
+        """
+        offset = self.chunkLength
+        byteLength = memoryview(data).nbytes
+        self.w.write(data)
+        self.chunkLength += byteLength
+        return offset
+
+    def align(self):
+        """
+        pad the current chunkData to the alignment.
+        """
+        padding = -self.chunkLength % self.alignment
+        if padding:
+            self.write(bytes(padding))
+
+    def end_chunk(self):
+        self._patch(self.byteLength - 8, self.chunkLength)
+        self.chunks.append(ChunkInfo(self.chunkType, self.byteLength, self.chunkLength))
+        self.byteLength += self.chunkLength
+        self.chunkLength = None
+
+    def write_chunk(self, chunkType: bytes, data: bytes):
+        self.begin_chunk(chunkType)
+        self.write(data)
+        self.end_chunk()
+
+    def close(self) -> int:
+        if self.chunkLength is not None:
+            raise Exception("chunk is not closed")
+        self._patch(8, self.byteLength)
+        self.w.flush()
+        if self.w.tell() != self.byteLength:
+            raise Exception(f"write size: {self.w.tell()} != {self.byteLength}")
+        return self.byteLength
+
+    def _patch(self, pos: int, value: int):
+        self.w.seek(pos)
+        self.w.write(struct.pack("I", value))
+        self.w.seek(0, io.SEEK_END)
+
+
 class Bin:
-    def __init__(self) -> None:
-        self.stream = io.BytesIO()
+    """
+    bufferViews in the BIN chunk of the ChunkWriter.
+    only the metadata is kept in memory.
+
+    chunked: progressive. begin_chunk starts a chunk of the writer for the
+    following bufferViews. (chunkType, rank) of each chunk is kept in chunks.
+    """
+
+    def __init__(self, writer: ChunkWriter, chunked: bool = False) -> None:
+        self.writer = writer
         self.bufferViews: List[BufferView] = []
-        self.offset = 0
-
-    def push(self, name: str, data: memoryview) -> int:
-        index = len(self.bufferViews)
-        byteLength = len(data.tobytes())
-        bufferView = BufferView(
-            name=name,
-            byteOffset=self.offset,
-            byteLength=byteLength,
+        self.chunks: Optional[List[Tuple[bytes, Tuple[float, int]]]] = (
+            [] if chunked else None
         )
+
+    def begin_chunk(self, chunkType: bytes, rank: Tuple[float, int]):
+        """
+        the chunks are ordered by rank in the file. nothing unless chunked.
+        """
+        if self.chunks is None:
+            return
+        self.drain()
+        if self.writer.chunkLength is not None:
+            self.writer.end_chunk()
+        self.writer.begin_chunk(chunkType)
+        self.chunks.append((chunkType, rank))
+
+    def _add(self, bufferView: BufferView) -> int:
+        if self.chunks is not None:
+            # the spooled chunk. Serializer renumbers by the TOC
+            bufferView["chunk"] = len(self.chunks) - 1
         self.bufferViews.append(bufferView)
-        self.stream.write(data)
-        self.offset += byteLength
+        return len(self.bufferViews) - 1
+
+    def push(self, name: str, data: memoryview, filter: str = "shuffle") -> int:
+        """
+        filter is for CompressedBin
+        """
+        self.writer.align()
+        byteOffset = self.writer.write(data)
+        return self._add(
+            BufferView(
+                name=name,
+                byteOffset=byteOffset,
+                byteLength=memoryview(data).nbytes,
+            )
+        )
+
+    def drain(self):
+        """
+        write the pending bufferViews.
+        """
+        pass
+
+    def flush(self):
+        self.drain()
+
+
+class CompressedBin(Bin):
+    """
+    bufferViews in the BINZ chunk.
+    each bufferView is filtered and compressed on a thread pool, and written in order.
+    at most 2 * max_workers bufferViews are in flight.
+    """
+
+    def __init__(
+        self,
+        writer: ChunkWriter,
+        codec: str,
+        max_workers: Optional[int] = None,
+        chunked: bool = False,
+    ) -> None:
+        super().__init__(writer, chunked)
+        self.codec = codec
+        max_workers = max_workers or os.cpu_count() or 1
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers)
+        self.max_pending = max_workers * 2
+        self.pending: Deque[Tuple[int, concurrent.futures.Future]] = collections.deque()
+
+    def push(self, name: str, data: memoryview, filter: str = "shuffle") -> int:
+        data = memoryview(data)
+        stride = data.itemsize
+        index = self._add(
+            BufferView(
+                name=name,
+                byteOffset=0,
+                byteLength=0,
+                compression=BufferViewCompression(
+                    codec=self.codec,
+                    filter=filter,
+                    stride=stride,
+                    byteLength=data.nbytes,
+                ),
+            )
+        )
+        self.pending.append(
+            (
+                index,
+                self.executor.submit(compress.encode, data, self.codec, filter, stride),
+            )
+        )
+        while len(self.pending) > self.max_pending:
+            self._write_next()
         return index
 
+    def _write_next(self):
+        index, future = self.pending.popleft()
+        data = future.result()
+        bufferView = self.bufferViews[index]
+        self.writer.align()
+        bufferView["byteOffset"] = self.writer.write(data)
+        bufferView["byteLength"] = len(data)
+
+    def drain(self):
+        while self.pending:
+            self._write_next()
+
+    def flush(self):
+        self.drain()
+        self.executor.shutdown()
+
 
 class Chunk(NamedTuple):
     chunkType: bytes
     data: bytes
 
 
-def write_chunks(dst: pathlib.Path, *chunks: Chunk):
-    # header size
-    #
-    # magic: char[4]
-    # version: uint
-    # byteLength: uint
-    byteLength = 12
-    for chunk in chunks:
-        byteLength += 8 + len(chunk.data)
-
+def write_chunks(dst: pathlib.Path, *chunks: Chunk, alignment: int = 1) -> int:
     with dst.open("wb") as w:
-        # little endian binary format
-        # magic
-        w.write(b"LBSM")
-        # version
-        w.write(struct.pack("I", 1))
-        # fileTotalLength
-        w.write(struct.pack("I", byteLength))
-
+        writer = ChunkWriter(w, alignment)
         for chunk in chunks:
-            # chunkDataLength
-            w.write(struct.pack("I", len(chunk.data)))
-            # chunkType
-            if len(chunk.chunkType) != 4:
-                raise Exception("must 4")
-            w.write(chunk.chunkType)
-            # chunkData
-            w.write(chunk.data)
-
-        return byteLength
+            writer.write_chunk(chunk.chunkType, chunk.data)
+        return writer.close()
 
 
 class Serializer:
-    def __init__(self):
+    def __init__(
+        self,
+        *,
+        quantization: Optional["quantize.Quantization"] = None,
+        compression: Optional[str] = None,
+        alignment: int = 1,
+        interleave: bool = False,
+        progressive: bool = False,
+        profiler: Optional[profiling.Profiler] = None,
+        embed_profile: bool = False,
+    ):
         self.bones: List[Bone] = []
-        self.joint_map: Dict[vertex.Joint, int] = {}
+        self.joint_map: Dict[vertex_buffer.Joint, int] = {}
+        # Joint.rotation and Joint.scale of each bone
+        self.rotations: List[Optional[Tuple[float, float, float, float]]] = []
+        self.scales: List[Optional[Tuple[float, float, float]]] = []
+        self.bone_bounds = skeleton.BoneBounds()
+        # 0 is the placeholder
+        self.materials: List[Material] = [
+            Material(name="tmp", color=(1, 1, 1, 1), colorTexture=-1)
+        ]
+        self.material_map: Dict[str, int] = {}
+        self.quantization = quantization
+        self.compression = compression  # compress.CODECS
+        # of the chunks and the bufferViews. 16, 64 or 4096 (page) for the upload
+        self.alignment = alignment
+        # a vertex stream of all attributes instead of vert, tex and skin
+        self.interleave = interleave
+        # TOC and a chunk for each mesh and LOD level. see TOC_ENTRY
+        self.progressive = progressive
+        # serialize for each mesh, animation and write. embed_profile: Root.profile
+        self.profiler = profiler
+        self.embed_profile = embed_profile and profiler is not None
 
     def get_or_create_joint(
-        self, joints: Dict[str, vertex.Joint], joint: vertex.Joint
+        self, joints: Dict[str, vertex_buffer.Joint], joint: vertex_buffer.Joint
     ) -> int:
         if joint in self.joint_map:
             return self.joint_map[joint]
@@ -165,14 +617,148 @@ class Serializer:
                 is_connected=joint.is_connected,
             )
         )
+        self.rotations.append(joint.rotation)
+        self.scales.append(joint.scale)
         self.joint_map[joint] = index
 
         return index
 
-    def serialize(self, dst: pathlib.Path, meshes: List[vertex.VertexBuffer]):
-        # print(dst, meshes)
+    def get_or_create_material(self, name: Optional[str]) -> int:
+        if name is None:
+            return 0
+        if name not in self.material_map:
+            self.material_map[name] = len(self.materials)
+            self.materials.append(
+                Material(name=name, color=(1, 1, 1, 1), colorTexture=-1)
+            )
+        return self.material_map[name]
+
+    def serialize(
+        self,
+        dst: pathlib.Path,
+        meshes: Iterable[vertex_buffer.VertexBuffer],
+        instances: Optional[List[vertex_buffer.Instance]] = None,
+        animations: Optional[List["animation.BakedAnimation"]] = None,
+    ):
+        """
+        each mesh is written to the BIN chunk and released before the next one.
+        the JSON chunk follows the BIN chunk.
+
+        instances may be filled while meshes is consumed (vertex.iter_instances).
+        the channels of the bones that are not in Root.bones are dropped.
+
+        progressive: the chunks are spooled to a temporary file next to dst,
+        and copied after the TOC and the JSON chunk in the order of TOC_ENTRY.
+        """
+        if self.progressive:
+            with tempfile.TemporaryFile(dir=dst.parent) as spool:
+                writer = ChunkWriter(spool, self.alignment)
+                json_data, ranks = self._write_bin(
+                    writer, meshes, instances, animations
+                )
+                writer.close()
+                with profiling.phase(self.profiler, "write", ""):
+                    byteLength = self._write_progressive(
+                        dst, spool, writer.chunks, ranks, json_data
+                    )
+                    profiling.add_bytes(self.profiler, byteLength)
+        else:
+            with dst.open("wb") as w:
+                writer = ChunkWriter(w, self.alignment)
+                json_data, _ = self._write_bin(writer, meshes, instances, animations)
+                with profiling.phase(self.profiler, "write", ""):
+                    writer.write_chunk(b"JSON", json.dumps(json_data).encode("utf-8"))
+                    byteLength = writer.close()
+                    profiling.add_bytes(self.profiler, byteLength)
+
+        size = dst.stat().st_size
+        if size != byteLength:
+            raise Exception(f"write size: {size} != {byteLength}")
+
+    def _write_bin(
+        self,
+        writer: ChunkWriter,
+        meshes: Iterable[vertex_buffer.VertexBuffer],
+        instances: Optional[List[vertex_buffer.Instance]],
+        animations: Optional[List["animation.BakedAnimation"]],
+    ) -> Tuple[Root, Optional[List[Tuple[bytes, Tuple[float, int]]]]]:
+        """
+        the BIN (BINZ) chunk, or the chunks of progressive.
+        returns the JSON and Bin.chunks.
+        """
+        if not self.progressive:
+            writer.begin_chunk(b"BINZ" if self.compression else b"BIN\0")
+        if self.compression:
+            bin = CompressedBin(writer, self.compression, chunked=self.progressive)
+        else:
+            bin = Bin(writer, chunked=self.progressive)
+        try:
+            json_data = self._write_meshes(bin, meshes)
+            if animations:
+                json_data["animations"] = []
+                for i, baked in enumerate(animations):
+                    bin.begin_chunk(b"ANIM", (float("inf"), i))
+                    with profiling.phase(self.profiler, "serialize", baked.name):
+                        json_data["animations"].append(
+                            self._write_animation(bin, i, baked)
+                        )
+        finally:
+            bin.flush()
+        if writer.chunkLength is not None:
+            writer.end_chunk()
+
+        if instances is not None:
+            json_data["instances"] = [
+                Instance(mesh=instance.mesh, matrix=list(instance.matrix))
+                for instance in instances
+            ]
+        if self.embed_profile:
+            json_data["profile"] = self.profiler.report()
+        return json_data, bin.chunks
+
+    def _write_progressive(
+        self,
+        dst: pathlib.Path,
+        spool: BinaryIO,
+        spooled: List[ChunkInfo],
+        ranks: List[Tuple[bytes, Tuple[float, int]]],
+        json_data: Root,
+    ) -> int:
+        """
+        TOC, JSON and the spooled chunks by rank.
+        """
+        order = sorted(range(len(spooled)), key=lambda i: ranks[i][1])
+        # 0 is JSON
+        toc_index = {i: k + 1 for k, i in enumerate(order)}
+        for bufferView in json_data["bufferViews"]:
+            bufferView["chunk"] = toc_index[bufferView["chunk"]]
+
+        with dst.open("wb") as w:
+            writer = ChunkWriter(w, self.alignment)
+            writer.write_chunk(b"TOC\0", bytes(TOC_ENTRY.size * (len(order) + 1)))
+            writer.write_chunk(b"JSON", json.dumps(json_data).encode("utf-8"))
+            for i in order:
+                chunk = spooled[i]
+                writer.begin_chunk(chunk.chunkType)
+                spool.seek(chunk.byteOffset)
+                remaining = chunk.byteLength
+                while remaining:
+                    data = spool.read(min(remaining, 1 << 20))
+                    writer.write(data)
+                    remaining -= len(data)
+                writer.end_chunk()
 
-        bin = Bin()
+            w.seek(writer.chunks[0].byteOffset)
+            for chunk in writer.chunks[1:]:
+                w.write(
+                    TOC_ENTRY.pack(chunk.byteOffset, chunk.byteLength, chunk.chunkType)
+                )
+            w.seek(0, io.SEEK_END)
+            return writer.close()
+
+    def _write_meshes(
+        self, bin: Bin, meshes: Iterable[vertex_buffer.VertexBuffer]
+    ) -> Root:
         json_data = Root(
             asset=Asset(
                 version="alpha",
@@ -184,97 +770,260 @@ class Serializer:
             ),
             bufferViews=bin.bufferViews,
             textures=[],
-            materials=[Material(name="tmp", color=(1, 1, 1, 1), colorTexture=-1)],
+            materials=self.materials,
             meshes=[],
             bones=self.bones,
         )
         for i, vb in enumerate(meshes):
-            name = f"mesh{i}"
-            vert = bin.push(f"{name}.vert", vb.geometry)
-            tex = bin.push(f"{name}.tex", vb.colortex)
-            indx = bin.push(f"{name}.indx", vb.indices.indices)
-            mesh = Mesh(
-                name=name,
-                vertexCount=vb.vertex_count,
-                vertexStreams=[
+            with profiling.phase(self.profiler, "serialize", f"mesh{i}"):
+                first = len(bin.bufferViews)
+                name = f"mesh{i}"
+                bin.begin_chunk(b"MESH", (0, i))
+                if self.quantization:
+                    from . import quantize
+
+                    streams = quantize.get_vertex_streams(vb, self.quantization)
+                else:
+                    streams = get_vertex_streams(vb)
+                if self.interleave:
+                    streams = [interleave_vertex_streams(streams)]
+                vertexStreams = [
                     Stream(
-                        bufferView=vert,
-                        attributes=[
-                            Attribute(
-                                vertexAttribute="position", format="f32", dimension=3
-                            ),
-                            Attribute(
-                                vertexAttribute="normal", format="f32", dimension=3
-                            ),
-                            Attribute(
-                                vertexAttribute="tangent", format="f32", dimension=4
-                            ),
-                        ],
+                        bufferView=bin.push(f"{name}.{stream.name}", stream.data),
+                        attributes=stream.attributes,
+                    )
+                    for stream in streams
+                ]
+                morphTargets = []
+                if vb.morphs:
+                    from . import morph
+
+                    for j, target in enumerate(vb.morphs):
+                        stream, attributes = morph.quantize_deltas(target)
+                        morphTargets.append(
+                            MorphTarget(
+                                name=target.name,
+                                count=len(stream),
+                                indices=bin.push(
+                                    f"{name}.morph{j}.indx",
+                                    target.indices,
+                                    filter="delta",
+                                ),
+                                bufferView=bin.push(
+                                    f"{name}.morph{j}", memoryview(stream)
+                                ),
+                                attributes=attributes,
+                            )
+                        )
+                # the coarsest first. each finer index buffer is a LOD chunk
+                levels = [vb.indices] + [lod.indices for lod in vb.lods or []]
+                indx = [0] * len(levels)
+                for step, level in enumerate(reversed(range(len(levels)))):
+                    if step:
+                        bin.begin_chunk(b"LOD\0", (step, i))
+                    indx[level] = bin.push(
+                        f"{name}.lod{level}.indx" if level else f"{name}.indx",
+                        levels[level].indices,
+                        filter="delta",
+                    )
+                mesh = Mesh(
+                    name=name,
+                    vertexCount=vb.vertex_count,
+                    vertexStreams=vertexStreams,
+                    indices=Indices(
+                        stride=vb.indices.stride,
+                        bufferView=indx[0],
                     ),
-                    Stream(
-                        bufferView=tex,
-                        attributes=[
-                            Attribute(
-                                vertexAttribute="color", format="f32", dimension=4
-                            ),
-                            Attribute(
-                                vertexAttribute="tex0", format="f32", dimension=2
-                            ),
-                            Attribute(
-                                vertexAttribute="tex1", format="f32", dimension=2
+                    subMeshes=get_submeshes(vb),
+                    joints=[],
+                )
+                if morphTargets:
+                    mesh["morphTargets"] = morphTargets
+                positions = vertex_buffer.as_array(
+                    vb.geometry, vertex_buffer.GEOMETRY_DTYPE
+                )["position"]
+                if len(positions):
+                    mesh["bounds"] = [
+                        *positions.min(axis=0).tolist(),
+                        *positions.max(axis=0).tolist(),
+                    ]
+                for submesh in mesh["subMeshes"]:
+                    submesh["material"] = self.get_or_create_material(
+                        vb.materials[submesh["material"]] if vb.materials else None
+                    )
+
+                if vb.skinning:
+                    joint_map = {joint.name: joint for joint in vb.skinning.joints}
+                    mesh["joints"] = [
+                        self.get_or_create_joint(joint_map, joint)
+                        for joint in vb.skinning.joints
+                    ]
+                    for submesh in mesh["subMeshes"]:
+                        if "joints" in submesh:
+                            submesh["joints"] = [
+                                mesh["joints"][j] for j in submesh["joints"]
+                            ]
+                    skin = vertex_buffer.as_array(
+                        vb.skinning.skinning, vb.skinning.get_dtype()
+                    )
+                    self.bone_bounds.add(
+                        positions,
+                        skeleton.vertex_bones(
+                            skin["joints"], mesh["joints"], mesh["subMeshes"]
+                        ),
+                        skin["weights"],
+                    )
+
+                if vb.lods:
+                    mesh["lods"] = [
+                        MeshLod(
+                            error=lod.error,
+                            indices=Indices(
+                                stride=lod.indices.stride,
+                                bufferView=indx[j + 1],
                             ),
-                        ],
+                            subMeshes=[
+                                SubMesh(submesh, drawCount=draw_count)
+                                for submesh, draw_count in zip(
+                                    mesh["subMeshes"],
+                                    (
+                                        [s.draw_count for s in lod.submeshes]
+                                        if lod.submeshes
+                                        else [lod.indices.get_draw_count()]
+                                    ),
+                                )
+                            ],
+                        )
+                        for j, lod in enumerate(vb.lods)
+                    ]
+
+                profiling.add_bytes(
+                    self.profiler,
+                    sum(
+                        (
+                            bufferView["compression"]["byteLength"]
+                            if "compression" in bufferView
+                            else bufferView["byteLength"]
+                        )
+                        for bufferView in bin.bufferViews[first:]
                     ),
-                ],
-                indices=Indices(
-                    stride=vb.indices.stride,
-                    bufferView=indx,
-                ),
-                subMeshes=[SubMesh(material=0, drawCount=vb.indices.get_draw_count())],
-                joints=[],
-            )
+                )
+                json_data["meshes"].append(mesh)
 
-            if vb.skinning:
-                joint_map = {joint.name: joint for joint in vb.skinning.joints}
-                skin = bin.push(f"{name}.skin", vb.skinning.skinning)
-                mesh["vertexStreams"].append(
-                    Stream(
-                        bufferView=skin,
-                        attributes=[
-                            Attribute(
-                                vertexAttribute="blendWeights",
-                                format="f32",
-                                dimension=4,
-                            ),
-                            Attribute(
-                                vertexAttribute="blendIndices",
-                                format="u16",
-                                dimension=4,
-                            ),
-                        ],
-                    )
+        if self.bones:
+            bin.begin_chunk(b"BONE", (-1, 0))
+            inverse_bind_matrices, rotations, scales = skeleton.get_bind_pose(
+                [bone["head"] for bone in self.bones], self.rotations, self.scales
+            )
+            json_data["inverseBindMatrices"] = bin.push(
+                "bones.ibm", memoryview(inverse_bind_matrices)
+            )
+            if any(self.rotations):
+                json_data["restRotations"] = bin.push(
+                    "bones.rotation", memoryview(rotations)
                 )
-                mesh["joints"] = [
-                    self.get_or_create_joint(joint_map, joint)
-                    for joint in vb.skinning.joints
-                ]
+            if not np.allclose(scales, 1, atol=1e-5):
+                json_data["restScales"] = bin.push("bones.scale", memoryview(scales))
+            json_data["boneBounds"] = bin.push(
+                "bones.bounds", memoryview(self.bone_bounds.get(len(self.bones)))
+            )
 
-            json_data["meshes"].append(mesh)
+        return json_data
 
-        print(json.dumps(json_data, indent=2))
-        json_chunk = json.dumps(json_data).encode("utf-8")
+    def _write_animation(
+        self, bin: Bin, index: int, baked: "animation.BakedAnimation"
+    ) -> Animation:
+        from . import animation
 
-        # glb like format
-        calcSize = write_chunks(
-            dst,
-            Chunk(b"JSON", json_chunk),
-            Chunk(b"BIN\0", bin.stream.getvalue()),
-        )
+        bone_map = {bone["name"]: i for i, bone in enumerate(self.bones)}
+        channels: List[AnimationChannel] = []
+        times = []
+        values: Dict[str, List[np.ndarray]] = {
+            "translation": [],
+            "rotation": [],
+            "scale": [],
+        }
+        time_offset = 0
+        value_offsets = {path: 0 for path in values}
+        for channel in baked.channels:
+            if channel.bone not in bone_map:
+                continue
+            count = len(channel.frames)
+            channels.append(
+                AnimationChannel(
+                    bone=bone_map[channel.bone],
+                    path=channel.path,
+                    keyCount=count,
+                    timeOffset=time_offset,
+                    valueOffset=value_offsets[channel.path],
+                )
+            )
+            times.append(channel.frames.astype(np.uint16))
+            values[channel.path].append(channel.values)
+            time_offset += count
+            value_offsets[channel.path] += count
 
-        result = dst.read_bytes()
-        assert (len(result) == calcSize, "write size")
+        def concat(arrays: List[np.ndarray], shape, dtype) -> np.ndarray:
+            return np.concatenate(
+                [np.zeros(shape, dtype)] + [a.astype(dtype) for a in arrays]
+            )
+
+        name = f"animation{index}"
+        return Animation(
+            name=baked.name,
+            fps=baked.fps,
+            frameCount=baked.frame_count,
+            times=bin.push(
+                f"{name}.time",
+                memoryview(concat(times, (0,), np.uint16)),
+                filter="delta",
+            ),
+            translations=bin.push(
+                f"{name}.translation",
+                memoryview(concat(values["translation"], (0, 3), np.float32)),
+            ),
+            rotations=bin.push(
+                f"{name}.rotation",
+                memoryview(
+                    concat(
+                        [
+                            animation.encode_smallest_three(r)
+                            for r in values["rotation"]
+                        ],
+                        (0, 3),
+                        np.uint16,
+                    )
+                ),
+            ),
+            scales=bin.push(
+                f"{name}.scale",
+                memoryview(concat(values["scale"], (0, 3), np.float32)),
+            ),
+            channels=channels,
+        )
 
 
-def serialize(dst: pathlib.Path, meshes: List[vertex.VertexBuffer]):
-    s = Serializer()
-    s.serialize(dst, meshes)
+def serialize(
+    dst: pathlib.Path,
+    meshes: Iterable[vertex_buffer.VertexBuffer],
+    *,
+    quantization: Optional["quantize.Quantization"] = None,
+    compression: Optional[str] = None,
+    instances: Optional[List[vertex_buffer.Instance]] = None,
+    animations: Optional[List["animation.BakedAnimation"]] = None,
+    alignment: int = 1,
+    interleave: bool = False,
+    progressive: bool = False,
+    profiler: Optional[profiling.Profiler] = None,
+    embed_profile: bool = False,
+):
+    s = Serializer(
+        quantization=quantization,
+        compression=compression,
+        alignment=alignment,
+        interleave=interleave,
+        progressive=progressive,
+        profiler=profiler,
+        embed_profile=embed_profile,
+    )
+    s.serialize(dst, meshes, instances, animations)
@@ -0,0 +1,221 @@
+"""
+the bind pose of Root.bones in bulk.
+
+the bind transform of a bone is translate(head) @ rotate(rotation) @ scale(scale)
+in the export space. without the rotation it is translate(head), as the runtime
+rebuilds it from the heads. a mirror is the negative x scale.
+"""
+
+from typing import List, Optional, Tuple, Iterable, TYPE_CHECKING
+import numpy as np
+
+if TYPE_CHECKING:
+    from . import serialization
+
+
+def matrix_to_quaternion(m: np.ndarray) -> np.ndarray:
+    """
+    (N, 3, 3) => (N, 4) xyzw. the scale is removed.
+    a mirror (det < 0) flips the x axis to make a rotation.
+    """
+    m = np.array(m, np.float64)
+    m /= np.linalg.norm(m, axis=1, keepdims=True)
+    m[np.linalg.det(m) < 0, :, 0] *= -1
+
+    # Shepperd. the largest of w, x, y, z is the pivot
+    trace = m[:, 0, 0] + m[:, 1, 1] + m[:, 2, 2]
+    candidates = np.stack(
+        [
+            1 + trace,
+            1 + m[:, 0, 0] - m[:, 1, 1] - m[:, 2, 2],
+            1 - m[:, 0, 0] + m[:, 1, 1] - m[:, 2, 2],
+            1 - m[:, 0, 0] - m[:, 1, 1] + m[:, 2, 2],
+        ],
+        axis=1,
+    )
+    pivot = np.argmax(candidates, axis=1)
+    s = np.sqrt(np.maximum(candidates[np.arange(len(m)), pivot], 1e-20)) * 2
+    q = np.empty((len(m), 4))
+    q_w = np.stack(
+        [
+            m[:, 2, 1] - m[:, 1, 2],
+            m[:, 0, 2] - m[:, 2, 0],
+            m[:, 1, 0] - m[:, 0, 1],
+            s * s / 4,
+        ],
+        axis=1,
+    )
+    q_x = np.stack(
+        [
+            s * s / 4,
+            m[:, 0, 1] + m[:, 1, 0],
+            m[:, 0, 2] + m[:, 2, 0],
+            m[:, 2, 1] - m[:, 1, 2],
+        ],
+        axis=1,
+    )
+    q_y = np.stack(
+        [
+            m[:, 0, 1] + m[:, 1, 0],
+            s * s / 4,
+            m[:, 1, 2] + m[:, 2, 1],
+            m[:, 0, 2] - m[:, 2, 0],
+        ],
+        axis=1,
+    )
+    q_z = np.stack(
+        [
+            m[:, 0, 2] + m[:, 2, 0],
+            m[:, 1, 2] + m[:, 2, 1],
+            s * s / 4,
+            m[:, 1, 0] - m[:, 0, 1],
+        ],
+        axis=1,
+    )
+    for k, values in enumerate((q_w, q_x, q_y, q_z)):
+        selected = pivot == k
+        q[selected] = values[selected] / s[selected, None]
+    # w >= 0
+    q[q[:, 3] < 0] *= -1
+    return q
+
+
+def decompose(m: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (N, 3, 3) => rotation (N, 4) xyzw, scale (N, 3).
+    m = rotate(rotation) @ scale(scale). the mirror is the negative x scale.
+    """
+    m = np.asarray(m, np.float64)
+    scale = np.linalg.norm(m, axis=1)
+    scale[np.linalg.det(m) < 0, 0] *= -1
+    return matrix_to_quaternion(m), scale
+
+
+def quaternion_to_matrix(q: np.ndarray) -> np.ndarray:
+    """
+    (N, 4) xyzw => (N, 3, 3)
+    """
+    x, y, z, w = np.asarray(q, np.float64).T
+    return np.stack(
+        [
+            np.stack(
+                [1 - 2 * (y * y + z * z), 2 * (x * y - z * w), 2 * (x * z + y * w)], 1
+            ),
+            np.stack(
+                [2 * (x * y + z * w), 1 - 2 * (x * x + z * z), 2 * (y * z - x * w)], 1
+            ),
+            np.stack(
+                [2 * (x * z - y * w), 2 * (y * z + x * w), 1 - 2 * (x * x + y * y)], 1
+            ),
+        ],
+        axis=1,
+    )
+
+
+def inverse_bind_matrices(
+    heads: np.ndarray, rotations: np.ndarray, scales: np.ndarray
+) -> np.ndarray:
+    """
+    (N, 3), (N, 4) xyzw and (N, 3) => (N, 4, 4) row major. export space => bone space.
+    inverse(translate(head) @ rotate(rotation) @ scale(scale))
+    = [S^-1 @ R.T, -S^-1 @ R.T @ head]
+    """
+    inverse = quaternion_to_matrix(rotations).transpose(0, 2, 1) / np.asarray(
+        scales, np.float64
+    ).reshape(-1, 3, 1)
+    m = np.zeros((len(heads), 4, 4))
+    m[:, :3, :3] = inverse
+    m[:, :3, 3] = -np.einsum("nij,nj->ni", inverse, np.asarray(heads, np.float64))
+    m[:, 3, 3] = 1
+    return m
+
+
+def vertex_bones(
+    blend_indices: np.ndarray,
+    joints: List[int],
+    submeshes: Iterable["serialization.SubMesh"],
+) -> np.ndarray:
+    """
+    blendIndices => the index of Root.bones. the SubMesh palettes are resolved.
+    """
+    bones = np.array(joints or [0], np.int64)[blend_indices]
+    for s in submeshes:
+        if "joints" in s:
+            begin = s["baseVertex"]
+            end = begin + s["vertexCount"]
+            bones[begin:end] = np.array(s["joints"] or [0], np.int64)[
+                blend_indices[begin:end]
+            ]
+    return bones
+
+
+class BoneBounds:
+    """
+    the AABB of the vertices that each bone influences. in the bind pose.
+    a runtime transforms it by the skinning matrix of the bone to cull
+    the skinned mesh without skinning.
+    """
+
+    def __init__(self) -> None:
+        self.min = np.full((0, 3), np.inf)
+        self.max = np.full((0, 3), -np.inf)
+
+    def _reserve(self, count: int):
+        if count > len(self.min):
+            grow = count - len(self.min)
+            self.min = np.concatenate([self.min, np.full((grow, 3), np.inf)])
+            self.max = np.concatenate([self.max, np.full((grow, 3), -np.inf)])
+
+    def add(self, positions: np.ndarray, bones: np.ndarray, weights: np.ndarray):
+        """
+        positions (N, 3), bones (N, influences) of Root.bones, weights (N, influences)
+        """
+        used = weights > 0
+        ids = bones[used]
+        if len(ids) == 0:
+            return
+        points = np.broadcast_to(positions[:, None, :], bones.shape + (3,))[used]
+        order = np.argsort(ids, kind="stable")
+        ids = ids[order]
+        points = points[order]
+        starts = np.flatnonzero(np.concatenate([[True], ids[1:] != ids[:-1]]))
+        unique = ids[starts]
+        self._reserve(int(unique[-1]) + 1)
+        self.min[unique] = np.minimum(
+            self.min[unique], np.minimum.reduceat(points, starts)
+        )
+        self.max[unique] = np.maximum(
+            self.max[unique], np.maximum.reduceat(points, starts)
+        )
+
+    def get(self, bone_count: int) -> np.ndarray:
+        """
+        (bone_count, 6) float32. min xyz, max xyz. min > max for no vertex.
+        """
+        self._reserve(bone_count)
+        return np.concatenate([self.min, self.max], axis=1)[:bone_count].astype(
+            np.float32
+        )
+
+
+def get_bind_pose(
+    heads: List[Tuple[float, float, float]],
+    rotations: List[Optional[Tuple[float, float, float, float]]],
+    scales: List[Optional[Tuple[float, float, float]]],
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    (inverse bind matrices (N, 16), rotations (N, 4), scales (N, 3)) float32.
+    None is identity.
+    """
+    r = np.array(
+        [rotation or (0.0, 0.0, 0.0, 1.0) for rotation in rotations], np.float64
+    ).reshape(-1, 4)
+    s = np.array([scale or (1.0, 1.0, 1.0) for scale in scales], np.float64).reshape(
+        -1, 3
+    )
+    m = inverse_bind_matrices(np.array(heads, np.float64).reshape(-1, 3), r, s)
+    return (
+        m.reshape(-1, 16).astype(np.float32),
+        r.astype(np.float32),
+        s.astype(np.float32),
+    )
@@ -0,0 +1,80 @@
+"""
+blend skinning influences.
+
+the vertex group weights are gathered as a sparse (vertex, group, weight) list once
+per mesh. the top K joints of each vertex are kept and renormalized.
+"""
+
+from typing import NamedTuple, Tuple
+import numpy as np
+from . import vertex_buffer
+
+
+class InfluenceStats(NamedTuple):
+    vertex_count: int
+    truncated: int  # vertices that lost some weight
+    discarded: float  # sum of the lost weight ratio
+    max_discarded: float  # the largest lost weight ratio of a vertex
+
+    def __str__(self) -> str:
+        mean = self.discarded / self.vertex_count if self.vertex_count else 0
+        return (
+            f"influences: {self.truncated}/{self.vertex_count} vertices truncated, "
+            f"discarded weight mean {mean:.4f}, max {self.max_discarded:.4f}"
+        )
+
+
+def top_k(
+    vertices: np.ndarray,
+    groups: np.ndarray,
+    weights: np.ndarray,
+    vertex_count: int,
+    group_to_joint: np.ndarray,
+    influences: int = 4,
+    threshold: float = 0.0,
+) -> Tuple[np.ndarray, InfluenceStats]:
+    """
+    vertices, groups, weights: the sparse vertex group weights.
+    group_to_joint: vertex group index => joint index. negative is not a joint.
+
+    the joints of each vertex are sorted by weight. the influences largest that
+    are at least threshold (of the vertex total) are kept and renormalized.
+    returns (vertex_buffer.skin_dtype(influences) array, stats)
+    """
+    vertices = np.asarray(vertices, np.int64)
+    joints = np.asarray(group_to_joint, np.int64)[np.asarray(groups, np.int64)]
+    weights = np.asarray(weights, np.float32)
+    valid = (joints >= 0) & (weights > 0)
+    vertices = vertices[valid]
+    joints = joints[valid]
+    weights = weights[valid]
+
+    total = np.bincount(vertices, weights, vertex_count)
+
+    # by vertex, then heavier first
+    # vertex + [0, 0.5). one argsort, much faster than np.lexsort
+    key = vertices + 0.5 * (
+        1 - weights.astype(np.float64) / max(weights.max(initial=0), 1)
+    )
+    order = np.argsort(key)
+    vertices = vertices[order]
+    joints = joints[order]
+    weights = weights[order]
+    run_start = np.searchsorted(vertices, vertices, side="left")
+    rank = np.arange(len(vertices)) - run_start
+
+    keep = (rank < influences) & (weights >= threshold * total[vertices])
+    kept = np.bincount(vertices[keep], weights[keep], vertex_count)
+
+    dst = np.zeros(vertex_count, vertex_buffer.skin_dtype(influences))
+    # kept entries are a prefix of each run, so rank is the slot
+    dst["joints"][vertices[keep], rank[keep]] = joints[keep]
+    dst["weights"][vertices[keep], rank[keep]] = weights[keep] / kept[vertices[keep]]
+
+    ratio = np.divide(total - kept, total, out=np.zeros(vertex_count), where=total > 0)
+    return dst, InfluenceStats(
+        vertex_count,
+        int(np.count_nonzero(ratio > 1e-6)),
+        float(ratio.sum()),
+        float(ratio.max()) if vertex_count else 0.0,
+    )
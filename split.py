@@ -0,0 +1,184 @@
+"""
+split the index buffer into submeshes by the number of distinct keys.
+"""
+
+from typing import List, Optional, Tuple
+import numpy as np
+from . import vertex_buffer
+from . import weld
+
+
+def greedy_cuts(keys: np.ndarray, limit: int) -> List[int]:
+    """
+    keys: (triangles, n). negative is no key.
+
+    split the triangles in order, so that each part has at most limit distinct keys.
+    returns the first triangle of each part.
+
+    the window is doubled until a part is closed, so each part costs
+    O(size log size).
+    """
+    tri_count, n = keys.shape
+    flat = keys.ravel()
+    starts: List[int] = []
+    start = 0
+    while start < tri_count:
+        starts.append(start)
+        window = max(limit // n, 1)
+        while True:
+            end = min(tri_count, start + window)
+            k = flat[start * n : end * n]
+            valid = np.flatnonzero(k >= 0)
+            _, first = np.unique(k[valid], return_index=True)
+            if len(first) > limit:
+                # the first key over the limit begins the next part
+                end = start + int(np.sort(valid[first])[limit]) // n
+                if end == start:
+                    raise ValueError(f"a triangle has more than {limit} keys")
+                break
+            if end == tri_count:
+                break
+            window *= 2
+        start = end
+    return starts
+
+
+def _material_cuts(
+    vb: vertex_buffer.VertexBuffer, starts: List[int], tri_count: int
+) -> Tuple[List[int], np.ndarray]:
+    """
+    the material ranges are also part boundaries.
+    returns (starts, material_of_triangle)
+    """
+    material_of_triangle = np.zeros(tri_count, np.int64)
+    if vb.submeshes:
+        begin = 0
+        cuts = set(starts)
+        for s in vb.submeshes:
+            cuts.add(begin // 3)
+            material_of_triangle[begin // 3 : (begin + s.draw_count) // 3] = s.material
+            begin += s.draw_count
+        starts = sorted(c for c in cuts if c < tri_count)
+    return starts, material_of_triangle
+
+
+def _split(
+    vb: vertex_buffer.VertexBuffer,
+    triangles: np.ndarray,
+    starts: List[int],
+    joint_keys: Optional[np.ndarray] = None,
+) -> vertex_buffer.VertexBuffer:
+    """
+    a SubMesh with a vertex range for each part.
+    vertices shared by the parts are duplicated.
+
+    joint_keys: (triangles, 3 * influences). each part gets a joint palette and
+    the blend indices are rewritten into the palette.
+    """
+    starts, material_of_triangle = _material_cuts(vb, starts, len(triangles))
+
+    src = []
+    local = []
+    palettes = []
+    submeshes: List[vertex_buffer.SubMesh] = []
+    base_vertex = 0
+    for start, end in zip(starts, starts[1:] + [len(triangles)]):
+        flat = triangles[start:end].ravel()
+        used, first = np.unique(flat, return_index=True)
+        used = used[np.argsort(first)]
+        remap = np.empty(vb.vertex_count, np.int64)
+        remap[used] = np.arange(len(used))
+        src.append(used)
+        local.append(remap[flat])
+        palette = None
+        if joint_keys is not None:
+            keys = joint_keys[start:end].ravel()
+            keys = keys[keys >= 0]
+            palette, first = np.unique(keys, return_index=True)
+            palette = palette[np.argsort(first)].tolist()
+            palettes.append(palette)
+        submeshes.append(
+            vertex_buffer.SubMesh(
+                draw_count=len(flat),
+                material=int(material_of_triangle[start]),
+                base_vertex=base_vertex,
+                vertex_count=len(used),
+                joints=palette,
+            )
+        )
+        base_vertex += len(used)
+
+    result = weld.take_vertices(
+        vb, np.concatenate(src), np.concatenate(local), submeshes
+    )
+    if joint_keys is None:
+        return result
+
+    skin = vertex_buffer.as_array(
+        result.skinning.skinning, result.skinning.get_dtype()
+    ).copy()
+    for submesh, palette in zip(submeshes, palettes):
+        to_local = np.zeros(len(vb.skinning.joints), np.uint16)
+        to_local[palette] = np.arange(len(palette))
+        joints = skin["joints"][
+            submesh.base_vertex : submesh.base_vertex + submesh.vertex_count
+        ]
+        joints[:] = to_local[joints]
+    return result._replace(skinning=result.skinning._replace(skinning=memoryview(skin)))
+
+
+def split_by_vertex_count(
+    vb: vertex_buffer.VertexBuffer, limit: int = 65535
+) -> vertex_buffer.VertexBuffer:
+    """
+    split into submeshes that address at most limit vertices each,
+    so that the mesh can use 16 bit indices with baseVertex.
+
+    the triangle order is kept (run after optimize.optimize_indices for locality).
+    vertices shared by the submeshes are duplicated.
+    """
+    if vb.vertex_count <= limit:
+        return vb
+    if vb.submeshes and any(s.vertex_count is not None for s in vb.submeshes):
+        raise ValueError("split mesh")
+
+    indices = vertex_buffer.as_array(vb.indices.indices, vb.indices.get_dtype())
+    triangles = indices.reshape(-1, 3).astype(np.int64)
+    return _split(vb, triangles, greedy_cuts(triangles, limit))
+
+
+def split_by_joint_palette(
+    vb: vertex_buffer.VertexBuffer,
+    palette_size: int = 64,
+    vertex_limit: Optional[int] = None,
+) -> vertex_buffer.VertexBuffer:
+    """
+    split into submeshes that refer to at most palette_size joints each,
+    for the GPU skinning with a fixed size joint palette.
+    SubMesh.joints is the palette and the blend indices are into it.
+
+    vertex_limit: also split_by_vertex_count.
+    """
+    if not vb.skinning or len(vb.skinning.joints) <= palette_size:
+        if vertex_limit:
+            return split_by_vertex_count(vb, vertex_limit)
+        return vb
+    if vb.submeshes and any(s.vertex_count is not None for s in vb.submeshes):
+        raise ValueError("split mesh")
+
+    indices = vertex_buffer.as_array(vb.indices.indices, vb.indices.get_dtype())
+    triangles = indices.reshape(-1, 3).astype(np.int64)
+    skin = vertex_buffer.as_array(vb.skinning.skinning, vb.skinning.get_dtype())
+    # the joints that have weight
+    vertex_keys = np.where(skin["weights"] > 0, skin["joints"].astype(np.int64), -1)
+    joint_keys = vertex_keys[triangles].reshape(len(triangles), -1)
+
+    starts = greedy_cuts(joint_keys, palette_size)
+    if vertex_limit:
+        refined = []
+        for start, end in zip(starts, starts[1:] + [len(triangles)]):
+            refined += [
+                start + s for s in greedy_cuts(triangles[start:end], vertex_limit)
+            ]
+        starts = refined
+    return _split(vb, triangles, starts, joint_keys)
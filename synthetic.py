@@ -0,0 +1,170 @@
+"""
+procedural MeshSource of any size, for bench.py and the checks outside blender.
+
+a quad is 4 loops and 2 triangles, as a blender mesh of quads.
+"""
+
+import math
+import numpy as np
+from . import vertex_buffer
+from .mesh_source import MeshSource, MeshWeights
+
+
+def _normalize(v: np.ndarray) -> np.ndarray:
+    length = np.linalg.norm(v, axis=-1, keepdims=True)
+    return np.divide(v, length, out=np.zeros_like(v), where=length > 0)
+
+
+def _quads(
+    name: str,
+    positions: np.ndarray,
+    uvs: np.ndarray,
+    quads: np.ndarray,
+) -> MeshSource:
+    """
+    quads: (quads, 4) vertex index, counter clockwise. uvs are of the vertices.
+    """
+    loop_vertex = quads.reshape(-1).astype(np.int32)
+    loop = np.arange(len(loop_vertex), dtype=np.uint32).reshape(-1, 4)
+    triangles = np.stack([loop[:, [0, 1, 2]], loop[:, [0, 2, 3]]], axis=1).reshape(
+        -1, 3
+    )
+
+    p = positions[loop_vertex[triangles]]
+    face = np.cross(p[:, 1] - p[:, 0], p[:, 2] - p[:, 0])
+    # area weighted
+    vertex_normals = np.stack(
+        [
+            np.bincount(
+                loop_vertex[triangles].reshape(-1),
+                np.repeat(face[:, k], 3),
+                len(positions),
+            )
+            for k in range(3)
+        ],
+        axis=1,
+    )
+    return MeshSource(
+        name=name,
+        positions=positions.astype(np.float32),
+        vertex_normals=_normalize(vertex_normals).astype(np.float32),
+        loop_vertex=loop_vertex,
+        triangles=triangles,
+        triangle_normals=_normalize(face).astype(np.float32),
+        use_smooth=np.ones(len(triangles), bool),
+        uv=uvs[loop_vertex].astype(np.float32),
+    )
+
+
+def _grid_quads(columns: int, rows: int) -> np.ndarray:
+    """
+    the quads of (rows + 1) x (columns + 1) vertices.
+    """
+    v = np.arange((rows + 1) * (columns + 1)).reshape(rows + 1, columns + 1)
+    return np.stack([v[:-1, :-1], v[:-1, 1:], v[1:, 1:], v[1:, :-1]], axis=-1).reshape(
+        -1, 4
+    )
+
+
+def grid(
+    columns: int,
+    rows: int,
+    *,
+    size: float = 1.0,
+    height: float = 0.05,
+    materials: int = 1,
+    name: str = "grid",
+) -> MeshSource:
+    """
+    on the xz plane, facing +y, with a sine wave of height.
+    materials: the rows are split into the slots.
+    """
+    u, v = np.meshgrid(np.linspace(0, 1, columns + 1), np.linspace(0, 1, rows + 1))
+    positions = np.stack(
+        [
+            (u - 0.5) * size,
+            height * np.sin(u * 6 * math.pi) * np.cos(v * 4 * math.pi),
+            (0.5 - v) * size,
+        ],
+        axis=-1,
+    ).reshape(-1, 3)
+    source = _quads(
+        name,
+        positions,
+        np.stack([u, v], axis=-1).reshape(-1, 2),
+        _grid_quads(columns, rows),
+    )
+    if materials > 1:
+        row = np.arange(len(source.triangles)) // (2 * columns)
+        source = source._replace(
+            triangle_materials=(row * materials // rows).astype(np.int32),
+            materials=[f"material{i}" for i in range(materials)],
+        )
+    return source
+
+
+def tube(
+    segments: int,
+    rings: int,
+    *,
+    radius: float = 0.1,
+    length: float = 1.0,
+    bones: int = 4,
+    name: str = "tube",
+) -> MeshSource:
+    """
+    along +y, skinned to a chain of bones. each vertex is weighted to the two
+    nearest bones linearly. the seam has its own vertices for the uv.
+    """
+    u, v = np.meshgrid(np.linspace(0, 1, segments + 1), np.linspace(0, 1, rings + 1))
+    angle = u * 2 * math.pi
+    positions = np.stack(
+        [radius * np.cos(angle), v * length, -radius * np.sin(angle)], axis=-1
+    ).reshape(-1, 3)
+    source = _quads(
+        name,
+        positions,
+        np.stack([u, v], axis=-1).reshape(-1, 2),
+        _grid_quads(segments, rings),
+    )
+
+    bones = max(bones, 1)
+    t = v.reshape(-1) * (bones - 1)
+    first = np.minimum(np.floor(t), max(bones - 2, 0)).astype(np.int64)
+    second = np.minimum(first + 1, bones - 1)
+    f = np.clip(t - first, 0, 1).astype(np.float32)
+    vertex_count = len(positions)
+    step = length / max(bones - 1, 1)
+    return source._replace(
+        weights=MeshWeights(
+            vertices=np.repeat(np.arange(vertex_count), 2),
+            groups=np.stack([first, second], axis=1).reshape(-1),
+            weights=np.stack([1 - f, f], axis=1).reshape(-1),
+            group_to_joint=np.arange(bones),
+            joints=[
+                vertex_buffer.Joint(
+                    name=f"{name}.bone{i}",
+                    position=(0.0, i * step, 0.0),
+                    is_connected=i > 0,
+                    parent=f"{name}.bone{i - 1}" if i else None,
+                )
+                for i in range(bones)
+            ],
+        )
+    )
+
+
+def grid_for_corners(corners: int, **kw) -> MeshSource:
+    """
+    a square grid of about corners loops.
+    """
+    side = max(1, round(math.sqrt(corners / 4)))
+    return grid(side, side, **kw)
+
+
+def tube_for_corners(corners: int, **kw) -> MeshSource:
+    """
+    a tube of about corners loops, 4 rings for each segment.
+    """
+    segments = max(3, round(math.sqrt(corners / 16)))
+    return tube(segments, max(1, round(corners / 4 / segments)), **kw)
@@ -0,0 +1,127 @@
+"""
+per corner tangents from positions, normals and tex0.
+
+close to MikkTSpace: the triangle tangents are normalized and weighted by the
+corner angle, and summed over the corners that have the same position, normal
+and uv. then orthogonalized to the normal. w is the handedness.
+
+bitangent = w * cross(normal, tangent.xyz). the same as blender.
+"""
+
+from typing import NamedTuple
+import numpy as np
+from . import vertex_buffer
+from . import weld
+
+
+class TangentStats(NamedTuple):
+    count: int
+    mean_error: float  # degree
+    max_error: float  # degree
+    flipped: int  # handedness mismatch
+
+    def __str__(self) -> str:
+        return (
+            f"tangent: {self.count} corners, error mean {self.mean_error:.3f} deg, "
+            f"max {self.max_error:.3f} deg, {self.flipped} flipped"
+        )
+
+
+def _normalize(v: np.ndarray) -> np.ndarray:
+    length = np.sqrt(np.einsum("...i,...i->...", v, v))[..., None]
+    return np.divide(v, length, out=np.zeros_like(v), where=length > 1e-20)
+
+
+def compute_tangents(
+    positions: np.ndarray, normals: np.ndarray, uvs: np.ndarray, indices: np.ndarray
+) -> np.ndarray:
+    """
+    positions (N, 3), normals (N, 3), uvs (N, 2), indices (triangles * 3)
+    returns (N, 4) float32
+    """
+    count = len(positions)
+    positions = np.ascontiguousarray(positions, np.float32)
+    normals = _normalize(np.asarray(normals, np.float32))
+    uvs = np.ascontiguousarray(uvs, np.float32)
+    triangles = np.asarray(indices, np.int64).reshape(-1, 3)
+
+    p = positions[triangles]
+    t = uvs[triangles]
+    e1 = p[:, 1] - p[:, 0]
+    e2 = p[:, 2] - p[:, 0]
+    d1 = t[:, 1] - t[:, 0]
+    d2 = t[:, 2] - t[:, 0]
+    det = d1[:, 0] * d2[:, 1] - d2[:, 0] * d1[:, 1]
+    # the orientation only. degenerate uv contributes nothing
+    sign = np.sign(det)[:, None]
+    sdir = _normalize((e1 * d2[:, 1:2] - e2 * d1[:, 1:2]) * sign)
+    tdir = _normalize((e2 * d1[:, 0:1] - e1 * d2[:, 0:1]) * sign)
+
+    # corner angle. edges[:, k] is the corner k => the corner k + 1
+    edges = _normalize(np.roll(p, -1, axis=1) - p)
+    angles = np.arccos(
+        np.clip(-np.einsum("tki,tki->tk", edges, np.roll(edges, 1, axis=1)), -1, 1)
+    )
+
+    # the corners that are one vertex for MikkTSpace
+    group, representative = weld.unique_rows(weld._pack_rows([positions, normals, uvs]))
+    corner_group = group[triangles].ravel()
+    group_count = len(representative)
+    weighted_s = (angles[:, :, None] * sdir[:, None, :]).reshape(-1, 3)
+    weighted_t = (angles[:, :, None] * tdir[:, None, :]).reshape(-1, 3)
+    tangent = np.empty((group_count, 3), np.float32)
+    bitangent = np.empty((group_count, 3), np.float32)
+    for c in range(3):
+        tangent[:, c] = np.bincount(corner_group, weighted_s[:, c], group_count)
+        bitangent[:, c] = np.bincount(corner_group, weighted_t[:, c], group_count)
+    tangent = tangent[group]
+    bitangent = bitangent[group]
+
+    # Gram-Schmidt
+    tangent -= normals * np.einsum("ij,ij->i", normals, tangent)[:, None]
+    tangent = _normalize(tangent)
+    # no uv. any perpendicular
+    missing = ~tangent.any(axis=1)
+    if missing.any():
+        n = normals[missing]
+        axis = np.where(np.abs(n[:, :1]) < 0.9, [[1.0, 0, 0]], [[0, 1.0, 0]])
+        tangent[missing] = _normalize(np.cross(axis, n))
+
+    result = np.empty((count, 4), np.float32)
+    result[:, :3] = tangent
+    result[:, 3] = np.where(
+        np.einsum("ij,ij->i", np.cross(normals, tangent), bitangent) < 0, -1.0, 1.0
+    )
+    return result
+
+
+def fill_tangents(vb: vertex_buffer.VertexBuffer):
+    """
+    compute_tangents into vb.geometry. the geometry must be writable.
+    """
+    geometry = vertex_buffer.as_array(vb.geometry, vertex_buffer.GEOMETRY_DTYPE)
+    colortex = vertex_buffer.as_array(vb.colortex, vertex_buffer.COLORTEX_DTYPE)
+    geometry["tangent"] = compute_tangents(
+        geometry["position"],
+        geometry["normal"],
+        colortex["tex0"],
+        vertex_buffer.as_array(vb.indices.indices, vb.indices.get_dtype()),
+    )
+
+
+def compare(a: np.ndarray, b: np.ndarray) -> TangentStats:
+    """
+    (N, 4) tangents. the angle between xyz and the w mismatches.
+    """
+    cos = np.einsum(
+        "ij,ij->i",
+        _normalize(a[:, :3].astype(np.float64)),
+        _normalize(b[:, :3].astype(np.float64)),
+    )
+    error = np.degrees(np.arccos(np.clip(cos, -1, 1)))
+    return TangentStats(
+        len(a),
+        float(error.mean()) if len(a) else 0.0,
+        float(error.max()) if len(a) else 0.0,
+        int(np.count_nonzero(np.sign(a[:, 3]) != np.sign(b[:, 3]))),
+    )
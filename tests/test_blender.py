@@ -0,0 +1,102 @@
+"""
+the bpy adapter. needs the bpy module (pip install bpy).
+"""
+
+import pytest
+
+bpy = pytest.importorskip("bpy")
+
+import bmesh
+import mathutils
+import numpy as np
+from .. import vertex
+from .. import vertex_buffer
+
+
+@pytest.fixture
+def skinned():
+    """
+    a grid skinned to a bone, and a shape key that moves it up.
+    """
+    bpy.ops.wm.read_factory_settings(use_empty=True)
+    collection = bpy.context.scene.collection
+    mesh = bpy.data.meshes.new("grid")
+    bm = bmesh.new()
+    bmesh.ops.create_grid(bm, x_segments=4, y_segments=4, size=1.0)
+    bm.to_mesh(mesh)
+    bm.free()
+    ob = bpy.data.objects.new("grid", mesh)
+    collection.objects.link(ob)
+
+    armature = bpy.data.armatures.new("armature")
+    armatureOb = bpy.data.objects.new("armature", armature)
+    collection.objects.link(armatureOb)
+    bpy.context.view_layer.objects.active = armatureOb
+    bpy.ops.object.mode_set(mode="EDIT")
+    bone = armature.edit_bones.new("bone")
+    bone.tail = (0, 0, 1)
+    bpy.ops.object.mode_set(mode="OBJECT")
+
+    group = ob.vertex_groups.new(name="bone")
+    group.add(list(range(len(mesh.vertices))), 1.0, "REPLACE")
+    modifier = ob.modifiers.new("Armature", "ARMATURE")
+    modifier.object = armatureOb
+    ob.shape_key_add(name="Basis")
+    up = ob.shape_key_add(name="up")
+    for point in up.data:
+        point.co.z += 0.5
+    up.value = 1.0
+    return ob, armatureOb
+
+
+def _positions(ob, use_mesh_modifiers: bool) -> np.ndarray:
+    vb = next(
+        vertex.iter_objects(
+            [ob], mathutils.Matrix(), use_mesh_modifiers=use_mesh_modifiers
+        )
+    )
+    return vertex_buffer.as_array(vb.geometry, vertex_buffer.GEOMETRY_DTYPE)[
+        "position"
+    ].copy()
+
+
+def test_modifiers_keep_the_rest_pose(skinned):
+    ob, armatureOb = skinned
+    rest = _positions(ob, False)
+    assert np.abs(rest[:, 2]).max() == 0
+
+    pose_bone = armatureOb.pose.bones["bone"]
+    pose_bone.rotation_mode = "XYZ"
+    pose_bone.rotation_euler = (0.7, 0, 0)
+    bpy.context.view_layer.update()
+
+    np.testing.assert_allclose(_positions(ob, True), rest, atol=1e-6)
+    # restored
+    assert ob.modifiers["Armature"].show_viewport
+    assert not ob.show_only_shape_key
+
+
+@pytest.mark.parametrize("use_smooth", [True, False])
+def test_foreach_get_matches_per_loop(use_smooth):
+    bpy.ops.wm.read_factory_settings(use_empty=True)
+    bpy.ops.mesh.primitive_uv_sphere_add(segments=12, ring_count=6)
+    ob = bpy.context.active_object
+    for polygon in ob.data.polygons:
+        polygon.use_smooth = use_smooth
+
+    def extract(use_foreach_get: bool):
+        mesh = ob.to_mesh()
+        try:
+            vb = vertex.from_mesh(
+                mathutils.Matrix(), ob, mesh, use_foreach_get=use_foreach_get
+            )
+            return (
+                bytes(vb.geometry),
+                bytes(vb.colortex),
+                bytes(vb.indices.indices),
+                vb.submeshes,
+            )
+        finally:
+            ob.to_mesh_clear()
+
+    assert extract(True) == extract(False)
@@ -0,0 +1,157 @@
+"""
+synthetic meshes => process_mesh => serialize => reader.Reader.
+"""
+
+import pathlib
+from typing import List
+import numpy as np
+import pytest
+from .. import vertex_buffer
+from .. import synthetic
+from .. import mesh_source
+from .. import morph
+from .. import process
+from .. import quantize
+from .. import serialization
+from .. import reader
+
+QUANTIZATIONS = {"float": None, "half": quantize.HALF, "quantized": quantize.QUANTIZED}
+# of the positions and uvs in the unit box
+TOLERANCE = {"float": 1e-6, "half": 2e-3, "quantized": 2e-3}
+# the morph deltas are snorm16 of the largest delta
+MORPH_TOLERANCE = 1e-4
+
+
+def skinned_tube() -> mesh_source.MeshSource:
+    """
+    a tube of 4 bones and a morph target that bulges the upper half.
+    """
+    source = synthetic.tube(12, 16, radius=0.2)
+    positions = source.positions[source.loop_vertex]
+    upper = np.where(positions[:, 1:2] > 0.5, 1.0, 0.0)
+    delta = (positions * [1, 0, 1] * upper).astype(np.float32)
+    target = morph.sparse_target("bulge", delta, np.zeros_like(delta))
+    return source._replace(morphs=[target])
+
+
+def process_source(
+    source: mesh_source.MeshSource, options: process.ProcessOptions
+) -> vertex_buffer.VertexBuffer:
+    vb = mesh_source.to_vertex_buffer(source, influences=options.influences)
+    return process.process_mesh(vb, options)
+
+
+def write_read(
+    tmp_path: pathlib.Path, meshes: List[vertex_buffer.VertexBuffer], **kw
+) -> reader.Reader:
+    dst = tmp_path / "roundtrip.lbsm"
+    serialization.serialize(dst, meshes, **kw)
+    return reader.Reader(dst)
+
+
+def draw_positions(positions: np.ndarray, indices: np.ndarray) -> np.ndarray:
+    """
+    the positions of the triangle corners in draw order.
+    """
+    return positions[indices.astype(np.int64)].reshape(-1, 3, 3)
+
+
+@pytest.mark.parametrize("compression", [None, "zlib", "lzma"])
+@pytest.mark.parametrize("quantization", list(QUANTIZATIONS))
+def test_roundtrip(tmp_path, quantization, compression):
+    options = process.ProcessOptions(use_weld=True, lod_levels=2, lod_max_error=1.0)
+    vb = process_source(skinned_tube(), options)
+    assert vb.lods
+
+    tolerance = TOLERANCE[quantization]
+    r = write_read(
+        tmp_path,
+        [vb],
+        quantization=QUANTIZATIONS[quantization],
+        compression=compression,
+    )
+    try:
+        mesh = r.root["meshes"][0]
+        assert mesh["vertexCount"] == vb.vertex_count
+
+        geometry = vertex_buffer.as_array(vb.geometry, vertex_buffer.GEOMETRY_DTYPE)
+        positions = r.decode(mesh, "position")[:, :3]
+        np.testing.assert_allclose(positions, geometry["position"], atol=tolerance)
+        colortex = vertex_buffer.as_array(vb.colortex, vertex_buffer.COLORTEX_DTYPE)
+        np.testing.assert_allclose(
+            r.decode(mesh, "tex0"), colortex["tex0"], atol=tolerance
+        )
+
+        indices = vertex_buffer.as_array(vb.indices.indices, vb.indices.get_dtype())
+        np.testing.assert_array_equal(r.indices(mesh), indices)
+        for level, lod in enumerate(vb.lods, 1):
+            np.testing.assert_array_equal(
+                r.indices(mesh, level),
+                vertex_buffer.as_array(lod.indices.indices, lod.indices.get_dtype()),
+            )
+
+        # the joint of each influence by name
+        skin = vertex_buffer.as_array(vb.skinning.skinning, vb.skinning.get_dtype())
+        names = np.array([b["name"] for b in r.root["bones"]])
+        heavy = skin["weights"] > 0.01
+        np.testing.assert_array_equal(
+            names[r.vertex_bones(mesh)][heavy],
+            np.array([j.name for j in vb.skinning.joints])[skin["joints"]][heavy],
+        )
+        np.testing.assert_allclose(
+            r.decode(mesh, "blendWeights"), skin["weights"], atol=1 / 255
+        )
+
+        (target,) = vb.morphs
+        target_indices, deltas = morph.get_arrays(target)
+        assert mesh["morphTargets"][0]["name"] == "bulge"
+        np.testing.assert_array_equal(r.morph_target(mesh, 0)[0], target_indices)
+        np.testing.assert_allclose(
+            r.morph_target(mesh, 0)[1]["position"],
+            deltas["position"],
+            atol=MORPH_TOLERANCE,
+        )
+    finally:
+        r.close()
+
+
+@pytest.mark.parametrize("quantization", list(QUANTIZATIONS))
+def test_roundtrip_keeps_the_triangles(tmp_path, quantization):
+    """
+    weld and optimize reorder the vertices and the triangles, not the surface.
+    """
+    source = synthetic.grid(8, 6, materials=2)
+    options = process.ProcessOptions(use_weld=True, use_optimize_indices=True)
+    vb = process_source(source, options)
+    assert vb.vertex_count < source.get_corner_count()
+
+    r = write_read(tmp_path, [vb], quantization=QUANTIZATIONS[quantization])
+    try:
+        mesh = r.root["meshes"][0]
+        positions = r.decode(mesh, "position")[:, :3]
+        expected = source.positions[source.loop_vertex][source.triangles]
+        for i, material in enumerate(source.materials):
+            submesh = mesh["subMeshes"][i]
+            assert r.root["materials"][submesh["material"]]["name"] == material
+            actual = draw_positions(positions, r.submesh_indices(mesh, i))
+            # the same triangles in any order, from any first corner
+            ranges = expected[source.triangle_materials == i]
+            assert len(actual) == len(ranges)
+            np.testing.assert_allclose(
+                _canonical(actual), _canonical(ranges), atol=TOLERANCE[quantization]
+            )
+    finally:
+        r.close()
+
+
+def _canonical(triangles: np.ndarray) -> np.ndarray:
+    """
+    (N, 3, 3) => sorted by the rounded centroid, each rotated to its lowest corner.
+    """
+    rounded = np.round(triangles, 2)
+    first = np.lexsort(rounded.transpose(2, 0, 1)[::-1])[:, 0]
+    rotated = triangles[
+        np.arange(len(triangles))[:, None], (first[:, None] + np.arange(3)) % 3
+    ]
+    centroid = np.round(rotated.mean(axis=1), 3)
+    return rotated[np.lexsort(centroid.T[::-1])]
@@ -1,247 +1,944 @@
 import ctypes
 import pathlib
-from typing import Optional, Tuple, List, NamedTuple, Dict
+import hashlib
+from typing import (
+    Optional,
+    Tuple,
+    List,
+    NamedTuple,
+    Dict,
+    Iterable,
+    Iterator,
+    Hashable,
+    Callable,
+)
 import bpy
 import mathutils
+import numpy as np
+from .vertex_buffer import (
+    Float2,
+    Float3,
+    VertexGeometry,
+    VertexColorTex,
+    GEOMETRY_DTYPE,
+    COLORTEX_DTYPE,
+    as_array,
+    Joint,
+    VertexBuffer,
+    Instance,
+    MorphTarget,
+)
+from . import process
+from . import tangent
+from . import skeleton
+from . import morph
+from . import profiling
+from . import pipeline
+from .cache import MeshCache, FORMAT_VERSION
+from .mesh_source import MeshSource, MeshWeights, to_vertex_buffer
 
 
 def to_tuple(v: mathutils.Vector):
     return (v.x, v.y, v.z)
 
 
-class Float2(ctypes.Structure):
-    _fields_ = [
-        ("x", ctypes.c_float),
-        ("y", ctypes.c_float),
-    ]
+def to_row_major(m: mathutils.Matrix) -> Tuple[float, ...]:
+    return tuple(x for row in m for x in row)
 
-    def __str__(self) -> str:
-        return f"({self.x},{self.y})"
 
-    @staticmethod
-    def from_vector(v: mathutils.Vector) -> "Float2":
-        return Float2(v.x, v.y)
-
-
-class Float3(ctypes.Structure):
-    _fields_ = [
-        ("x", ctypes.c_float),
-        ("y", ctypes.c_float),
-        ("z", ctypes.c_float),
-    ]
-
-    def __str__(self) -> str:
-        return f"({self.x},{self.y},{self.z})"
+def get_armature(ob: bpy.types.Object) -> Optional[bpy.types.Object]:
+    for m in ob.modifiers:
+        if m.type == "ARMATURE":
+            return m.object
 
-    @staticmethod
-    def from_vector(v: mathutils.Vector) -> "Float3":
-        return Float3(v.x, v.y, v.z)
 
+def _foreach_get(collection, attr: str, dtype, size: int) -> np.ndarray:
+    data = np.empty(size, dtype)
+    collection.foreach_get(attr, data)
+    return data
 
-class Float4(ctypes.Structure):
-    _fields_ = [
-        ("x", ctypes.c_float),
-        ("y", ctypes.c_float),
-        ("z", ctypes.c_float),
-        ("w", ctypes.c_float),
-    ]
 
+def _fill_per_loop(
+    mesh: bpy.types.Mesh,
+    uv_layer: Optional[bpy.types.MeshUVLoopLayer],
+    geometry,
+    colortex,
+    indices,
+):
+    i = 0
+    for tri in mesh.loop_triangles:
+        for loop_index in tri.loops:
+            dst_geom = geometry[loop_index]
+            dst_tex = colortex[loop_index]
+            v = mesh.vertices[mesh.loops[loop_index].vertex_index]
 
-class VertexGeometry(ctypes.Structure):
-    _fields_ = [
-        ("position", Float3),
-        ("normal", Float3),
-        ("tangent", Float4),
-    ]
+            # geom
+            dst_geom.position = Float3.from_vector(v.co)
+            if tri.use_smooth:
+                dst_geom.normal = Float3.from_vector(v.normal)
+            else:
+                dst_geom.normal = Float3.from_vector(tri.normal)
 
+            # color tex
+            if uv_layer:
+                dst_tex.tex0 = Float2.from_vector(uv_layer.data[loop_index].uv)
 
-class VertexColorTex(ctypes.Structure):
-    _fields_ = [
-        ("color", Float4),
-        ("tex0", Float2),
-        ("tex1", Float2),
-    ]
+            indices[i] = loop_index
+            i += 1
 
 
-class VertexSkin(ctypes.Structure):
-    _fields_ = [
-        ("weights", (ctypes.c_float * 4)),
-        ("joints", (ctypes.c_ushort * 4)),
-    ]
+def _per_loop_base(
+    mesh: bpy.types.Mesh,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    _fill_per_loop as the base of mesh_source.to_vertex_buffer.
+    the mesh is triangulated.
+    """
+    uv_layer = mesh.uv_layers and mesh.uv_layers[0]
+    if not isinstance(uv_layer, bpy.types.MeshUVLoopLayer):
+        uv_layer = None
+    geometry = (VertexGeometry * len(mesh.loops))()
+    colortex = (VertexColorTex * len(mesh.loops))()
+    indices = (ctypes.c_uint * (len(mesh.loop_triangles) * 3))()
+    _fill_per_loop(mesh, uv_layer, geometry, colortex, indices)
+    return (
+        as_array(geometry, GEOMETRY_DTYPE),
+        as_array(colortex, COLORTEX_DTYPE),
+        as_array(indices, np.dtype(np.uint32)),
+    )
 
 
-def get_armature(ob: bpy.types.Object) -> Optional[bpy.types.Object]:
-    for m in ob.modifiers:
-        if m.type == "ARMATURE":
-            return m.object
+def _calc_tangents(
+    mesh: bpy.types.Mesh, uv_layer: bpy.types.MeshUVLoopLayer
+) -> Optional[np.ndarray]:
+    """
+    Mesh.calc_tangents (MikkTSpace) as (loops, 4). None if the mesh has ngons.
+    """
+    try:
+        mesh.calc_tangents(uvmap=uv_layer.name)
+    except RuntimeError as e:
+        print(f"{mesh.name}: {e}")
+        return None
+    loop_count = len(mesh.loops)
+    result = np.empty((loop_count, 4), np.float32)
+    result[:, :3] = _foreach_get(
+        mesh.loops, "tangent", np.float32, loop_count * 3
+    ).reshape(-1, 3)
+    result[:, 3] = _foreach_get(mesh.loops, "bitangent_sign", np.float32, loop_count)
+    mesh.free_tangents()
+    return result
+
+
+def _shape_key_morphs(
+    ob: bpy.types.Object,
+    mesh: bpy.types.Mesh,
+    mat: mathutils.Matrix,
+    uv: Optional[np.ndarray],
+    epsilon: float,
+) -> Optional[List[MorphTarget]]:
+    """
+    the shape keys of ob.data as sparse morph targets of the loops of mesh.
+    the key blocks are read by foreach_get one at a time, and the normals and
+    the tangents (if uv) of the shape are computed in bulk for the deltas.
+    None if the modifiers changed the vertex count.
+    """
+    key = ob.data.shape_keys if isinstance(ob.data, bpy.types.Mesh) else None
+    if not key or len(key.key_blocks) < 2:
+        return None
+    vertex_count = len(mesh.vertices)
+    if len(ob.data.vertices) != vertex_count:
+        print(f"{ob.name}: the shape keys are skipped. the vertex count is changed")
+        return None
+
+    loop_count = len(mesh.loops)
+    tri_count = len(mesh.loop_triangles)
+    loop_vertex = _foreach_get(mesh.loops, "vertex_index", np.int32, loop_count)
+    triangles = _foreach_get(
+        mesh.loop_triangles, "loops", np.uint32, tri_count * 3
+    ).reshape(-1, 3)
+    use_smooth = _foreach_get(mesh.loop_triangles, "use_smooth", bool, tri_count)
+    base = _foreach_get(mesh.vertices, "co", np.float32, vertex_count * 3).reshape(
+        -1, 3
+    )
+    linear = np.array(mat.to_3x3(), np.float32)
+
+    def shape(positions: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        normals = morph.loop_normals(positions, loop_vertex, triangles, use_smooth)
+        tangents = None
+        if uv is not None:
+            tangents = tangent.compute_tangents(
+                positions[loop_vertex], normals, uv, triangles
+            )[:, :3]
+        return normals, tangents
+
+    base_normals, base_tangents = shape(base)
+    coords: Dict[str, np.ndarray] = {}
+
+    def get_co(block: bpy.types.ShapeKey) -> np.ndarray:
+        # the relative keys are usually the same Basis
+        if block.name not in coords:
+            coords[block.name] = _foreach_get(
+                block.data, "co", np.float32, vertex_count * 3
+            ).reshape(-1, 3)
+        return coords[block.name]
+
+    morphs = []
+    for block in key.key_blocks[1:]:
+        delta = (get_co(block) - get_co(block.relative_key)) @ linear.T
+        coords.pop(block.name)
+        if not (np.abs(delta) > epsilon).any():
+            continue
+        normals, tangents = shape(base + delta)
+        target = morph.sparse_target(
+            block.name,
+            delta[loop_vertex],
+            normals - base_normals,
+            tangents - base_tangents if uv is not None else None,
+            epsilon,
+        )
+        if target:
+            morphs.append(target)
+    return morphs or None
+
+
+VertexGroupWeights = Tuple[np.ndarray, np.ndarray, np.ndarray]
+
+
+def _vertex_group_weights(mesh: bpy.types.Mesh) -> VertexGroupWeights:
+    """
+    all vertex group weights as (vertices, groups, weights).
+    vertex groups has no foreach_get. once per vertex, not per loop.
+    read once by snapshot_object for mesh_digest and mesh_source.
+    """
+    vertices = []
+    groups = []
+    weights = []
+    for v in mesh.vertices:
+        index = v.index
+        for vg in v.groups:
+            vertices.append(index)
+            groups.append(vg.group)
+            weights.append(vg.weight)
+    return (
+        np.array(vertices, np.int64),
+        np.array(groups, np.int64),
+        np.array(weights, np.float32),
+    )
 
 
-class Joint(NamedTuple):
-    name: str
-    position: Tuple[float, float, float]
-    is_connected: bool
-    parent: Optional[str]  # armature bone name is unique
+def get_joint_names(
+    ob: bpy.types.Object, armature: bpy.types.Armature
+) -> Tuple[List[str], np.ndarray]:
+    """
+    the vertex groups of the bones, and their ancestors for the hierarchy.
+    returns (joint names, vertex group index => joint index or -1)
+    """
+    names: List[str] = []
+    group_to_joint = np.full(len(ob.vertex_groups), -1, np.int64)
+    for g in ob.vertex_groups:
+        if g.name in armature.bones:
+            group_to_joint[g.index] = len(names)
+            names.append(g.name)
+    for name in list(names):
+        bone = armature.bones[name].parent
+        while bone and bone.name not in names:
+            names.append(bone.name)
+            bone = bone.parent
+    return names, group_to_joint
+
+
+def _mesh_weights(
+    matrix: mathutils.Matrix,
+    ob: bpy.types.Object,
+    mesh: bpy.types.Mesh,
+    armatureOb: bpy.types.Object,
+    vertex_weights: Optional[VertexGroupWeights] = None,
+) -> MeshWeights:
+    armature = armatureOb.data
+    jointNames, group_to_joint = get_joint_names(ob, armature)
+    if vertex_weights is None:
+        vertex_weights = _vertex_group_weights(mesh)
+    vertices, groups, weights = vertex_weights
+    mat = matrix @ armatureOb.matrix_world
+
+    def create_joint(name: str):
+        position = (0, 0, 0)
+        bone = armature.bones[name]
+        if bone:
+            head_local = mat @ bone.head_local
+            position = to_tuple(head_local)
+
+        parent = None
+        if bone.parent:
+            parent = bone.parent.name
+
+        rotations, scales = skeleton.decompose(
+            [np.array((mat @ bone.matrix_local).to_3x3())]
+        )
+        return Joint(
+            name=name,
+            position=position,
+            is_connected=bone.use_connect,
+            parent=parent,
+            rotation=tuple(float(x) for x in rotations[0]),
+            scale=tuple(float(x) for x in scales[0]),
+        )
 
+    return MeshWeights(
+        vertices,
+        groups,
+        weights,
+        group_to_joint,
+        [create_joint(name) for name in jointNames],
+    )
 
-class Skinning(NamedTuple):
-    joints: List[Joint]
-    skinning: memoryview
 
+def mesh_source(
+    matrix: mathutils.Matrix,
+    ob: bpy.types.Object,
+    mesh: bpy.types.Mesh,
+    *,
+    local=False,
+    tangents="compute",
+    use_morphs=True,
+    morph_epsilon=1e-5,
+    vertex_weights: Optional[VertexGroupWeights] = None,
+    profiler: Optional[profiling.Profiler] = None,
+) -> MeshSource:
+    """
+    the bpy adapter. mesh is transformed and triangulated in place.
+    tangents="blender" reads Mesh.calc_tangents to MeshSource.tangents.
+    vertex_weights: _vertex_group_weights of mesh, if already read.
+    the other arguments are those of from_mesh.
+    """
+    mat = matrix if local else matrix @ ob.matrix_world
+    with profiling.phase(profiler, "transform", ob.name):
+        mesh.transform(mat)
+        if mat.is_negative:
+            mesh.flip_normals()
+    with profiling.phase(profiler, "triangulate", ob.name):
+        mesh.calc_loop_triangles()
+
+    with profiling.phase(profiler, "read", ob.name):
+        loop_count = len(mesh.loops)
+        tri_count = len(mesh.loop_triangles)
+        vertex_count = len(mesh.vertices)
+
+        get = _foreach_get
+
+        uv_layer = mesh.uv_layers and mesh.uv_layers[0]
+        if not isinstance(uv_layer, bpy.types.MeshUVLoopLayer):
+            uv_layer = None
+
+        materials = None
+        tri_material = None
+        if ob.material_slots:
+            materials = [
+                slot.material.name if slot.material else None
+                for slot in ob.material_slots
+            ]
+            tri_material = get(
+                mesh.loop_triangles, "material_index", np.int32, tri_count
+            )
 
-class Indices(NamedTuple):
-    stride: int  # 2 or 4
-    indices: memoryview
+        source = MeshSource(
+            name=ob.name,
+            positions=get(mesh.vertices, "co", np.float32, vertex_count * 3).reshape(
+                -1, 3
+            ),
+            vertex_normals=get(
+                mesh.vertices, "normal", np.float32, vertex_count * 3
+            ).reshape(-1, 3),
+            loop_vertex=get(mesh.loops, "vertex_index", np.int32, loop_count),
+            triangles=get(
+                mesh.loop_triangles, "loops", np.uint32, tri_count * 3
+            ).reshape(-1, 3),
+            triangle_normals=get(
+                mesh.loop_triangles, "normal", np.float32, tri_count * 3
+            ).reshape(-1, 3),
+            use_smooth=get(mesh.loop_triangles, "use_smooth", bool, tri_count),
+            uv=(
+                get(uv_layer.data, "uv", np.float32, loop_count * 2).reshape(-1, 2)
+                if uv_layer
+                else None
+            ),
+            triangle_materials=tri_material,
+            materials=materials,
+        )
 
-    def get_draw_count(self) -> int:
-        return len(self.indices.tobytes()) // self.stride
+    if uv_layer and tangents == "blender":
+        with profiling.phase(profiler, "tangents", ob.name):
+            source = source._replace(tangents=_calc_tangents(mesh, uv_layer))
+
+    if use_morphs:
+        with profiling.phase(profiler, "morphs", ob.name):
+            source = source._replace(
+                morphs=_shape_key_morphs(
+                    ob,
+                    mesh,
+                    mat,
+                    source.uv if tangents != "none" else None,
+                    morph_epsilon,
+                )
+            )
 
+    armatureOb = get_armature(ob)
+    if armatureOb:
+        with profiling.phase(profiler, "weights", ob.name):
+            source = source._replace(
+                weights=_mesh_weights(matrix, ob, mesh, armatureOb, vertex_weights)
+            )
 
-class VertexBuffer(NamedTuple):
-    indices: Indices
-    vertex_count: int
-    geometry: memoryview
-    colortex: memoryview
-    skinning: Optional[Skinning]
+    return source
 
 
 def from_mesh(
     matrix: mathutils.Matrix,
     ob: bpy.types.Object,
     mesh: bpy.types.Mesh,
+    *,
+    use_foreach_get=True,
+    local=False,
+    influences=4,
+    weight_threshold=0.0,
+    tangents="compute",
+    validate_tangents=False,
+    use_morphs=True,
+    morph_epsilon=1e-5,
+    profiler: Optional[profiling.Profiler] = None,
 ) -> VertexBuffer:
-    mat = matrix @ ob.matrix_world
-    mesh.transform(mat)
-    if mat.is_negative:
-        mesh.flip_normals()
-    mesh.calc_loop_triangles()
+    """
+    mesh_source => mesh_source.to_vertex_buffer.
 
-    geometry = (VertexGeometry * len(mesh.loops))()
-    colortex = (VertexColorTex * len(mesh.loops))()
-    indexCount = len(mesh.loop_triangles) * 3
-    if len(geometry) > 65535:
-        index_stride = 4
-        indices = (ctypes.c_uint * indexCount)()
-    else:
-        index_stride = 2
-        indices = (ctypes.c_ushort * indexCount)()
+    use_foreach_get=False fills the vertices and the indices by the per loop
+    python implementation. slow, but kept for comparison.
 
-    i = 0
-    uv_layer = mesh.uv_layers and mesh.uv_layers[0]
+    local=True does not apply ob.matrix_world. for instancing.
 
-    skinWeights = None
-    armatureOb = get_armature(ob)
-    armature = None
-    if armatureOb:
-        armature = armatureOb.data
-        skinWeights = (VertexSkin * len(mesh.loops))()
-        jointNames = [g.name for g in ob.vertex_groups]
+    influences and weight_threshold: skin.top_k
 
-    for tri in mesh.loop_triangles:
-        for loop_index in tri.loops:
-            dst_geom = geometry[loop_index]
-            dst_tex = colortex[loop_index]
-            v = mesh.vertices[mesh.loops[loop_index].vertex_index]
+    tangents: "none", "compute" (tangent.compute_tangents) or "blender"
+    (Mesh.calc_tangents). validate_tangents prints the difference of the two.
 
-            # geom
-            dst_geom.position = Float3.from_vector(v.co)
-            if tri.use_smooth:
-                dst_geom.normal = Float3.from_vector(v.normal)
-            else:
-                dst_geom.normal = Float3.from_vector(tri.normal)
+    use_morphs: the shape keys as sparse morph targets. morph_epsilon is the
+    smallest delta.
 
-            # color tex
-            if isinstance(uv_layer, bpy.types.MeshUVLoopLayer):
-                dst_tex.tex0 = Float2.from_vector(uv_layer.data[loop_index].uv)
+    profiler: the phases of the steps for ob.name.
+    """
+    source = mesh_source(
+        matrix,
+        ob,
+        mesh,
+        local=local,
+        tangents=tangents,
+        use_morphs=use_morphs,
+        morph_epsilon=morph_epsilon,
+        profiler=profiler,
+    )
+    vb = to_vertex_buffer(
+        source,
+        influences=influences,
+        weight_threshold=weight_threshold,
+        tangents=tangents != "none",
+        base=None if use_foreach_get else _per_loop_base(mesh),
+        profiler=profiler,
+    )
 
-            # skin
-            if skinWeights:
-                dst_skin = skinWeights[loop_index]
+    if validate_tangents and source.uv is not None:
+        blender = source.tangents
+        if blender is None:
+            blender = _calc_tangents(mesh, mesh.uv_layers[0])
+        _validate_tangents(ob.name, vb, blender)
 
-                def set_joint_weight(index: int, vg: bpy.types.VertexGroupElement):
-                    dst_skin.joints[index] = vg.group
-                    dst_skin.weights[index] = vg.weight
+    return vb
 
-                for j, vg in enumerate(v.groups[:4]):
-                    set_joint_weight(j, vg)
 
-            indices[i] = loop_index
-            i += 1
+def _validate_tangents(name: str, vb: VertexBuffer, blender: Optional[np.ndarray]):
+    if blender is None:
+        return
+    geometry = as_array(vb.geometry, GEOMETRY_DTYPE)
+    computed = tangent.compute_tangents(
+        geometry["position"],
+        geometry["normal"],
+        as_array(vb.colortex, COLORTEX_DTYPE)["tex0"],
+        as_array(vb.indices.indices, vb.indices.get_dtype()),
+    )
+    print(f"{name}: {tangent.compare(computed, blender)}")
 
-    skinning = None
-    if skinWeights:
-        mat = matrix @ armatureOb.matrix_world
-
-        def create_joint(name: str):
-            position = (0, 0, 0)
-            bone = armature.bones[name]
-            if bone:
-                head_local = mat @ bone.head_local
-                position = to_tuple(head_local)
-
-            parent = None
-            if bone.parent:
-                parent = bone.parent.name
-
-            return Joint(
-                name=name,
-                position=position,
-                is_connected=bone.use_connect,
-                parent=parent,
-            )
 
-        skinning = Skinning(
-            [create_joint(name) for name in jointNames],
-            memoryview(skinWeights),
+def mesh_digest(
+    matrix: mathutils.Matrix,
+    ob: bpy.types.Object,
+    mesh: bpy.types.Mesh,
+    *,
+    local=False,
+    options: Optional[process.ProcessOptions] = None,
+    vertex_weights: Optional[VertexGroupWeights] = None,
+) -> str:
+    """
+    the cache key. a hash of cache.FORMAT_VERSION, what from_mesh reads and
+    the options.
+    vertex_weights: _vertex_group_weights of mesh, if already read.
+    """
+    h = hashlib.blake2b(digest_size=20)
+    h.update(repr((FORMAT_VERSION, local, options)).encode("utf-8"))
+    mat = matrix if local else matrix @ ob.matrix_world
+    h.update(np.array(to_row_major(mat), np.float64).tobytes())
+
+    mesh.calc_loop_triangles()
+    vertex_count = len(mesh.vertices)
+    loop_count = len(mesh.loops)
+    tri_count = len(mesh.loop_triangles)
+    h.update(np.array([vertex_count, loop_count, tri_count], np.int64).tobytes())
+    h.update(_foreach_get(mesh.vertices, "co", np.float32, vertex_count * 3))
+    h.update(_foreach_get(mesh.vertices, "normal", np.float32, vertex_count * 3))
+    h.update(_foreach_get(mesh.loops, "vertex_index", np.int32, loop_count))
+    h.update(_foreach_get(mesh.loop_triangles, "loops", np.uint32, tri_count * 3))
+    h.update(_foreach_get(mesh.loop_triangles, "use_smooth", bool, tri_count))
+    if ob.material_slots:
+        h.update(
+            _foreach_get(mesh.loop_triangles, "material_index", np.int32, tri_count)
         )
+        h.update(
+            repr(
+                [
+                    slot.material.name if slot.material else None
+                    for slot in ob.material_slots
+                ]
+            ).encode("utf-8")
+        )
+    uv_layer = mesh.uv_layers and mesh.uv_layers[0]
+    if isinstance(uv_layer, bpy.types.MeshUVLoopLayer):
+        h.update(_foreach_get(uv_layer.data, "uv", np.float32, loop_count * 2))
+    key = ob.data.shape_keys if isinstance(ob.data, bpy.types.Mesh) else None
+    if key:
+        for block in key.key_blocks:
+            h.update(repr((block.name, block.relative_key.name)).encode("utf-8"))
+            h.update(_foreach_get(block.data, "co", np.float32, len(block.data) * 3))
 
-    return VertexBuffer(
-        Indices(index_stride, memoryview(indices)),
-        len(mesh.loops),
-        memoryview(geometry),
-        memoryview(colortex),
-        skinning,
-    )
+    armatureOb = get_armature(ob)
+    if armatureOb:
+        # the joints and the weights
+        h.update(
+            np.array(
+                to_row_major(matrix @ armatureOb.matrix_world), np.float64
+            ).tobytes()
+        )
+        bones = [
+            (
+                bone.name,
+                to_row_major(bone.matrix_local),
+                bone.parent.name if bone.parent else None,
+                bone.use_connect,
+            )
+            for bone in armatureOb.data.bones
+        ]
+        h.update(repr((bones, [g.name for g in ob.vertex_groups])).encode("utf-8"))
+        if vertex_weights is None:
+            vertex_weights = _vertex_group_weights(mesh)
+        for a in vertex_weights:
+            h.update(a.tobytes())
+
+    return h.hexdigest()
+
+
+def _rest_state(ob: bpy.types.Object) -> Callable[[], None]:
+    """
+    for the evaluated mesh. the armature modifiers off and the Basis shape key only,
+    the skinning and the morph targets are exported, not applied to the mesh.
+    returns the function that restores ob.
+    """
+    armatures = [m for m in ob.modifiers if m.type == "ARMATURE" and m.show_viewport]
+    for m in armatures:
+        m.show_viewport = False
+    key = ob.data.shape_keys if isinstance(ob.data, bpy.types.Mesh) else None
+    show_only_shape_key = ob.show_only_shape_key
+    active_shape_key_index = ob.active_shape_key_index
+    if key:
+        ob.show_only_shape_key = True
+        ob.active_shape_key_index = 0
+
+    def restore():
+        for m in armatures:
+            m.show_viewport = True
+        if key:
+            ob.show_only_shape_key = show_only_shape_key
+            ob.active_shape_key_index = active_shape_key_index
+
+    return restore
+
+
+class ObjectSnapshot(NamedTuple):
+    """
+    what snapshot_object read of an object. no bpy reference,
+    convert_snapshot may run on any thread.
+    """
 
+    name: str
+    source: Optional[MeshSource]  # None if cached
+    cached: Optional[VertexBuffer] = None
+    key: Optional[str] = None  # mesh_digest. to put the result in the cache
+    blender_tangents: Optional[np.ndarray] = None  # for validate_tangents
+    base: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]] = None  # _per_loop_base
 
-def from_object(
+
+def snapshot_object(
     ob: bpy.types.Object,
     matrix: mathutils.Matrix,
     *,
     use_mesh_modifiers=False,
-) -> Optional[VertexBuffer]:
+    use_foreach_get=True,
+    local=False,
+    options: Optional[process.ProcessOptions] = None,
+    cache: Optional[MeshCache] = None,
+    profiler: Optional[profiling.Profiler] = None,
+) -> Optional[ObjectSnapshot]:
+    """
+    the bpy part of from_object. main thread only.
+    None if ob has no mesh.
+    """
     if ob.mode == "EDIT":
         ob.update_from_editmode()
 
-    if use_mesh_modifiers:
-        # get the modifiers
-        depsgraph = bpy.context.evaluated_depsgraph_get()
-        mesh_owner = ob.evaluated_get(depsgraph)
-    else:
-        mesh_owner = ob
-
+    mesh_owner = ob
+    restore = _rest_state(ob) if use_mesh_modifiers else None
     # Object.to_mesh() is not guaranteed to return a mesh.
     try:
-        mesh = mesh_owner.to_mesh()
+        if use_mesh_modifiers:
+            # get the modifiers
+            with profiling.phase(profiler, "depsgraph", ob.name):
+                depsgraph = bpy.context.evaluated_depsgraph_get()
+                mesh_owner = ob.evaluated_get(depsgraph)
+
+        with profiling.phase(profiler, "to_mesh", ob.name):
+            mesh = mesh_owner.to_mesh()
         if not isinstance(mesh, bpy.types.Mesh):
             return
 
-        return from_mesh(matrix, ob, mesh)
+        # the python loop of the vertex groups once for the digest and the weights
+        vertex_weights = None
+        if cache and get_armature(ob):
+            with profiling.phase(profiler, "weights", ob.name):
+                vertex_weights = _vertex_group_weights(mesh)
+
+        key = None
+        if cache:
+            with profiling.phase(profiler, "cache", ob.name):
+                key = mesh_digest(
+                    matrix,
+                    ob,
+                    mesh,
+                    local=local,
+                    options=options,
+                    vertex_weights=vertex_weights,
+                )
+                vb = cache.get(key)
+            if vb is not None:
+                return ObjectSnapshot(ob.name, None, vb)
+
+        source = mesh_source(
+            matrix,
+            ob,
+            mesh,
+            local=local,
+            tangents=options.tangents if options else "compute",
+            use_morphs=options.use_morphs if options else True,
+            morph_epsilon=options.morph_epsilon if options else 1e-5,
+            vertex_weights=vertex_weights,
+            profiler=profiler,
+        )
+        blender_tangents = None
+        if options and options.validate_tangents and source.uv is not None:
+            blender_tangents = source.tangents
+            if blender_tangents is None:
+                blender_tangents = _calc_tangents(mesh, mesh.uv_layers[0])
+        return ObjectSnapshot(
+            ob.name,
+            source,
+            None,
+            key,
+            blender_tangents,
+            None if use_foreach_get else _per_loop_base(mesh),
+        )
 
     except RuntimeError:
         raise
     finally:
         mesh_owner.to_mesh_clear()
+        if restore:
+            restore()
+
+
+def convert_snapshot(
+    snapshot: ObjectSnapshot,
+    *,
+    options: Optional[process.ProcessOptions] = None,
+    profiler: Optional[profiling.Profiler] = None,
+) -> VertexBuffer:
+    """
+    the bpy independent part of from_object. mesh_source.to_vertex_buffer and
+    process.process_mesh. the cache is not updated.
+    """
+    if snapshot.cached is not None:
+        return snapshot.cached
+    vb = to_vertex_buffer(
+        snapshot.source,
+        influences=options.influences if options else 4,
+        weight_threshold=options.weight_threshold if options else 0.0,
+        tangents=options.tangents != "none" if options else True,
+        base=snapshot.base,
+        profiler=profiler,
+    )
+    _validate_tangents(snapshot.name, vb, snapshot.blender_tangents)
+    if options:
+        with profiling.phase(profiler, "process", snapshot.name):
+            vb = process.process_mesh(vb, options, profiler)
+    return vb
+
+
+def _put_cache(
+    snapshot: ObjectSnapshot,
+    vb: VertexBuffer,
+    cache: Optional[MeshCache],
+    profiler: Optional[profiling.Profiler],
+):
+    if cache and snapshot.key is not None:
+        with profiling.phase(profiler, "cache", snapshot.name):
+            cache.put(snapshot.key, vb)
+
+
+def from_object(
+    ob: bpy.types.Object,
+    matrix: mathutils.Matrix,
+    *,
+    use_mesh_modifiers=False,
+    use_foreach_get=True,
+    local=False,
+    options: Optional[process.ProcessOptions] = None,
+    cache: Optional[MeshCache] = None,
+    profiler: Optional[profiling.Profiler] = None,
+) -> Optional[VertexBuffer]:
+    """
+    snapshot_object => convert_snapshot.
+
+    options: process.process_mesh after the extraction.
+    cache: skip the extraction and the process if the mesh_digest is cached.
+    """
+    snapshot = snapshot_object(
+        ob,
+        matrix,
+        use_mesh_modifiers=use_mesh_modifiers,
+        use_foreach_get=use_foreach_get,
+        local=local,
+        options=options,
+        cache=cache,
+        profiler=profiler,
+    )
+    if snapshot is None:
+        return None
+    vb = convert_snapshot(snapshot, options=options, profiler=profiler)
+    _put_cache(snapshot, vb, cache, profiler)
+    return vb
+
+
+def _convert_snapshots(
+    snapshots: Iterable[ObjectSnapshot],
+    *,
+    options: Optional[process.ProcessOptions],
+    cache: Optional[MeshCache],
+    profiler: Optional[profiling.Profiler],
+    workers: int,
+) -> Iterator[VertexBuffer]:
+    """
+    convert_snapshot on workers threads, in the order of snapshots.
+    the snapshots are taken as the results are consumed (pipeline.imap_ordered).
+    """
+
+    def convert(snapshot: ObjectSnapshot) -> Tuple[ObjectSnapshot, VertexBuffer]:
+        # the thread of the object phase is the one that converts
+        with profiling.phase(profiler, "convert", snapshot.name):
+            return snapshot, convert_snapshot(
+                snapshot, options=options, profiler=profiler
+            )
+
+    for snapshot, vb in pipeline.imap_ordered(convert, snapshots, workers):
+        # MeshCache is not thread safe
+        _put_cache(snapshot, vb, cache, profiler)
+        yield vb
+
+
+def iter_objects(
+    objects: Iterable[bpy.types.Object],
+    matrix: mathutils.Matrix,
+    *,
+    use_mesh_modifiers=False,
+    options: Optional[process.ProcessOptions] = None,
+    cache: Optional[MeshCache] = None,
+    profiler: Optional[profiling.Profiler] = None,
+    workers: int = 0,
+) -> Iterator[VertexBuffer]:
+    """
+    convert the objects one by one, for serialization.Serializer to stream them.
+
+    workers: the objects are read (snapshot_object) on this thread while
+    the previous ones are converted on the threads. 0 is this thread only.
+    the order is the one of objects either way.
+
+    profiler: a "snapshot" phase and a "convert" phase for each.
+    """
+
+    def snapshots() -> Iterator[ObjectSnapshot]:
+        for ob in objects:
+            if isinstance(ob.data, bpy.types.Mesh):
+                with profiling.phase(profiler, "snapshot", ob.name):
+                    snapshot = snapshot_object(
+                        ob,
+                        matrix,
+                        use_mesh_modifiers=use_mesh_modifiers,
+                        options=options,
+                        cache=cache,
+                        profiler=profiler,
+                    )
+                if snapshot is not None:
+                    yield snapshot
+
+    return _convert_snapshots(
+        snapshots(), options=options, cache=cache, profiler=profiler, workers=workers
+    )
+
+
+def _modifier_state(ob: bpy.types.Object) -> Optional[Tuple]:
+    """
+    the settings of the enabled modifiers.
+    None if a modifier refers to an object (the result depends on its transform).
+    """
+    state = []
+    for m in ob.modifiers:
+        if not m.show_viewport:
+            continue
+        settings = []
+        for p in m.bl_rna.properties:
+            if p.identifier == "rna_type" or p.type == "COLLECTION":
+                continue
+            value = getattr(m, p.identifier)
+            if p.type == "POINTER":
+                if isinstance(value, bpy.types.Object):
+                    return None
+                value = value.as_pointer() if value else None
+            elif p.type == "ENUM" and p.is_enum_flag:
+                value = frozenset(value)
+            elif getattr(p, "is_array", False):
+                value = tuple(value)
+            settings.append((p.identifier, value))
+        state.append((m.type, tuple(settings)))
+    return tuple(state)
+
+
+def _object_materials(ob: bpy.types.Object) -> Tuple:
+    """
+    the materials of the slots linked to the object, not to the mesh.
+    """
+    return tuple(
+        (i, slot.material.name if slot.material else None)
+        for i, slot in enumerate(ob.material_slots)
+        if slot.link == "OBJECT"
+    )
+
+
+def instance_key(
+    ob: bpy.types.Object, *, use_mesh_modifiers=False
+) -> Optional[Hashable]:
+    """
+    the objects that have the same key share the exported mesh.
+    None is not shared. skinned meshes (the joints are per object) and
+    modifiers that refer to other objects.
+    the object linked material slots are a part of the key.
+    """
+    if get_armature(ob):
+        return None
+    materials = _object_materials(ob)
+    if not use_mesh_modifiers:
+        return (ob.data.as_pointer(), materials)
+    state = _modifier_state(ob)
+    if state is None:
+        return None
+    return (ob.data.as_pointer(), materials, state)
+
+
+def iter_instances(
+    objects: Iterable[bpy.types.Object],
+    matrix: mathutils.Matrix,
+    instances: List[Instance],
+    *,
+    use_mesh_modifiers=False,
+    options: Optional[process.ProcessOptions] = None,
+    cache: Optional[MeshCache] = None,
+    profiler: Optional[profiling.Profiler] = None,
+    workers: int = 0,
+) -> Iterator[VertexBuffer]:
+    """
+    instancing version of iter_objects.
+
+    a shared mesh is converted once in local space, and each object appends an
+    Instance of matrix @ ob.matrix_world @ matrix^-1 to instances.
+    the meshes that are not shared are baked in the export space as iter_objects,
+    with an identity Instance.
+
+    the instances are appended as the objects are read, ahead of the meshes
+    with workers.
+    """
+    identity = to_row_major(mathutils.Matrix.Identity(4))
+    inverse = matrix.inverted()
+
+    def snapshots() -> Iterator[ObjectSnapshot]:
+        mesh_map: Dict[Hashable, int] = {}
+        mesh_count = 0
+        for ob in objects:
+            if not isinstance(ob.data, bpy.types.Mesh):
+                continue
+
+            key = instance_key(ob, use_mesh_modifiers=use_mesh_modifiers)
+            if key is not None and key in mesh_map:
+                instances.append(
+                    Instance(
+                        mesh_map[key], to_row_major(matrix @ ob.matrix_world @ inverse)
+                    )
+                )
+                continue
+
+            with profiling.phase(profiler, "snapshot", ob.name):
+                snapshot = snapshot_object(
+                    ob,
+                    matrix,
+                    use_mesh_modifiers=use_mesh_modifiers,
+                    local=key is not None,
+                    options=options,
+                    cache=cache,
+                    profiler=profiler,
+                )
+            if not snapshot:
+                continue
+            if key is None:
+                instances.append(Instance(mesh_count, identity))
+            else:
+                mesh_map[key] = mesh_count
+                instances.append(
+                    Instance(
+                        mesh_count, to_row_major(matrix @ ob.matrix_world @ inverse)
+                    )
+                )
+            mesh_count += 1
+            yield snapshot
+
+    return _convert_snapshots(
+        snapshots(), options=options, cache=cache, profiler=profiler, workers=workers
+    )
 
 
 def export_objects(
     objects: List[bpy.types.Object], matrix: mathutils.Matrix
 ) -> List[VertexBuffer]:
-    meshes = []
-    for ob in objects:
-        if isinstance(ob.data, bpy.types.Mesh):
-            mesh = from_object(ob, matrix)
-            meshes.append(mesh)
-    return meshes
+    return list(iter_objects(objects, matrix))
 
 
 def export_glb(path: pathlib.Path, matrix: mathutils.Matrix) -> List[VertexBuffer]:
@@ -0,0 +1,202 @@
+import ctypes
+from typing import Optional, Tuple, List, NamedTuple, TYPE_CHECKING
+import numpy as np
+
+if TYPE_CHECKING:
+    import mathutils
+
+
+class Float2(ctypes.Structure):
+    _fields_ = [
+        ("x", ctypes.c_float),
+        ("y", ctypes.c_float),
+    ]
+
+    def __str__(self) -> str:
+        return f"({self.x},{self.y})"
+
+    @staticmethod
+    def from_vector(v: "mathutils.Vector") -> "Float2":
+        return Float2(v.x, v.y)
+
+
+class Float3(ctypes.Structure):
+    _fields_ = [
+        ("x", ctypes.c_float),
+        ("y", ctypes.c_float),
+        ("z", ctypes.c_float),
+    ]
+
+    def __str__(self) -> str:
+        return f"({self.x},{self.y},{self.z})"
+
+    @staticmethod
+    def from_vector(v: "mathutils.Vector") -> "Float3":
+        return Float3(v.x, v.y, v.z)
+
+
+class Float4(ctypes.Structure):
+    _fields_ = [
+        ("x", ctypes.c_float),
+        ("y", ctypes.c_float),
+        ("z", ctypes.c_float),
+        ("w", ctypes.c_float),
+    ]
+
+
+class VertexGeometry(ctypes.Structure):
+    _fields_ = [
+        ("position", Float3),
+        ("normal", Float3),
+        ("tangent", Float4),
+    ]
+
+
+class VertexColorTex(ctypes.Structure):
+    _fields_ = [
+        ("color", Float4),
+        ("tex0", Float2),
+        ("tex1", Float2),
+    ]
+
+
+class VertexSkin(ctypes.Structure):
+    _fields_ = [
+        ("weights", (ctypes.c_float * 4)),
+        ("joints", (ctypes.c_ushort * 4)),
+    ]
+
+
+# numpy views of the ctypes vertex layouts above
+GEOMETRY_DTYPE = np.dtype(
+    [
+        ("position", np.float32, 3),
+        ("normal", np.float32, 3),
+        ("tangent", np.float32, 4),
+    ]
+)
+COLORTEX_DTYPE = np.dtype(
+    [
+        ("color", np.float32, 4),
+        ("tex0", np.float32, 2),
+        ("tex1", np.float32, 2),
+    ]
+)
+
+
+def skin_dtype(influences: int) -> np.dtype:
+    return np.dtype(
+        [
+            ("weights", np.float32, influences),
+            ("joints", np.uint16, influences),
+        ]
+    )
+
+
+SKIN_DTYPE = skin_dtype(4)
+# the deltas of a morph target. tangent is xyz, the handedness does not change
+MORPH_DTYPE = np.dtype(
+    [
+        ("position", np.float32, 3),
+        ("normal", np.float32, 3),
+        ("tangent", np.float32, 3),
+    ]
+)
+assert GEOMETRY_DTYPE.itemsize == ctypes.sizeof(VertexGeometry)
+assert COLORTEX_DTYPE.itemsize == ctypes.sizeof(VertexColorTex)
+assert SKIN_DTYPE.itemsize == ctypes.sizeof(VertexSkin)
+
+
+def as_array(data, dtype: np.dtype) -> np.ndarray:
+    """
+    zero copy numpy view of a ctypes array or memoryview
+    """
+    return np.frombuffer(data, dtype)
+
+
+class Joint(NamedTuple):
+    name: str
+    position: Tuple[float, float, float]
+    is_connected: bool
+    parent: Optional[str]  # armature bone name is unique
+    # rest rotation xyzw in the export space. None is identity
+    rotation: Optional[Tuple[float, float, float, float]] = None
+    # rest scale. the mirror is the negative x. None is (1, 1, 1)
+    scale: Optional[Tuple[float, float, float]] = None
+
+
+class Skinning(NamedTuple):
+    joints: List[Joint]
+    skinning: memoryview
+    influences: int = 4  # joints per vertex. 4 is VertexSkin
+
+    def get_dtype(self) -> np.dtype:
+        return skin_dtype(self.influences)
+
+
+class MorphTarget(NamedTuple):
+    """
+    sparse. only the vertices that the shape changes.
+    """
+
+    name: str
+    indices: memoryview  # uint32 ascending vertex index
+    deltas: memoryview  # MORPH_DTYPE for each index
+
+
+class Indices(NamedTuple):
+    stride: int  # 2 or 4
+    indices: memoryview
+
+    def get_draw_count(self) -> int:
+        return len(self.indices.tobytes()) // self.stride
+
+    def get_dtype(self) -> np.dtype:
+        return np.dtype(np.uint32) if self.stride == 4 else np.dtype(np.uint16)
+
+
+class SubMesh(NamedTuple):
+    """
+    consecutive ranges of the index buffer.
+    when vertex_count is not None, the indices are relative to base_vertex.
+    when joints is not None, the blend indices of the range are into joints.
+    """
+
+    draw_count: int
+    material: int = 0
+    base_vertex: int = 0
+    vertex_count: Optional[int] = None
+    joints: Optional[List[int]] = None  # the palette. index of Skinning.joints
+
+
+class Lod(NamedTuple):
+    """
+    a coarser index buffer of the same vertices.
+    submeshes are those of VertexBuffer with the draw_count of this index buffer.
+    """
+
+    error: float  # the max distance from the surface. export space
+    indices: Indices
+    submeshes: Optional[List[SubMesh]] = None
+
+
+class VertexBuffer(NamedTuple):
+    indices: Indices
+    vertex_count: int
+    geometry: memoryview
+    colortex: memoryview
+    skinning: Optional[Skinning]
+    submeshes: Optional[List[SubMesh]] = None  # None is one SubMesh of material 0
+    # SubMesh.material => material name. None is the placeholder material
+    materials: Optional[List[Optional[str]]] = None
+    morphs: Optional[List[MorphTarget]] = None
+    lods: Optional[List[Lod]] = None  # from fine to coarse. lod.generate_lods
+
+
+class Instance(NamedTuple):
+    """
+    a placement of a shared mesh.
+    """
+
+    mesh: int  # index of the exported mesh
+    matrix: Tuple[float, ...]  # 4x4 row major. mesh space => export space
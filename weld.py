@@ -0,0 +1,172 @@
+from typing import List, Optional
+import numpy as np
+from . import vertex_buffer
+
+
+def _pack_rows(streams: List[np.ndarray]) -> np.ndarray:
+    """
+    concat the bytes of each vertex across the streams.
+    a stream is a structured array or (N, dimension).
+    padded to uint64 words.
+    """
+    count = len(streams[0])
+    byteLength = sum(s.dtype.itemsize * int(np.prod(s.shape[1:])) for s in streams)
+    rows = np.zeros((count, (byteLength + 7) // 8 * 8), np.uint8)
+    offset = 0
+    for s in streams:
+        size = s.dtype.itemsize * int(np.prod(s.shape[1:]))
+        rows[:, offset : offset + size] = s.view(np.uint8).reshape(count, size)
+        offset += size
+    return rows.view(np.uint64)
+
+
+def _hash_rows(words: np.ndarray) -> np.ndarray:
+    # FNV-1a like mix of the uint64 words of each row
+    h = np.full(len(words), 0xCBF29CE484222325, np.uint64)
+    for column in words.T:
+        h ^= column
+        h *= np.uint64(0x100000001B3)
+        h ^= h >> np.uint64(29)
+    return h
+
+
+def unique_rows(words: np.ndarray):
+    """
+    returns (group, representative)
+
+    group[i]: the group id of the row i.
+    representative[g]: the first row of the group g.
+    """
+    count = len(words)
+    if count == 0:
+        return np.zeros(0, np.int64), np.zeros(0, np.int64)
+
+    h = _hash_rows(words)
+    order = np.argsort(h, kind="stable")
+    sorted_hash = h[order]
+    head = np.empty(count, bool)
+    head[0] = True
+    np.not_equal(sorted_hash[1:], sorted_hash[:-1], out=head[1:])
+    run = np.cumsum(head) - 1
+    representative = order[head]
+
+    if not np.array_equal(words[order], words[representative[run]]):
+        # hash collision. exact but slower
+        keys = np.ascontiguousarray(words).view(
+            np.dtype((np.void, words.dtype.itemsize * words.shape[1]))
+        )
+        _, representative, group = np.unique(
+            keys.ravel(), return_index=True, return_inverse=True
+        )
+        return group.ravel(), representative
+
+    group = np.empty(count, np.int64)
+    group[order] = run
+    return group, representative
+
+
+def take_vertices(
+    vb: vertex_buffer.VertexBuffer,
+    src: np.ndarray,
+    indices: np.ndarray,
+    submeshes: Optional[List[vertex_buffer.SubMesh]] = None,
+) -> vertex_buffer.VertexBuffer:
+    """
+    new VertexBuffer that has the vertices src of vb and the indices.
+    the submeshes of vb are kept unless submeshes is given.
+    """
+    if submeshes is None:
+        submeshes = vb.submeshes
+    addressed = len(src)
+    if submeshes and all(s.vertex_count is not None for s in submeshes):
+        addressed = max(s.vertex_count for s in submeshes)
+    if addressed > 65535:
+        index_stride = 4
+        indices = indices.astype(np.uint32)
+    else:
+        index_stride = 2
+        indices = indices.astype(np.uint16)
+
+    from . import morph
+
+    skinning = None
+    if vb.skinning:
+        skin = vertex_buffer.as_array(vb.skinning.skinning, vb.skinning.get_dtype())
+        skinning = vb.skinning._replace(skinning=memoryview(skin[src]))
+
+    return vertex_buffer.VertexBuffer(
+        vertex_buffer.Indices(index_stride, memoryview(indices)),
+        len(src),
+        memoryview(
+            vertex_buffer.as_array(vb.geometry, vertex_buffer.GEOMETRY_DTYPE)[src]
+        ),
+        memoryview(
+            vertex_buffer.as_array(vb.colortex, vertex_buffer.COLORTEX_DTYPE)[src]
+        ),
+        skinning,
+        submeshes,
+        vb.materials,
+        morph.take_morphs(vb.morphs, src, vb.vertex_count),
+    )
+
+
+def vertex_rows(
+    vb: vertex_buffer.VertexBuffer, exact_morphs: bool = False
+) -> np.ndarray:
+    """
+    _pack_rows of all streams and the morph deltas of each vertex.
+    the deltas are a morph.morph_keys hash unless exact_morphs.
+    """
+    from . import morph
+
+    streams = [
+        vertex_buffer.as_array(vb.geometry, vertex_buffer.GEOMETRY_DTYPE),
+        vertex_buffer.as_array(vb.colortex, vertex_buffer.COLORTEX_DTYPE),
+    ]
+    if vb.skinning:
+        streams.append(
+            vertex_buffer.as_array(vb.skinning.skinning, vb.skinning.get_dtype())
+        )
+    if vb.morphs:
+        if exact_morphs:
+            streams.append(morph.morph_rows(vb.morphs, vb.vertex_count))
+        else:
+            streams.append(morph.morph_keys(vb.morphs, vb.vertex_count))
+    return _pack_rows(streams)
+
+
+def unique_vertices(vb: vertex_buffer.VertexBuffer):
+    """
+    unique_rows of vertex_rows. returns (group, representative)
+    """
+    from . import morph
+
+    group, representative = unique_rows(vertex_rows(vb))
+    if vb.morphs and not morph.same_deltas(
+        vb.morphs, vb.vertex_count, representative[group]
+    ):
+        # morph_keys collision. exact but slower
+        group, representative = unique_rows(vertex_rows(vb, exact_morphs=True))
+    return group, representative
+
+
+def weld_vertices(vb: vertex_buffer.VertexBuffer) -> vertex_buffer.VertexBuffer:
+    """
+    merge the vertices that have the same bytes in all streams,
+    and remap the index buffer.
+
+    unreferenced vertices are removed.
+    the vertices are ordered by first use in the index buffer.
+    the vertices that have different morph deltas are not merged.
+    """
+    if vb.submeshes and any(s.vertex_count is not None for s in vb.submeshes):
+        raise ValueError("split mesh")
+    group, representative = unique_vertices(vb)
+
+    indices = group[vertex_buffer.as_array(vb.indices.indices, vb.indices.get_dtype())]
+    used, first = np.unique(indices, return_index=True)
+    used = used[np.argsort(first)]
+    remap = np.empty(len(representative), np.int64)
+    remap[used] = np.arange(len(used))
+
+    return take_vertices(vb, representative[used], remap[indices])